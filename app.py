@@ -30,6 +30,18 @@ def create_app(config_name=None):
     db.init_app(app)
     jwt.init_app(app)
     
+    from notification_hub import init_notification_hub
+    init_notification_hub(app)
+    
+    from token_store import init_token_store
+    init_token_store(app)
+    
+    from passwords import init_passwords
+    init_passwords(app)
+    
+    from response_cache import init_response_cache
+    init_response_cache(app)
+    
     # Registrar rotas
     from routes import register_routes
     register_routes(app)
@@ -0,0 +1,52 @@
+"""
+Carregamento em lote de relacionamentos um-para-muitos.
+
+Os relacionamentos dos modelos são lazy: serializar uma lista de objetos que acessa
+obj.relacionamento faz uma consulta por objeto. Quando a consulta que trouxe os objetos
+é nossa, basta selectinload(Modelo.relacionamento). Para objetos que já estão em memória
+(consultas com várias entidades, get(), resultados de outras funções) load_related
+preenche o relacionamento de todos com uma consulta IN por bloco de chaves.
+"""
+
+from database import db
+from sqlalchemy import inspect
+from sqlalchemy.orm.attributes import set_committed_value
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def load_related(instances, relationship, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Carregar `relationship` (ex.: Question.alternatives) de todas as instâncias.
+    Instâncias com o relacionamento já carregado são ignoradas; retorna as instâncias.
+    """
+    prop = relationship.property
+    if not prop.uselist or prop.secondary is not None or len(prop.local_remote_pairs) != 1:
+        raise ValueError(f'Relacionamento não suportado para carregamento em lote: {relationship}')
+
+    (local_column, remote_column), = prop.local_remote_pairs
+    local_key = prop.parent.get_property_by_column(local_column).key
+    target = prop.mapper.class_
+    remote_attribute = getattr(target, prop.mapper.get_property_by_column(remote_column).key)
+
+    owners = {}
+    for instance in instances:
+        if relationship.key not in inspect(instance).dict:
+            owners.setdefault(getattr(instance, local_key), []).append(instance)
+    if not owners:
+        return instances
+
+    related = {key: [] for key in owners}
+    keys = [key for key in owners if key is not None]
+    order_by = prop.order_by or prop.mapper.primary_key
+    for start in range(0, len(keys), chunk_size):
+        items = db.session.query(target).filter(
+            remote_attribute.in_(keys[start:start + chunk_size])
+        ).order_by(*order_by).all()
+        for item in items:
+            related[getattr(item, remote_attribute.key)].append(item)
+
+    for key, key_owners in owners.items():
+        for owner in key_owners:
+            set_committed_value(owner, relationship.key, list(related[key]))
+    return instances
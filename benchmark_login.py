@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark do login no início da prova: uma turma inteira fazendo login ao mesmo tempo.
+Compara o hash na thread da requisição (PASSWORD_HASH_WORKERS=0) com o pool de processos
+e reporta logins/segundo e logins/segundo por núcleo.
+
+Uso: python benchmark_login.py [alunos] [requisicoes_simultaneas]
+Roda com a configuração de testes (SQLite em memória).
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from database import db
+from models import User
+from passwords import hash_password, init_passwords, shutdown_pool
+
+
+def run_burst(app, students, concurrency):
+    local = threading.local()
+
+    def login(index):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.post('/api/auth/login', json={
+            'email': f'aluno{index}@benchmark.com',
+            'password': 'senha-benchmark'
+        })
+        return response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        statuses = list(executor.map(login, range(students)))
+    elapsed = time.perf_counter() - started
+    return statuses.count(200), elapsed
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    cores = os.cpu_count() or 1
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        # Um hash para todos: o custo medido é o da verificação no login
+        password_hash = hash_password('senha-benchmark')
+        db.session.add_all([
+            User(email=f'aluno{i}@benchmark.com', password_hash=password_hash, name=f'Aluno {i}', role='student')
+            for i in range(students)
+        ])
+        db.session.commit()
+
+    print(f"🔐 {students} logins simultâneos ({concurrency} por vez), {cores} núcleo(s), "
+          f"método {app.config['PASSWORD_HASH_METHOD']}")
+    for workers in (0, cores):
+        app.config['PASSWORD_HASH_WORKERS'] = workers
+        init_passwords(app)
+        if workers:
+            run_burst(app, min(students, workers), workers)  # Aquecer os processos do pool
+
+        succeeded, elapsed = run_burst(app, students, concurrency)
+        shutdown_pool()
+        rate = succeeded / elapsed
+        mode = 'thread da requisição' if not workers else f'pool de {workers} processo(s)'
+        print(f"   - {mode}: {succeeded}/{students} em {elapsed:.2f}s | "
+              f"{rate:.1f} logins/s | {rate / cores:.1f} logins/s por núcleo")
+        if succeeded != students:
+            print("❌ Logins falharam")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
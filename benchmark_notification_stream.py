@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark do push de notificações: memória por conexão ociosa de long-poll e
+latência até o assinante ser acordado após o commit de uma notificação.
+
+Uso: python benchmark_notification_stream.py [conexoes]
+Roda com a configuração de testes (SQLite em memória, processo único).
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from database import db
+from flask_jwt_extended import create_access_token
+from models import User
+from notification_hub import hub
+
+
+def rss_kb():
+    """Memória residente do processo (Linux)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    app = create_app('testing')
+    app.config['NOTIFICATION_STREAM_MAX_CONNECTIONS'] = connections
+    app.config['NOTIFICATION_LONG_POLL_SECONDS'] = 60
+    hub.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@exemplo.com', password_hash='-', name='Benchmark', role='student')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        token = create_access_token(identity=user_id, expires_delta=False)
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    responses = []
+
+    def poll():
+        response = client.get('/api/notifications/poll', headers=headers)
+        responses.append((response.status_code, time.perf_counter()))
+
+    print(f"🔌 Abrindo {connections} conexões de long-poll ociosas...")
+    tracemalloc.start()
+    rss_before = rss_kb()
+    traced_before = tracemalloc.get_traced_memory()[0]
+
+    threads = [threading.Thread(target=poll, daemon=True) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    while hub.connections < connections:
+        time.sleep(0.05)
+
+    rss_after = rss_kb()
+    traced_after = tracemalloc.get_traced_memory()[0]
+    print(f"   - Conexões ativas: {hub.connections}")
+    print(f"   - RSS: +{rss_after - rss_before} KB ({(rss_after - rss_before) / connections:.1f} KB/conexão)")
+    print(f"   - Heap Python: +{(traced_after - traced_before) / 1024:.0f} KB "
+          f"({(traced_after - traced_before) / connections / 1024:.1f} KB/conexão)")
+
+    print("📨 Criando notificação e medindo a entrega...")
+    from routes import create_notification
+    with app.app_context():
+        started = time.perf_counter()
+        create_notification(user_id, 'benchmark', 'Benchmark', 'Notificação de teste')
+
+    for thread in threads:
+        thread.join(timeout=10)
+    tracemalloc.stop()
+
+    delivered = [finished for status, finished in responses if status == 200]
+    if delivered:
+        latencies = sorted((finished - started) * 1000 for finished in delivered)
+        print(f"   - Entregues: {len(delivered)}/{connections}")
+        print(f"   - Latência p50: {latencies[len(latencies) // 2]:.1f} ms | máx: {latencies[-1]:.1f} ms")
+    else:
+        print("❌ Nenhuma conexão recebeu a notificação")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
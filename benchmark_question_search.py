@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark da busca no banco de questões (/api/questions/search) com um banco grande.
+Reporta a latência p50/p95 por tipo de busca (termos, termos + filtros, próxima página).
+
+Uso: python benchmark_question_search.py [questoes] [repeticoes]
+Roda com a configuração de testes (SQLite em memória, índice FTS5).
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from database import db
+from flask_jwt_extended import create_access_token
+from models import Question, User
+from passwords import hash_password
+
+TOPICS = [
+    'recursão', 'árvore binária', 'grafo', 'pilha', 'fila', 'ordenação', 'busca binária',
+    'programação dinâmica', 'complexidade', 'hash', 'heap', 'ponteiros', 'herança', 'polimorfismo',
+    'normalização', 'transação', 'índice', 'concorrência', 'deadlock', 'memória virtual'
+]
+VERBS = ['Explique', 'Compare', 'Descreva', 'Implemente', 'Analise', 'Justifique']
+CATEGORIES = ['algoritmos', 'estruturas de dados', 'banco de dados', 'sistemas operacionais', 'poo']
+
+
+def populate(total, professor_id):
+    rng = random.Random(42)
+    batch = []
+    for index in range(total):
+        first, second = rng.sample(TOPICS, 2)
+        batch.append({
+            'created_by': professor_id,
+            'question_text': f'{rng.choice(VERBS)} {first} em relação a {second} (item {index})',
+            'question_type': rng.choice(['single_choice', 'multiple_choice', 'true_false', 'essay']),
+            'points': 1,
+            'category': rng.choice(CATEGORIES),
+            'difficulty': rng.choice(['easy', 'medium', 'hard']),
+            'is_public': rng.random() < 0.8,
+        })
+        if len(batch) == 5000:
+            db.session.execute(db.insert(Question), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Question), batch)
+    db.session.commit()
+
+
+def measure(client, headers, url, repetitions):
+    timings = []
+    for _ in range(repetitions):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url}: {response.status_code} {response.get_data(as_text=True)}')
+    return response.get_json(), statistics.median(timings), sorted(timings)[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        professor = User(email='professor@benchmark.com', password_hash=hash_password('senha-benchmark'),
+                         name='Professor', role='professor')
+        db.session.add(professor)
+        db.session.commit()
+        started = time.perf_counter()
+        populate(total, professor.id)
+        print(f"🔎 {total} questões no banco (carga em {time.perf_counter() - started:.1f}s), "
+              f"{repetitions} repetições por busca")
+
+        headers = {'Authorization': 'Bearer ' + create_access_token(
+            identity=professor.id, additional_claims={'role': 'professor', 'name': professor.name}
+        )}
+        client = app.test_client()
+        searches = [
+            ('termo comum', '/api/questions/search?q=grafo'),
+            ('dois termos', '/api/questions/search?q=árvore+binária'),
+            ('termos + filtros', '/api/questions/search?q=deadlock+transação&difficulty=hard&question_type=essay'),
+            ('sem termos (recentes)', '/api/questions/search?category=poo'),
+        ]
+        worst = 0
+        for label, url in searches:
+            page, p50, p95 = measure(client, headers, url, repetitions)
+            print(f"   - {label}: p50 {p50:.1f} ms | p95 {p95:.1f} ms")
+            worst = max(worst, p95)
+            if page['next_cursor']:
+                _, p50, p95 = measure(client, headers, f"{url}&before={page['next_cursor']}", repetitions)
+                print(f"     próxima página: p50 {p50:.1f} ms | p95 {p95:.1f} ms")
+                worst = max(worst, p95)
+
+    if worst > 50:
+        print(f"⚠️ p95 acima de 50 ms ({worst:.1f} ms)")
+    else:
+        print("✅ Todas as buscas abaixo de 50 ms (p95)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,6 +13,21 @@ class Config:
     JWT_ERROR_MESSAGE_KEY = 'message'
     JWT_HEADER_NAME = 'Authorization'
     JWT_HEADER_TYPE = 'Bearer'
+    REFRESH_TOKEN_STORE = os.getenv('REFRESH_TOKEN_STORE', 'database')  # database ou memory (processo único)
+    REFRESH_TOKEN_REVOKED_CACHE_SIZE = 10000
+    
+    # Senhas: método do werkzeug (com parâmetros) e processos dedicados ao hash (0 = na thread da requisição)
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Por processo do servidor: o total de processos de hash é (workers do gunicorn) x este valor
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_TIMEOUT_SECONDS = 10
+    
+    # Cache de respostas GET: database (versões compartilhadas entre processos), memory (processo único) ou none
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'database')
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 5000))  # Por processo
+    RESPONSE_CACHE_TTL_SECONDS = 300  # Limite para dados que não incrementam versão (ex.: nome do usuário)
+    # Resultados novos aparecem para os professores com até este atraso (incrementos agrupados)
+    RESPONSE_CACHE_RESULTS_WINDOW_SECONDS = float(os.getenv('RESPONSE_CACHE_RESULTS_WINDOW_SECONDS', 1))
     
     # SQLAlchemy
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -24,6 +39,38 @@ class Config:
     # Google Generative AI
     GOOGLE_GENAI_API_KEY = os.getenv('GOOGLE_GENAI_API_KEY')
 
+    # Monitoramento
+    MONITORING_RETENTION_DAYS = int(os.getenv('MONITORING_RETENTION_DAYS', 90))  # Eventos brutos de provas finalizadas
+    MONITORING_PARTITION_MONTHS_AHEAD = int(os.getenv('MONITORING_PARTITION_MONTHS_AHEAD', 2))
+    # Janela (segundos) em que repetições de atividades de baixo valor viram um único evento
+    MONITORING_THROTTLE_WINDOWS = {
+        'mouse_inactive': 60,
+        'text_selection': 30,
+        'right_click_attempt': 30,
+    }
+    # Alertas de taxa: `threshold` ocorrências em até `window_seconds` geram o alerta `alert`
+    MONITORING_RATE_RULES = {
+        'excessive_tab_switching': {'alert': 'tab_switching_rate', 'threshold': 5, 'window_seconds': 120},
+        'extended_focus_loss': {'alert': 'focus_loss_rate', 'threshold': 3, 'window_seconds': 300},
+    }
+    # Buffers do detector: database (compartilhados entre processos) ou memory (processo único)
+    MONITORING_DETECTOR_BACKEND = os.getenv('MONITORING_DETECTOR_BACKEND', 'database')
+    MONITORING_DETECTOR_MAX_ENROLLMENTS = int(os.getenv('MONITORING_DETECTOR_MAX_ENROLLMENTS', 10000))  # memory
+
+    # Notificações por push (SSE / long-poll)
+    NOTIFICATION_STREAM_MAX_CONNECTIONS = int(os.getenv('NOTIFICATION_STREAM_MAX_CONNECTIONS', 200))  # Por processo
+    NOTIFICATION_STREAM_MAX_SECONDS = 300  # O cliente reconecta ao fim de cada stream
+    NOTIFICATION_STREAM_TICKET_SECONDS = 60  # Validade do ticket do stream (novo ticket a cada reconexão)
+    NOTIFICATION_LONG_POLL_SECONDS = 25
+
+    # Outbox de notificações (despacho fora da requisição)
+    NOTIFICATION_OUTBOX_DISPATCHER = os.getenv('NOTIFICATION_OUTBOX_DISPATCHER', 'true').lower() == 'true'
+    NOTIFICATION_OUTBOX_INTERVAL_SECONDS = 5
+    NOTIFICATION_OUTBOX_BATCH_SIZE = 200
+    NOTIFICATION_READ_RETENTION_DAYS = int(os.getenv('NOTIFICATION_READ_RETENTION_DAYS', 90))  # Notificações lidas
+    NOTIFICATION_DUPLICATE_WINDOW_MINUTES = 60  # Cópias iguais dentro desse intervalo são compactadas
+    EXAM_REMINDER_LEAD_MINUTES = int(os.getenv('EXAM_REMINDER_LEAD_MINUTES', 60))  # Antecedência do lembrete de prova
+
 class DevelopmentConfig(Config):
     """Configuração para desenvolvimento"""
     DEBUG = True
@@ -70,6 +117,10 @@ class TestingConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=1)
+    NOTIFICATION_OUTBOX_DISPATCHER = False  # Testes despacham com drain_outbox()
+    PASSWORD_HASH_WORKERS = 0  # Hash na própria thread
+    RESPONSE_CACHE_BACKEND = 'memory'
+    RESPONSE_CACHE_RESULTS_WINDOW_SECONDS = 0  # Incremento imediato; ResultVersionBatcher testado à parte
 
 # Dicionário para facilitar a seleção da configuração
 config = {
@@ -1,10 +1,13 @@
 import calendar
 import logging
+from collections import namedtuple
 from datetime import datetime
 from functools import wraps
 
 from database import db
-from models import Exam
+from flask import jsonify
+from flask_jwt_extended import get_jwt
+from models import Exam, User
 
 logger = logging.getLogger(__name__)
 
@@ -165,4 +168,44 @@ def on_exam_access(f):
         
         return f(*args, **kwargs)
     
-    return decorated_function 
\ No newline at end of file
+    return decorated_function
+
+
+# Usuário autenticado montado a partir das claims do access token
+Principal = namedtuple('Principal', ['id', 'role', 'name'])
+
+
+def principal_claims(user):
+    """Claims adicionais gravadas no access token (login, registro e refresh)"""
+    return {'role': user.role, 'name': user.name}
+
+
+def current_principal():
+    """
+    Retornar o usuário da requisição (id, role, name) sem consultar o banco.
+    O papel vem das claims do token e vale até ele expirar (15 minutos): rotas em que
+    o dado precisa estar atualizado devem buscar o User no banco.
+    """
+    claims = get_jwt()
+    user_id = int(claims['sub'])
+    if 'role' in claims:
+        return Principal(user_id, claims['role'], claims.get('name'))
+    # Token emitido antes das claims de papel
+    user = User.query.get_or_404(user_id)
+    return Principal(user.id, user.role, user.name)
+
+
+def role_required(*roles, message='Acesso negado'):
+    """
+    Decorator que autoriza pelo papel do token, sem consultar o banco.
+    Deve ser aplicado abaixo de @jwt_required().
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if current_principal().role not in roles:
+                return jsonify({'error': message}), 403
+            return f(*args, **kwargs)
+
+        return decorated_function
+    return decorator
@@ -7,7 +7,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 from database import db
-from models import Alternative, Class, ClassEnrollment, Exam, Question, User
+from models import (QUESTION_SEARCH_DDL, Alternative, Class, ClassEnrollment,
+                    Exam, Question, User)
 from werkzeug.security import generate_password_hash
 
 
@@ -244,7 +245,312 @@ def apply_migrations():
             print("✓ Registros existentes atualizados")
         except Exception as e:
             print(f"⚠️ Erro ao atualizar registros: {e}")
-        
+
+        # 12. Consolidação de eventos de monitoramento
+        try:
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS monitoring_event_rollups (
+                    id SERIAL PRIMARY KEY,
+                    enrollment_id INTEGER NOT NULL REFERENCES exam_enrollments(id),
+                    event_type VARCHAR(50) NOT NULL,
+                    activity_type VARCHAR(50) NOT NULL DEFAULT '',
+                    event_count INTEGER NOT NULL DEFAULT 0,
+                    first_event_at TIMESTAMP,
+                    last_event_at TIMESTAMP,
+                    last_event_id INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    CONSTRAINT uq_monitoring_rollup_key UNIQUE (enrollment_id, event_type, activity_type)
+                )
+            """))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_monitoring_events_enrollment "
+                "ON monitoring_events (enrollment_id, event_type, created_at)"
+            ))
+            print("✓ Tabela 'monitoring_event_rollups' e índice de monitoramento criados/verificados")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar consolidação de monitoramento: {e}")
+
+        # 13. Particionar monitoring_events por mês (transação própria: falha não afeta os passos anteriores)
+        db.session.commit()
+        try:
+            from monitoring import partition_monitoring_events
+            if partition_monitoring_events():
+                db.session.commit()
+                print("✓ Tabela 'monitoring_events' convertida para partições mensais")
+            else:
+                print("✓ Tabela 'monitoring_events' já particionada")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Erro ao particionar monitoring_events: {e}")
+
+        # 14. Chave de deduplicação de notificações
+        if not check_column_exists('notifications', 'dedup_key'):
+            try:
+                db.session.execute(text("ALTER TABLE notifications ADD COLUMN dedup_key VARCHAR(100)"))
+                print("✓ Coluna 'dedup_key' adicionada à tabela notifications")
+            except Exception as e:
+                print(f"⚠️ Erro ao adicionar dedup_key: {e}")
+        try:
+            # Preencher apenas a notificação mais recente de cada matrícula (duplicatas antigas ficam sem chave)
+            db.session.execute(text("""
+                UPDATE notifications SET dedup_key = 'enrollment:' || (data->>'enrollment_id')
+                WHERE id IN (
+                    SELECT MAX(id) FROM notifications
+                    WHERE type IN ('result_available', 'exam_completed')
+                      AND dedup_key IS NULL AND data->>'enrollment_id' IS NOT NULL
+                    GROUP BY user_id, type, data->>'enrollment_id'
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM notifications n2
+                    WHERE n2.user_id = notifications.user_id AND n2.type = notifications.type
+                      AND n2.dedup_key = 'enrollment:' || (notifications.data->>'enrollment_id')
+                )
+            """))
+            db.session.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_dedup
+                ON notifications (user_id, type, dedup_key) WHERE dedup_key IS NOT NULL
+            """))
+            print("✓ Índice de deduplicação de notificações criado/verificado")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar deduplicação de notificações: {e}")
+
+        # 15. Contador de notificações não lidas por usuário
+        if not check_column_exists('users', 'unread_notifications'):
+            try:
+                db.session.execute(text("ALTER TABLE users ADD COLUMN unread_notifications INTEGER NOT NULL DEFAULT 0"))
+                db.session.execute(text("""
+                    UPDATE users SET unread_notifications = (
+                        SELECT COUNT(*) FROM notifications n
+                        WHERE n.user_id = users.id AND n.is_read = FALSE
+                    )
+                """))
+                print("✓ Coluna 'unread_notifications' adicionada e preenchida na tabela users")
+            except Exception as e:
+                print(f"⚠️ Erro ao adicionar unread_notifications: {e}")
+        else:
+            print("✓ Coluna 'unread_notifications' já existe na tabela users")
+
+        # 16. Outbox de notificações
+        try:
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS notification_outbox (
+                    id SERIAL PRIMARY KEY,
+                    event_type VARCHAR(50) NOT NULL,
+                    payload JSON NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    processed_at TIMESTAMP
+                )
+            """))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending "
+                "ON notification_outbox (id) WHERE processed_at IS NULL"
+            ))
+            print("✓ Tabela 'notification_outbox' criada/verificada")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar outbox de notificações: {e}")
+
+        # 17. Índice da listagem de notificações por usuário
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_notifications_user_created "
+                "ON notifications (user_id, created_at, id)"
+            ))
+            print("✓ Índice 'idx_notifications_user_created' criado/verificado")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar índice de notificações: {e}")
+
+        # 18. Refresh tokens compartilhados entre processos
+        try:
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS refresh_tokens (
+                    jti VARCHAR(36) PRIMARY KEY,
+                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    expires_at TIMESTAMP NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_expires_at ON refresh_tokens (expires_at)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id ON refresh_tokens (user_id)"
+            ))
+            print("✓ Tabela 'refresh_tokens' criada/verificada")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar tabela de refresh tokens: {e}")
+
+        # 19. Índices do histórico de resultados do estudante
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_exam_enrollments_student_status_end "
+                "ON exam_enrollments (student_id, status, end_time, id)"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_answers_enrollment ON answers (enrollment_id)"
+            ))
+            print("✓ Índices de resultados do estudante criados/verificados")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar índices de resultados: {e}")
+
+        # 20. Contagem de alunos/solicitações por turma
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_class_enrollments_class_status "
+                "ON class_enrollments (class_id, status)"
+            ))
+            print("✓ Índice 'idx_class_enrollments_class_status' criado/verificado")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar índice de matrículas em turmas: {e}")
+
+        # 21. Busca de turmas por nome/descrição (ILIKE '%termo%'), apenas PostgreSQL
+        # (transação própria: sem permissão para o pg_trgm os passos anteriores são mantidos)
+        if db.engine.dialect.name == 'postgresql':
+            db.session.commit()
+            try:
+                db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                db.session.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_classes_name_trgm "
+                    "ON classes USING gin (name gin_trgm_ops)"
+                ))
+                db.session.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_classes_description_trgm "
+                    "ON classes USING gin (description gin_trgm_ops)"
+                ))
+                db.session.commit()
+                print("✓ Índices de busca de turmas (pg_trgm, apenas PostgreSQL) criados/verificados")
+            except Exception as e:
+                db.session.rollback()
+                print(f"⚠️ Erro ao criar índices de busca de turmas (pg_trgm, apenas PostgreSQL): {e}")
+        else:
+            print("⚠️ Índices de busca de turmas ignorados: pg_trgm existe apenas no PostgreSQL")
+
+        # 22. Índice parcial das respostas aguardando correção
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_answers_pending ON answers (enrollment_id, question_id) "
+                "WHERE correction_method IS NULL OR correction_method = 'pending' OR points_earned IS NULL"
+            ))
+            print("✓ Índice 'idx_answers_pending' criado/verificado")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar índice de correções pendentes: {e}")
+
+        # 23. Coluna needs_review (fila de correção) e índices parciais sobre ela
+        if not check_column_exists('answers', 'needs_review'):
+            try:
+                db.session.execute(text(
+                    "ALTER TABLE answers ADD COLUMN needs_review BOOLEAN NOT NULL DEFAULT FALSE"
+                ))
+                db.session.execute(text("""
+                    UPDATE answers SET needs_review = TRUE
+                    WHERE answer_text IS NOT NULL AND answer_text <> ''
+                      AND (correction_method IS NULL OR correction_method = 'pending' OR points_earned IS NULL)
+                """))
+                print("✓ Coluna 'needs_review' adicionada à tabela answers")
+            except Exception as e:
+                print(f"⚠️ Erro ao adicionar coluna needs_review: {e}")
+        try:
+            db.session.execute(text("DROP INDEX IF EXISTS idx_answers_pending"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_answers_needs_review ON answers (enrollment_id, question_id) "
+                "WHERE needs_review"
+            ))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_answers_review_queue ON answers (created_at, id) "
+                "WHERE needs_review"
+            ))
+            print("✓ Índices da fila de correção criados/verificados")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar índices da fila de correção: {e}")
+
+        # 24. Busca textual no banco de questões (GIN tsvector no PostgreSQL, FTS5 no SQLite)
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_questions_bank_recent ON questions (created_at, id) "
+                "WHERE exam_id IS NULL"
+            ))
+            dialect = db.engine.dialect.name
+            for statement in QUESTION_SEARCH_DDL.get(dialect, []):
+                db.session.execute(text(statement))
+            if dialect == 'sqlite':
+                # Indexar as questões já existentes
+                db.session.execute(text("INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')"))
+            print("✓ Índices de busca de questões criados/verificados")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar índices de busca de questões: {e}")
+
+        # 25. Versões do cache de respostas
+        try:
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS cache_versions (
+                    key VARCHAR(100) PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 1
+                )
+            """))
+            print("✓ Tabela 'cache_versions' criada/verificada")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar tabela cache_versions: {e}")
+
+        # 26. Marcação do lembrete de início das provas
+        if not check_column_exists('exams', 'reminder_sent_at'):
+            try:
+                db.session.execute(text("ALTER TABLE exams ADD COLUMN reminder_sent_at TIMESTAMP"))
+                print("✓ Coluna 'reminder_sent_at' adicionada à tabela exams")
+            except Exception as e:
+                print(f"⚠️ Erro ao adicionar coluna reminder_sent_at: {e}")
+        else:
+            print("✓ Coluna 'reminder_sent_at' já existe")
+
+        # 27. Compactação de notificações duplicadas (cópias do mesmo tipo próximas no tempo)
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_notifications_user_type_created "
+                "ON notifications (user_id, type, created_at)"
+            ))
+            print("✓ Índice 'idx_notifications_user_type_created' criado/verificado")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar índice de compactação de notificações: {e}")
+
+        # 28. Marcação dos eventos de monitoramento consolidados (substitui o last_event_id como marca d'água)
+        if not check_column_exists('monitoring_events', 'rolled_up_at'):
+            try:
+                db.session.execute(text("ALTER TABLE monitoring_events ADD COLUMN rolled_up_at TIMESTAMP"))
+                # Eventos já somados pela marca d'água antiga não podem ser contados de novo
+                db.session.execute(text("""
+                    UPDATE monitoring_events SET rolled_up_at = CURRENT_TIMESTAMP
+                    WHERE id <= (SELECT COALESCE(MAX(last_event_id), 0) FROM monitoring_event_rollups)
+                """))
+                print("✓ Coluna 'rolled_up_at' adicionada à tabela monitoring_events")
+            except Exception as e:
+                print(f"⚠️ Erro ao adicionar coluna rolled_up_at: {e}")
+        else:
+            print("✓ Coluna 'rolled_up_at' já existe")
+        try:
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_monitoring_events_pending_rollup "
+                "ON monitoring_events (id) WHERE rolled_up_at IS NULL"
+            ))
+            print("✓ Índice 'idx_monitoring_events_pending_rollup' criado/verificado")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar índice de eventos pendentes de consolidação: {e}")
+
+        # 29. Buffers do detector de taxa compartilhados entre processos
+        try:
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS monitoring_rate_windows (
+                    enrollment_id INTEGER NOT NULL,
+                    activity_type VARCHAR(50) NOT NULL,
+                    timestamps JSON NOT NULL,
+                    alerting BOOLEAN NOT NULL DEFAULT FALSE,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (enrollment_id, activity_type)
+                )
+            """))
+            print("✓ Tabela 'monitoring_rate_windows' criada/verificada")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar tabela monitoring_rate_windows: {e}")
+
         db.session.commit()
         print("🎉 Migrações v3 aplicadas com sucesso!")
         
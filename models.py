@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from database import db
+from sqlalchemy import DDL, event
 
 
 class Class(db.Model):
@@ -39,6 +40,10 @@ class ClassEnrollment(db.Model):
     status = db.Column(db.String(50), default='pending')  # pending, approved, rejected
     enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_class_enrollments_class_status', 'class_id', 'status'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -58,6 +63,7 @@ class User(db.Model):
     name = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Mantido por notification_counters
 
     def to_dict(self):
         return {
@@ -81,6 +87,7 @@ class Exam(db.Model):
     class_id = db.Column(db.Integer, db.ForeignKey('classes.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(50), default='draft')
+    reminder_sent_at = db.Column(db.DateTime)  # Lembrete de início enfileirado (send_exam_reminders)
 
     questions = db.relationship('Question', backref='exam', lazy=True)
     enrollments = db.relationship('ExamEnrollment', backref='exam', lazy=True)
@@ -121,6 +128,15 @@ class Question(db.Model):
     answers = db.relationship('Answer', backref='question', lazy=True)
     exam_questions = db.relationship('ExamQuestion', backref='question', lazy=True)
 
+    __table_args__ = (
+        # Banco de questões (exam_id nulo) do mais recente ao mais antigo (busca sem termos)
+        db.Index(
+            'idx_questions_bank_recent', 'created_at', 'id',
+            postgresql_where=db.text('exam_id IS NULL'),
+            sqlite_where=db.text('exam_id IS NULL')
+        ),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -140,6 +156,46 @@ class Question(db.Model):
             'alternatives': [alt.to_dict() for alt in self.alternatives]
         }
 
+
+# Busca textual no banco de questões: enunciado + categoria
+QUESTION_SEARCH_DOCUMENT = (
+    "to_tsvector('portuguese', coalesce(question_text, '') || ' ' || coalesce(category, ''))"
+)
+QUESTION_SEARCH_DDL = {
+    # PostgreSQL: GIN sobre a mesma expressão usada nas consultas, apenas questões do banco
+    'postgresql': [
+        "CREATE INDEX IF NOT EXISTS idx_questions_search ON questions "
+        f"USING gin (({QUESTION_SEARCH_DOCUMENT})) WHERE exam_id IS NULL",
+    ],
+    # SQLite (desenvolvimento/testes): tabela FTS5 de conteúdo externo mantida por triggers
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+        "question_text, category, content='questions', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN "
+        "INSERT INTO questions_fts (rowid, question_text, category) "
+        "VALUES (new.id, new.question_text, new.category); END",
+        "CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN "
+        "INSERT INTO questions_fts (questions_fts, rowid, question_text, category) "
+        "VALUES ('delete', old.id, old.question_text, old.category); END",
+        "CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE OF question_text, category "
+        "ON questions BEGIN "
+        "INSERT INTO questions_fts (questions_fts, rowid, question_text, category) "
+        "VALUES ('delete', old.id, old.question_text, old.category); "
+        "INSERT INTO questions_fts (rowid, question_text, category) "
+        "VALUES (new.id, new.question_text, new.category); END",
+    ],
+}
+
+for _dialect, _statements in QUESTION_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Question.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+event.listen(
+    Question.__table__, 'before_drop',
+    DDL("DROP TABLE IF EXISTS questions_fts").execute_if(dialect='sqlite')
+)
+
+
 class Alternative(db.Model):
     __tablename__ = 'alternatives'
     
@@ -176,6 +232,11 @@ class ExamEnrollment(db.Model):
     answers = db.relationship('Answer', backref='enrollment', lazy=True)
     monitoring_events = db.relationship('MonitoringEvent', backref='enrollment', lazy=True)
 
+    __table_args__ = (
+        # Histórico do estudante ordenado por finalização (paginação por cursor)
+        db.Index('idx_exam_enrollments_student_status_end', 'student_id', 'status', 'end_time', 'id'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -203,8 +264,25 @@ class Answer(db.Model):
     similarity_score = db.Column(db.Numeric(5,2))  # Campo para armazenar o score de similaridade da correção automática
     correction_method = db.Column(db.String(50))  # Campo para armazenar o método de correção usado (manual, auto, etc.)
     feedback = db.Column(db.Text)  # Campo para feedback do professor na correção manual
+    # Resposta com texto aguardando correção (mantido em before_insert/before_update)
+    needs_review = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_answers_enrollment', 'enrollment_id'),
+        # Respostas aguardando correção: por matrícula (resumos) e fila por ordem de envio
+        db.Index(
+            'idx_answers_needs_review', 'enrollment_id', 'question_id',
+            postgresql_where=db.text('needs_review'),
+            sqlite_where=db.text('needs_review')
+        ),
+        db.Index(
+            'idx_answers_review_queue', 'created_at', 'id',
+            postgresql_where=db.text('needs_review'),
+            sqlite_where=db.text('needs_review')
+        ),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -219,14 +297,38 @@ class Answer(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+def answer_needs_review(answer_text, correction_method, points_earned):
+    """Resposta com texto ainda sem correção (pendente, sem método ou sem pontuação)"""
+    if not answer_text:
+        return False
+    return correction_method in (None, 'pending') or points_earned is None
+
+
+@event.listens_for(Answer, 'before_insert')
+@event.listens_for(Answer, 'before_update')
+def _update_needs_review(mapper, connection, target):
+    target.needs_review = answer_needs_review(target.answer_text, target.correction_method, target.points_earned)
+
+
 class MonitoringEvent(db.Model):
     __tablename__ = 'monitoring_events'
+    __table_args__ = (
+        # Todas as consultas de monitoramento filtram por matrícula (e tipo)
+        db.Index('idx_monitoring_events_enrollment', 'enrollment_id', 'event_type', 'created_at'),
+        # Eventos ainda não consolidados (rollup_monitoring_events)
+        db.Index(
+            'idx_monitoring_events_pending_rollup', 'id',
+            postgresql_where=db.text('rolled_up_at IS NULL'),
+            sqlite_where=db.text('rolled_up_at IS NULL')
+        ),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     enrollment_id = db.Column(db.Integer, db.ForeignKey('exam_enrollments.id'))
     event_type = db.Column(db.String(50), nullable=False)
     event_data = db.Column(db.JSON)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    rolled_up_at = db.Column(db.DateTime)  # Preenchido quando o evento entra em monitoring_event_rollups
 
     def to_dict(self):
         return {
@@ -237,6 +339,46 @@ class MonitoringEvent(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+class MonitoringEventRollup(db.Model):
+    """Contagem consolidada de eventos de monitoramento por matrícula e tipo"""
+    __tablename__ = 'monitoring_event_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('enrollment_id', 'event_type', 'activity_type', name='uq_monitoring_rollup_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    enrollment_id = db.Column(db.Integer, db.ForeignKey('exam_enrollments.id'), nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    activity_type = db.Column(db.String(50), nullable=False, default='')  # '' quando o evento não tem activity_type
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+    first_event_at = db.Column(db.DateTime)
+    last_event_at = db.Column(db.DateTime)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)  # Maior id bruto consolidado (informativo)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'enrollment_id': self.enrollment_id,
+            'event_type': self.event_type,
+            'activity_type': self.activity_type or None,
+            'event_count': self.event_count,
+            'first_event_at': self.first_event_at.isoformat() if self.first_event_at else None,
+            'last_event_at': self.last_event_at.isoformat() if self.last_event_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MonitoringRateWindow(db.Model):
+    """Buffer circular do detector de taxa (últimos instantes de uma atividade da matrícula)"""
+    __tablename__ = 'monitoring_rate_windows'
+    
+    # Sem chave estrangeira: linhas efêmeras, apagadas ao finalizar a prova ou quando ociosas
+    enrollment_id = db.Column(db.Integer, primary_key=True)
+    activity_type = db.Column(db.String(50), primary_key=True)
+    timestamps = db.Column(db.JSON, nullable=False, default=list)  # Até `threshold` instantes (epoch)
+    alerting = db.Column(db.Boolean, nullable=False, default=False)  # Limite já cruzado (alerta emitido)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class ExamQuestion(db.Model):
     __tablename__ = 'exam_questions'
     
@@ -261,6 +403,18 @@ class ExamQuestion(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        # Deduplicação: no máximo uma notificação por (usuário, tipo, chave)
+        db.Index(
+            'uq_notifications_dedup', 'user_id', 'type', 'dedup_key', unique=True,
+            postgresql_where=db.text('dedup_key IS NOT NULL'),
+            sqlite_where=db.text('dedup_key IS NOT NULL')
+        ),
+        # Listagem paginada por cursor (user_id, created_at DESC, id DESC)
+        db.Index('idx_notifications_user_created', 'user_id', 'created_at', 'id'),
+        # Compactação de duplicatas: cópias do mesmo tipo próximas no tempo
+        db.Index('idx_notifications_user_type_created', 'user_id', 'type', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -272,6 +426,7 @@ class Notification(db.Model):
     priority = db.Column(db.String(20), default='normal')  # low, normal, high, urgent
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     read_at = db.Column(db.DateTime)
+    dedup_key = db.Column(db.String(100))  # Ex.: 'enrollment:42' - NULL para notificações sem deduplicação
 
     # Relacionamento com usuário
     user = db.relationship('User', backref='notifications')
@@ -464,4 +619,40 @@ class PlatformEvaluation(db.Model):
             
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
-        } 
\ No newline at end of file
+        }
+
+
+class NotificationOutbox(db.Model):
+    """Eventos de notificação gravados na transação de origem e despachados em lote"""
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        db.Index('idx_notification_outbox_pending', 'id',
+                 postgresql_where=db.text('processed_at IS NULL'),
+                 sqlite_where=db.text('processed_at IS NULL')),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # exam_completed, result_available, suspicious_activity, etc.
+    payload = db.Column(db.JSON, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+
+class RefreshToken(db.Model):
+    """Refresh tokens válidos (a linha é removida ao usar, revogar ou expirar)"""
+    __tablename__ = 'refresh_tokens'
+
+    jti = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class CacheVersion(db.Model):
+    """Versões das entidades usadas nas chaves do cache de respostas (compartilhadas entre processos)"""
+    __tablename__ = 'cache_versions'
+
+    key = db.Column(db.String(100), primary_key=True)  # exam:<id>, user:<id>
+    version = db.Column(db.BigInteger, nullable=False, default=1)
@@ -0,0 +1,728 @@
+#!/usr/bin/env python3
+"""
+Monitoramento de provas:
+- agrupamento de eventos repetitivos de baixo valor na ingestão
+- detecção de taxas suspeitas (janela deslizante) durante a ingestão
+- partições mensais de monitoring_events (PostgreSQL)
+- consolidação noturna em monitoring_event_rollups
+- retenção de eventos brutos de provas finalizadas
+
+Execute diariamente (cron): python monitoring.py
+"""
+
+import atexit
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from database import db
+from models import (Exam, ExamEnrollment, MonitoringEvent, MonitoringEventRollup,
+                    MonitoringRateWindow)
+from pg_channels import notify_channel, start_channel_listener
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Chave do advisory lock que impede duas consolidações simultâneas (PostgreSQL)
+ROLLUP_LOCK_KEY = 726001
+
+# Eventos brutos marcados (rolled_up_at) por transação da consolidação
+ROLLUP_CHUNK_SIZE = 5000
+
+
+# Canal LISTEN/NOTIFY usado para pedir a todos os processos que gravem as janelas de uma matrícula
+THROTTLE_FLUSH_CHANNEL = 'monitoring_throttle_flush'
+
+# Chaves de event_data preenchidas apenas pelo servidor ao gravar um evento agrupado
+COLLAPSED_EVENT_KEYS = ('count', 'collapsed', 'window_start', 'window_end')
+
+
+def sanitize_event_data(event_data):
+    """Cópia de event_data sem as chaves reservadas aos eventos agrupados pelo servidor"""
+    return {key: value for key, value in event_data.items() if key not in COLLAPSED_EVENT_KEYS}
+
+
+def event_weight(event_data):
+    """Quantidade de ocorrências representadas por um evento (só eventos agrupados valem 'count')"""
+    if isinstance(event_data, dict) and event_data.get('collapsed') is True:
+        try:
+            return max(int(event_data.get('count', 1)), 1)
+        except (TypeError, ValueError):
+            return 1
+    return 1
+
+
+class MonitoringEventThrottle:
+    """
+    Agrupa repetições de eventos de baixo valor (mouse_inactive, text_selection, ...) por
+    matrícula e tipo. A primeira ocorrência de cada janela é gravada normalmente; as repetições
+    dentro da janela ficam só em memória e são gravadas ao fim dela como um único evento com
+    'count' em event_data. As janelas vencidas são encerradas a cada admit() e por uma thread
+    que varre a cada sweep_interval segundos (matrículas que pararam de enviar eventos); as
+    abertas são gravadas quando o processo termina normalmente (atexit). Só as repetições ainda
+    não gravadas de um processo que cai são perdidas. Ao finalizar a prova, request_flush pede
+    a todos os processos (LISTEN/NOTIFY no PostgreSQL) que gravem as janelas da matrícula.
+    """
+
+    def __init__(self, windows, sweep_interval=5):
+        self.windows = dict(windows or {})
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._open = {}  # (enrollment_id, event_type, activity_type) -> estado da janela
+        self._last_sweep = 0.0
+        self._app = None
+        self._listener = None
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self._app = app
+
+    def window_for(self, event_data):
+        if not isinstance(event_data, dict):
+            return None
+        return self.windows.get(event_data.get('activity_type'))
+
+    def admit(self, enrollment_id, event_type, event_data, now=None):
+        """
+        Registrar uma ocorrência. Retorna (gravar, pendentes): se o evento deve ser gravado
+        e a lista de eventos agrupados de janelas encerradas que devem ser gravados junto.
+        """
+        now = now if now is not None else time.time()
+        window = self.window_for(event_data)
+
+        with self._lock:
+            pending = self._sweep(now)
+            if not window:
+                return True, pending
+
+            key = (enrollment_id, event_type, event_data.get('activity_type'))
+            state = self._open.get(key)
+            if state and now - state['start'] < window:
+                state['repeats'] += 1
+                state['last_at'] = now
+                state['event_data'] = event_data
+                return False, pending
+
+            if state:
+                pending.extend(self._close(key, state))
+            self._open[key] = {'start': now, 'last_at': now, 'repeats': 0,
+                               'window': window, 'event_data': event_data}
+        self._ensure_listener()
+        self._ensure_sweeper()
+        return True, pending
+
+    def flush_enrollment(self, enrollment_id):
+        """Encerrar todas as janelas abertas de uma matrícula neste processo"""
+        with self._lock:
+            pending = []
+            for key in [key for key in self._open if key[0] == enrollment_id]:
+                pending.extend(self._close(key, self._open[key]))
+            return pending
+
+    def flush_expired(self, now=None):
+        """Encerrar as janelas vencidas, mesmo sem novos eventos da matrícula"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._last_sweep = now
+            return self._close_expired(now)
+
+    def flush_all(self):
+        """Encerrar todas as janelas abertas neste processo"""
+        with self._lock:
+            pending = []
+            for key in list(self._open):
+                pending.extend(self._close(key, self._open[key]))
+            return pending
+
+    def shutdown(self):
+        """Parar a varredura e gravar as janelas abertas (registrado no atexit)"""
+        self._stop.set()
+        self._write(self.flush_all())
+
+    def request_flush(self, enrollment_id):
+        """
+        Encerrar as janelas da matrícula em todos os processos (ex.: ao finalizar a prova).
+        As deste processo são devolvidas para gravar na transação atual; os demais processos
+        gravam as suas ao receber o aviso, emitido na mesma transação (entregue após o commit).
+        """
+        notify_channel(THROTTLE_FLUSH_CHANNEL, str(enrollment_id))
+        return self.flush_enrollment(enrollment_id)
+
+    def _ensure_listener(self):
+        # Só processos com janelas abertas precisam ouvir os pedidos de gravação
+        if self._listener is not None or self._app is None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = start_channel_listener(
+                self._app, THROTTLE_FLUSH_CHANNEL, self._on_flush_requests,
+                name='monitoring-throttle-listener'
+            ) or False
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None or self._app is None:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='monitoring-throttle-sweeper',
+                                             daemon=True)
+            self._sweeper.start()
+            atexit.register(self.shutdown)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            self._write(self.flush_expired())
+
+    def _on_flush_requests(self, payloads):
+        pending = []
+        for enrollment_id in {int(payload) for payload in payloads}:
+            pending.extend(self.flush_enrollment(enrollment_id))
+        self._write(pending)
+
+    def _write(self, pending):
+        if not pending or self._app is None:
+            return
+        with self._app.app_context():
+            try:
+                db.session.add_all(MonitoringEvent(**event) for event in pending)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao gravar eventos de monitoramento agrupados: {e}")
+
+    def _sweep(self, now):
+        if now - self._last_sweep < self.sweep_interval:
+            return []
+        self._last_sweep = now
+        return self._close_expired(now)
+
+    def _close_expired(self, now):
+        pending = []
+        for key in [key for key, state in self._open.items() if now - state['start'] >= state['window']]:
+            pending.extend(self._close(key, self._open[key]))
+        return pending
+
+    def _close(self, key, state):
+        del self._open[key]
+        if not state['repeats']:
+            return []
+        enrollment_id, event_type, _ = key
+        event_data = dict(state['event_data'])
+        event_data.update({
+            'count': state['repeats'],
+            'collapsed': True,
+            'window_start': datetime.utcfromtimestamp(state['start']).isoformat(),
+            'window_end': datetime.utcfromtimestamp(state['last_at']).isoformat()
+        })
+        return [{
+            'enrollment_id': enrollment_id,
+            'event_type': event_type,
+            'event_data': event_data,
+            'created_at': datetime.utcfromtimestamp(state['last_at'])
+        }]
+
+
+class MemoryRateStore:
+    """
+    Buffers do detector no processo (processo único: testes e desenvolvimento local).
+    A memória é limitada por max_enrollments (descarte da matrícula menos recente).
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_enrollments=10000):
+        self.max_enrollments = max_enrollments
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._state = OrderedDict()  # enrollment_id -> {activity_type: (instantes, em_alerta)}
+
+    def update(self, enrollment_id, activity_type, step):
+        with self._lock:
+            enrollment_state = self._state.get(enrollment_id)
+            if enrollment_state is None:
+                enrollment_state = self._state[enrollment_id] = {}
+                while len(self._state) > self.max_enrollments:
+                    self._state.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._state.move_to_end(enrollment_id)
+            timestamps, alerting = enrollment_state.get(activity_type, ((), False))
+            timestamps, alerting, result = step(list(timestamps), alerting)
+            enrollment_state[activity_type] = (tuple(timestamps), alerting)
+            return result
+
+    def forget(self, enrollment_id):
+        with self._lock:
+            self._state.pop(enrollment_id, None)
+
+    def purge_idle(self, idle_before):
+        with self._lock:
+            idle = [enrollment_id for enrollment_id, enrollment_state in self._state.items()
+                    if all(not timestamps or timestamps[-1] < idle_before
+                           for timestamps, _ in enrollment_state.values())]
+            for enrollment_id in idle:
+                del self._state[enrollment_id]
+            return len(idle)
+
+    def stats(self):
+        with self._lock:
+            total = sys.getsizeof(self._state)
+            windows = buffered = 0
+            for enrollment_state in self._state.values():
+                total += sys.getsizeof(enrollment_state)
+                for timestamps, _ in enrollment_state.values():
+                    windows += 1
+                    buffered += len(timestamps)
+                    total += sys.getsizeof(timestamps) + sum(sys.getsizeof(t) for t in timestamps)
+            active = len(self._state)
+        return {
+            'backend': self.name,
+            'active_enrollments': active,
+            'tracked_windows': windows,
+            'buffered_timestamps': buffered,
+            'max_enrollments': self.max_enrollments,
+            'evicted_enrollments': self.evicted,
+            'approx_bytes': total,
+            'approx_bytes_per_enrollment': round(total / active) if active else 0
+        }
+
+
+class DatabaseRateStore:
+    """
+    Buffers do detector na tabela monitoring_rate_windows, compartilhados entre processos:
+    uma linha por matrícula e tipo de atividade com no máximo `threshold` instantes. Cada
+    ocorrência custa um upsert (que trava a linha até o commit da requisição, serializando
+    os processos da mesma matrícula) e um update. Linhas de provas finalizadas são apagadas
+    (forget) e as ociosas, na manutenção noturna (purge_idle).
+    """
+
+    name = 'database'
+
+    def update(self, enrollment_id, activity_type, step):
+        table = MonitoringRateWindow.__table__
+        key = (table.c.enrollment_id == enrollment_id) & (table.c.activity_type == activity_type)
+        statement = _dialect_insert(table).values(
+            enrollment_id=enrollment_id, activity_type=activity_type,
+            timestamps=[], alerting=False, updated_at=datetime.utcnow()
+        )
+        row = db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.enrollment_id, table.c.activity_type],
+                set_={'updated_at': statement.excluded.updated_at}
+            ).returning(table.c.timestamps, table.c.alerting)
+        ).first()
+        timestamps, alerting, result = step(list(row.timestamps or []), bool(row.alerting))
+        db.session.execute(table.update().where(key).values(timestamps=timestamps, alerting=alerting))
+        return result
+
+    def forget(self, enrollment_id):
+        MonitoringRateWindow.query.filter_by(enrollment_id=enrollment_id).delete(synchronize_session=False)
+
+    def purge_idle(self, idle_before):
+        deleted = MonitoringRateWindow.query.filter(
+            MonitoringRateWindow.updated_at < datetime.utcfromtimestamp(idle_before)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def stats(self):
+        row = db.session.query(
+            db.func.count(db.distinct(MonitoringRateWindow.enrollment_id)),
+            db.func.count(MonitoringRateWindow.enrollment_id),
+            db.func.coalesce(db.func.sum(db.func.length(db.cast(MonitoringRateWindow.timestamps, db.Text))), 0)
+        ).one()
+        active, windows, timestamps_bytes = row
+        return {
+            'backend': self.name,
+            'active_enrollments': active,
+            'tracked_windows': windows,
+            'approx_bytes': int(timestamps_bytes),
+            'approx_bytes_per_enrollment': round(timestamps_bytes / active) if active else 0
+        }
+
+
+def _dialect_insert(table):
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f'Detector de taxa não suporta {dialect}')
+    return insert(table)
+
+
+class SuspiciousRateDetector:
+    """
+    Detector de taxa por janela deslizante. Para cada matrícula ativa e cada regra guarda
+    apenas os últimos `threshold` instantes de ocorrência (buffer circular): a taxa é
+    excedida quando o mais antigo deles ainda está dentro da janela. O alerta é emitido só
+    na travessia do limite e rearmado quando a taxa volta a ficar abaixo dele.
+    Os buffers ficam no store (MONITORING_DETECTOR_BACKEND): 'database' compartilha o
+    estado entre processos; 'memory' é por processo, limitado a max_enrollments.
+    Os tipos com regra de taxa não devem ser agrupados pelo MonitoringEventThrottle.
+    """
+
+    def __init__(self, rules, store=None):
+        self.rules = dict(rules or {})
+        self.store = store if store is not None else MemoryRateStore()
+
+    def tracks(self, event_data):
+        return isinstance(event_data, dict) and event_data.get('activity_type') in self.rules
+
+    def observe(self, enrollment_id, event_data, now=None):
+        """Registrar uma ocorrência; retorna o alerta (dict) se o limite foi cruzado agora"""
+        if not self.tracks(event_data):
+            return None
+        now = now if now is not None else time.time()
+        activity_type = event_data['activity_type']
+        rule = self.rules[activity_type]
+        threshold, window = rule['threshold'], rule['window_seconds']
+
+        def step(timestamps, alerting):
+            timestamps = (timestamps + [round(now, 3)])[-threshold:]
+            exceeded = len(timestamps) == threshold and now - timestamps[0] <= window
+            if not exceeded or alerting:
+                return timestamps, exceeded, None
+            return timestamps, True, {
+                'activity_type': rule['alert'],
+                'source_activity_type': activity_type,
+                'details': {
+                    'count': threshold,
+                    'window_seconds': window,
+                    'observed_seconds': round(now - timestamps[0], 1)
+                }
+            }
+
+        return self.store.update(enrollment_id, activity_type, step)
+
+    def forget(self, enrollment_id):
+        """Descartar os buffers de uma matrícula (ex.: prova finalizada)"""
+        self.store.forget(enrollment_id)
+
+    def purge_idle(self, now=None):
+        """Descartar buffers sem ocorrências na maior janela das regras (não alteram alertas futuros)"""
+        now = now if now is not None else time.time()
+        longest = max((rule['window_seconds'] for rule in self.rules.values()), default=0)
+        return self.store.purge_idle(now - longest)
+
+    def stats(self):
+        """Medir o tamanho dos buffers do detector"""
+        return dict(self.store.stats(), rules=len(self.rules))
+
+
+def create_rate_detector(config):
+    """Detector com o store configurado em MONITORING_DETECTOR_BACKEND ('database' ou 'memory')"""
+    name = config.get('MONITORING_DETECTOR_BACKEND', 'database')
+    if name == 'database':
+        store = DatabaseRateStore()
+    elif name == 'memory':
+        store = MemoryRateStore(config.get('MONITORING_DETECTOR_MAX_ENROLLMENTS', 10000))
+    else:
+        raise ValueError(f'MONITORING_DETECTOR_BACKEND inválido: {name}')
+    return SuspiciousRateDetector(config.get('MONITORING_RATE_RULES'), store)
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f"monitoring_events_p{month:%Y%m}"
+
+
+def is_partitioned():
+    """Verificar se monitoring_events já é uma tabela particionada"""
+    if not _is_postgres():
+        return False
+    result = db.session.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'monitoring_events'
+    """))
+    return result.first() is not None
+
+
+def _create_month_partition(month):
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} PARTITION OF monitoring_events "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+    ))
+
+
+def partition_monitoring_events():
+    """
+    Converter monitoring_events em tabela particionada por mês (apenas PostgreSQL).
+    Os eventos existentes são copiados para as novas partições. No SQLite (testes/local)
+    a tabela continua única, apoiada pelo índice por matrícula e pela retenção.
+    """
+    if not _is_postgres() or is_partitioned():
+        return False
+
+    db.session.execute(text("ALTER TABLE monitoring_events RENAME TO monitoring_events_legacy"))
+    db.session.execute(text(
+        "ALTER TABLE monitoring_events_legacy RENAME CONSTRAINT monitoring_events_pkey TO monitoring_events_legacy_pkey"
+    ))
+    db.session.execute(text("DROP INDEX IF EXISTS idx_monitoring_events_enrollment"))
+    db.session.execute(text("DROP INDEX IF EXISTS idx_monitoring_events_pending_rollup"))
+
+    db.session.execute(text("""
+        CREATE TABLE monitoring_events (
+            id INTEGER NOT NULL DEFAULT nextval('monitoring_events_id_seq'),
+            enrollment_id INTEGER REFERENCES exam_enrollments(id),
+            event_type VARCHAR(50) NOT NULL,
+            event_data JSON,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            rolled_up_at TIMESTAMP,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """))
+    db.session.execute(text("CREATE TABLE monitoring_events_default PARTITION OF monitoring_events DEFAULT"))
+
+    months = db.session.execute(text("""
+        SELECT DISTINCT date_trunc('month', COALESCE(created_at, CURRENT_TIMESTAMP)) AS month
+        FROM monitoring_events_legacy
+    """)).scalars().all()
+    for month in set(months) | {_month_start(datetime.utcnow())}:
+        _create_month_partition(month)
+
+    db.session.execute(text("""
+        INSERT INTO monitoring_events (id, enrollment_id, event_type, event_data, created_at, rolled_up_at)
+        SELECT id, enrollment_id, event_type, event_data, COALESCE(created_at, CURRENT_TIMESTAMP), rolled_up_at
+        FROM monitoring_events_legacy
+    """))
+    db.session.execute(text("ALTER SEQUENCE monitoring_events_id_seq OWNED BY monitoring_events.id"))
+    db.session.execute(text("DROP TABLE monitoring_events_legacy"))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_monitoring_events_enrollment "
+        "ON monitoring_events (enrollment_id, event_type, created_at)"
+    ))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_monitoring_events_pending_rollup "
+        "ON monitoring_events (id) WHERE rolled_up_at IS NULL"
+    ))
+    return True
+
+
+def ensure_monitoring_partitions(months_ahead=2):
+    """Criar as partições do mês atual e dos próximos meses"""
+    if not is_partitioned():
+        return []
+
+    created = []
+    month = _month_start(datetime.utcnow())
+    for _ in range(months_ahead + 1):
+        try:
+            _create_month_partition(month)
+            db.session.commit()
+            created.append(_partition_name(month))
+        except Exception as e:
+            # Acontece se a partição DEFAULT já tiver eventos desse intervalo
+            db.session.rollback()
+            logger.error(f"Erro ao criar partição {_partition_name(month)}: {e}")
+        month = _next_month(month)
+    return created
+
+
+def rollup_monitoring_events(chunk_size=ROLLUP_CHUNK_SIZE):
+    """
+    Consolidar eventos brutos ainda não consolidados em contagens por matrícula, tipo de evento
+    e activity_type. Cada lote é marcado (rolled_up_at) no mesmo UPDATE que o seleciona e somado
+    na mesma transação: um evento que só fica visível depois (transação lenta, repetições
+    agrupadas gravadas com created_at anterior) entra na próxima execução, e nenhum é contado
+    duas vezes. Retorna a quantidade de eventos brutos consolidados.
+    """
+    consolidated = 0
+    while True:
+        if _is_postgres():
+            locked = db.session.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {'key': ROLLUP_LOCK_KEY}
+            ).scalar()
+            if not locked:
+                logger.info("Consolidação de monitoramento já em execução em outro processo")
+                break
+
+        pending = db.session.query(MonitoringEvent.id).filter(
+            MonitoringEvent.rolled_up_at.is_(None),
+            MonitoringEvent.enrollment_id.isnot(None)
+        ).order_by(MonitoringEvent.id).limit(chunk_size)
+        events = db.session.execute(
+            db.update(MonitoringEvent).where(
+                MonitoringEvent.rolled_up_at.is_(None),
+                MonitoringEvent.id.in_(pending.scalar_subquery())
+            ).values(rolled_up_at=datetime.utcnow()).returning(
+                MonitoringEvent.id,
+                MonitoringEvent.enrollment_id,
+                MonitoringEvent.event_type,
+                MonitoringEvent.event_data,
+                MonitoringEvent.created_at
+            )
+        ).all()
+        if not events:
+            db.session.commit()
+            break
+
+        totals = {}
+        for event in events:
+            activity_type = event.event_data.get('activity_type') if isinstance(event.event_data, dict) else None
+            key = (event.enrollment_id, event.event_type, str(activity_type or '')[:50])
+            total = totals.setdefault(key, {'count': 0, 'first': event.created_at,
+                                            'last': event.created_at, 'last_id': event.id})
+            # Só eventos agrupados pelo servidor valem pelo seu 'count'
+            total['count'] += event_weight(event.event_data)
+            total['first'] = min(total['first'], event.created_at)
+            total['last'] = max(total['last'], event.created_at)
+            total['last_id'] = max(total['last_id'], event.id)
+
+        existing = {
+            (rollup.enrollment_id, rollup.event_type, rollup.activity_type): rollup
+            for rollup in MonitoringEventRollup.query.filter(
+                MonitoringEventRollup.enrollment_id.in_({key[0] for key in totals})
+            ).all()
+        }
+        for key, total in totals.items():
+            rollup = existing.get(key)
+            if rollup is None:
+                rollup = MonitoringEventRollup(
+                    enrollment_id=key[0],
+                    event_type=key[1],
+                    activity_type=key[2],
+                    event_count=0,
+                    first_event_at=total['first'],
+                    last_event_id=0
+                )
+                db.session.add(rollup)
+
+            rollup.event_count += total['count']
+            if rollup.first_event_at is None or total['first'] < rollup.first_event_at:
+                rollup.first_event_at = total['first']
+            if rollup.last_event_at is None or total['last'] > rollup.last_event_at:
+                rollup.last_event_at = total['last']
+            rollup.last_event_id = max(rollup.last_event_id or 0, total['last_id'])
+            consolidated += total['count']
+
+        db.session.commit()
+        if len(events) < chunk_size:
+            break
+
+    if consolidated:
+        logger.info(f"Consolidados {consolidated} eventos de monitoramento")
+    return consolidated
+
+
+def purge_monitoring_events(retention_days, chunk_size=5000):
+    """
+    Apagar eventos brutos de provas finalizadas há mais de retention_days dias.
+    Só remove eventos já consolidados (rolled_up_at preenchido) e trabalha em lotes para não
+    segurar locks longos.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+    eligible = db.session.query(MonitoringEvent.id)\
+        .join(ExamEnrollment, MonitoringEvent.enrollment_id == ExamEnrollment.id)\
+        .join(Exam, ExamEnrollment.exam_id == Exam.id)\
+        .filter(
+            Exam.status == 'finished',
+            Exam.end_time < cutoff,
+            MonitoringEvent.rolled_up_at.isnot(None)
+        ).limit(chunk_size)
+
+    deleted = 0
+    while True:
+        event_ids = [row.id for row in eligible.all()]
+        if not event_ids:
+            break
+        MonitoringEvent.query.filter(MonitoringEvent.id.in_(event_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(event_ids)
+
+    dropped = drop_empty_partitions(cutoff)
+    if deleted or dropped:
+        logger.info(f"Retenção de monitoramento: {deleted} eventos apagados, {len(dropped)} partições removidas")
+    return deleted, dropped
+
+
+def drop_empty_partitions(cutoff):
+    """Remover partições mensais inteiramente anteriores ao corte que ficaram vazias"""
+    if not is_partitioned():
+        return []
+
+    partitions = db.session.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'monitoring_events' AND c.relname LIKE 'monitoring_events_p%'
+    """)).scalars().all()
+
+    dropped = []
+    for name in partitions:
+        try:
+            month = datetime.strptime(name[len('monitoring_events_p'):], '%Y%m')
+        except ValueError:
+            continue
+        if _next_month(month) > cutoff:
+            continue
+        if db.session.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is not None:
+            continue
+        db.session.execute(text(f"DROP TABLE {name}"))
+        db.session.commit()
+        dropped.append(name)
+    return dropped
+
+
+def run_monitoring_maintenance(config):
+    """Rotina noturna completa: partições, consolidação, retenção e buffers ociosos do detector"""
+    partitions = ensure_monitoring_partitions(config.get('MONITORING_PARTITION_MONTHS_AHEAD', 2))
+    consolidated = rollup_monitoring_events()
+    deleted, dropped = purge_monitoring_events(config.get('MONITORING_RETENTION_DAYS', 90))
+    rate_windows = 0
+    if config.get('MONITORING_DETECTOR_BACKEND', 'database') == 'database':
+        rate_windows = create_rate_detector(config).purge_idle()
+    return {
+        'partitions_ensured': partitions,
+        'events_consolidated': consolidated,
+        'events_deleted': deleted,
+        'partitions_dropped': dropped,
+        'rate_windows_deleted': rate_windows
+    }
+
+
+def main():
+    """Função principal"""
+    from app import create_app
+
+    print("🔧 Iniciando manutenção dos eventos de monitoramento...")
+
+    app = create_app()
+
+    with app.app_context():
+        try:
+            summary = run_monitoring_maintenance(app.config)
+            print(f"✅ Partições verificadas: {len(summary['partitions_ensured'])}")
+            print(f"✅ Eventos consolidados: {summary['events_consolidated']}")
+            print(f"✅ Eventos brutos apagados: {summary['events_deleted']}")
+            print(f"✅ Partições removidas: {len(summary['partitions_dropped'])}")
+            print(f"✅ Buffers ociosos do detector removidos: {summary['rate_windows_deleted']}")
+        except Exception as e:
+            print(f"❌ Erro na manutenção do monitoramento: {e}")
+            db.session.rollback()
+
+    print("🎉 Processo concluído!")
+
+
+if __name__ == '__main__':
+    main()
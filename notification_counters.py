@@ -0,0 +1,93 @@
+"""
+Contadores de notificações não lidas por usuário.
+
+O total fica em users.unread_notifications e é ajustado na mesma transação que cria,
+lê ou exclui notificações. As leituras passam por um cache em memória de curta duração,
+de modo que o polling do frontend não consulta a tabela de notificações; as entradas
+dos usuários ajustados são descartadas após o commit.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from database import db
+from models import Notification, User
+from sqlalchemy import bindparam, case, event, update
+
+# Tempo máximo que outro processo pode ver um contador desatualizado
+CACHE_TTL_SECONDS = 5
+
+_PENDING_KEY = 'notification_counters_pending'
+
+_cache = {}  # user_id -> (contador, expira_em)
+_cache_lock = threading.Lock()
+
+
+def _invalidate(user_ids):
+    """Descartar o cache dos usuários quando a transação atual for confirmada"""
+    db.session.info.setdefault(_PENDING_KEY, set()).update(int(user_id) for user_id in user_ids)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    user_ids = session.info.pop(_PENDING_KEY, None)
+    if user_ids:
+        with _cache_lock:
+            for user_id in user_ids:
+                _cache.pop(user_id, None)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_after_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def adjust_unread(deltas):
+    """
+    Somar deltas aos contadores ({user_id: delta}, aceita lista de user_ids com +1 cada).
+    Executa na transação atual; quem chama faz o commit.
+    """
+    if not isinstance(deltas, dict):
+        deltas = Counter(int(user_id) for user_id in deltas)
+    # Ordem fixa de ids: transações que ajustam os mesmos usuários travam as linhas na mesma ordem
+    params = sorted(
+        ({'b_user_id': int(user_id), 'b_delta': delta} for user_id, delta in deltas.items() if delta),
+        key=lambda row: row['b_user_id']
+    )
+    if not params:
+        return
+
+    users = User.__table__
+    new_value = users.c.unread_notifications + bindparam('b_delta')
+    db.session.execute(
+        update(users)
+        .where(users.c.id == bindparam('b_user_id'))
+        .values(unread_notifications=case((new_value > 0, new_value), else_=0)),
+        params
+    )
+    _invalidate(deltas.keys())
+
+
+def recount_unread(user_id):
+    """Recalcular o contador a partir da tabela de notificações (correção de divergências)"""
+    count = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+    User.query.filter_by(id=user_id).update({'unread_notifications': count}, synchronize_session=False)
+    _invalidate([user_id])
+    return count
+
+
+def get_unread_count(user_id, use_cache=True):
+    """Contador de não lidas do usuário (cache em memória, depois users.unread_notifications)"""
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(user_id)
+    if use_cache and cached and cached[1] > now:
+        return cached[0]
+
+    count = db.session.query(User.unread_notifications).filter(User.id == user_id).scalar() or 0
+    with _cache_lock:
+        _cache[user_id] = (count, now + CACHE_TTL_SECONDS)
+    return count
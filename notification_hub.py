@@ -0,0 +1,153 @@
+"""
+Entrega de notificações por push (SSE e long-poll).
+
+Cada processo mantém os assinantes conectados e os acorda quando uma notificação é
+criada para o seu usuário. Entre processos a coordenação é feita com LISTEN/NOTIFY do
+PostgreSQL: o pg_notify é emitido na mesma transação da notificação e só é entregue
+após o commit. No SQLite (testes/local, processo único) o aviso é local, após o commit.
+"""
+
+import threading
+
+from database import db
+from pg_channels import channels_available, notify_channel, start_channel_listener
+from sqlalchemy import event
+
+CHANNEL = 'notifications'
+
+# Limite de bytes do payload do pg_notify é 8000; ids são enviados em blocos
+PAYLOAD_CHUNK = 500
+
+_PENDING_KEY = 'notification_hub_pending'
+
+
+class HubFull(Exception):
+    """Limite de conexões de push deste processo atingido"""
+
+
+class Subscription:
+    def __init__(self, hub, user_id):
+        self.hub = hub
+        self.user_id = int(user_id)
+        self.event = threading.Event()
+
+    def wait(self, timeout):
+        """Aguardar uma nova notificação; retorna True se foi acordado"""
+        woke = self.event.wait(timeout)
+        self.event.clear()
+        return woke
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NotificationHub:
+    def __init__(self):
+        self.max_connections = 200
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set(Subscription)
+        self._connections = 0
+        self._listener = None
+        self._listener_stop = threading.Event()
+        self._app = None
+
+    def init_app(self, app):
+        self._app = app
+        self.max_connections = app.config.get('NOTIFICATION_STREAM_MAX_CONNECTIONS', 200)
+
+    @property
+    def connections(self):
+        return self._connections
+
+    def subscribe(self, user_id):
+        """Registrar uma conexão (levanta HubFull se o limite do processo foi atingido)"""
+        self._ensure_listener()
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            if self._connections >= self.max_connections:
+                raise HubFull()
+            self._connections += 1
+            self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self._connections -= 1
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def wake(self, user_ids):
+        """Acordar os assinantes locais dos usuários informados"""
+        with self._lock:
+            subscriptions = [s for user_id in set(user_ids) for s in self._subscribers.get(int(user_id), ())]
+        for subscription in subscriptions:
+            subscription.event.set()
+
+    def announce(self, user_ids):
+        """
+        Avisar que há notificações novas para os usuários (chamar dentro da transação).
+        O aviso só é entregue após o commit.
+        """
+        user_ids = sorted({int(user_id) for user_id in user_ids})
+        if not user_ids:
+            return
+        db.session.info.setdefault(_PENDING_KEY, set()).update(user_ids)
+        if channels_available():
+            for start in range(0, len(user_ids), PAYLOAD_CHUNK):
+                payload = ','.join(str(user_id) for user_id in user_ids[start:start + PAYLOAD_CHUNK])
+                notify_channel(CHANNEL, payload)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': self._connections,
+                'max_connections': self.max_connections,
+                'subscribed_users': len(self._subscribers),
+                'listener': bool(self._listener and self._listener.is_alive())
+            }
+
+    # LISTEN/NOTIFY entre processos (PostgreSQL)
+
+    def _ensure_listener(self):
+        if self._listener or self._app is None:
+            return
+        with self._lock:
+            if self._listener:
+                return
+            self._listener = start_channel_listener(
+                self._app, CHANNEL, self._on_payloads,
+                name='notification-hub-listener', stop=self._listener_stop
+            )
+
+    def _on_payloads(self, payloads):
+        self.wake(int(user_id) for payload in payloads for user_id in payload.split(',') if user_id)
+
+
+hub = NotificationHub()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_after_commit(session):
+    user_ids = session.info.pop(_PENDING_KEY, None)
+    if user_ids:
+        hub.wake(user_ids)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_after_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def init_notification_hub(app):
+    hub.init_app(app)
+    return hub
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Outbox transacional de notificações.
+
+Os notify_* apenas registram um evento em notification_outbox na mesma transação da
+mudança que o originou (finalizar prova, aprovar matrícula, monitoramento). Um
+despachante fora da requisição renderiza títulos/mensagens e cria as notificações em lote.
+
+O despachante roda em uma thread do processo (iniciada no primeiro evento enfileirado)
+e também pode ser executado via cron: python notification_outbox.py
+"""
+
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import db
+from flask import current_app
+from models import NotificationOutbox
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Eventos que falharam esse número de vezes ficam na tabela para análise
+MAX_ATTEMPTS = 5
+
+_PENDING_KEY = 'notification_outbox_pending'
+
+_renderers = {}
+
+
+def outbox_renderer(event_type):
+    """
+    Registrar a função que transforma o payload de um evento em notificações
+    (lista de dicts aceita por add_notifications_bulk)
+    """
+    def decorator(func):
+        _renderers[event_type] = func
+        return func
+    return decorator
+
+
+def enqueue_notification(event_type, **payload):
+    """Registrar um evento na transação atual; quem chama faz o commit"""
+    db.session.add(NotificationOutbox(event_type=event_type, payload=payload))
+    db.session.info[_PENDING_KEY] = True
+
+
+def dispatch_outbox(batch_size=200):
+    """
+    Processar um lote de eventos pendentes; retorna quantos eventos foram processados.
+    Se a gravação das notificações falhar, nenhum evento do lote é marcado e a tentativa
+    é registrada em cada um (transação separada), até MAX_ATTEMPTS.
+    """
+    from routes import add_notifications_bulk
+
+    query = NotificationOutbox.query.filter(
+        NotificationOutbox.processed_at.is_(None),
+        NotificationOutbox.attempts < MAX_ATTEMPTS
+    ).order_by(NotificationOutbox.id).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        # Vários processos podem despachar ao mesmo tempo sem pegar os mesmos eventos
+        query = query.with_for_update(skip_locked=True)
+    entries = query.all()
+    if not entries:
+        db.session.rollback()
+        return 0
+
+    items = []
+    processed = 0
+    now = datetime.utcnow()
+    for entry in entries:
+        renderer = _renderers.get(entry.event_type)
+        try:
+            if renderer is None:
+                raise ValueError(f'Tipo de evento sem renderizador: {entry.event_type}')
+            with db.session.begin_nested():
+                items.extend(renderer(entry.payload or {}))
+            entry.processed_at = now
+            processed += 1
+        except Exception as e:
+            entry.attempts = (entry.attempts or 0) + 1
+            entry.last_error = str(e)[:1000]
+            logger.warning("Outbox: falha ao renderizar evento %s (%s): %s", entry.id, entry.event_type, e)
+
+    # As notificações e a marcação dos eventos são gravadas no mesmo commit
+    entry_ids = [entry.id for entry in entries]
+    try:
+        add_notifications_bulk(items)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Outbox: falha ao gravar notificações do lote: %s", e)
+        _record_failure(entry_ids, e)
+        return 0
+    return processed
+
+
+def _record_failure(entry_ids, error):
+    """Registrar a tentativa que falhou nos eventos (fora da transação desfeita)"""
+    try:
+        NotificationOutbox.query.filter(NotificationOutbox.id.in_(entry_ids)).update({
+            'attempts': NotificationOutbox.attempts + 1,
+            'last_error': str(error)[:1000]
+        }, synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Outbox: erro ao registrar falha dos eventos %s: %s", entry_ids, e)
+
+
+def drain_outbox(batch_size=200):
+    """Processar lotes até esvaziar a fila (ou até um lote ter falhas)"""
+    total = 0
+    while True:
+        processed = dispatch_outbox(batch_size)
+        total += processed
+        if processed < batch_size:
+            return total
+
+
+def purge_outbox(retention_days=7):
+    """Remover eventos já processados há mais de retention_days"""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = NotificationOutbox.query.filter(
+        NotificationOutbox.processed_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+class OutboxDispatcher:
+    """Thread de despacho do processo: acordada após commits com eventos novos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_purge = 0.0
+
+    def wake(self, app):
+        if not app.config.get('NOTIFICATION_OUTBOX_DISPATCHER', True):
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, args=(app,), name='notification-outbox', daemon=True
+                    )
+                    self._thread.start()
+        self._wakeup.set()
+
+    def _run(self, app):
+        interval = app.config.get('NOTIFICATION_OUTBOX_INTERVAL_SECONDS', 5)
+        batch_size = app.config.get('NOTIFICATION_OUTBOX_BATCH_SIZE', 200)
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            with app.app_context():
+                try:
+                    drain_outbox(batch_size)
+                    if time.monotonic() - self._last_purge > 3600:
+                        self._last_purge = time.monotonic()
+                        purge_outbox()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error("Outbox: erro no despacho: %s", e)
+                finally:
+                    db.session.remove()
+
+
+dispatcher = OutboxDispatcher()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_dispatcher(session):
+    if session.info.pop(_PENDING_KEY, None):
+        dispatcher.wake(current_app._get_current_object())
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        print("📨 Despachando outbox de notificações...")
+        processed = drain_outbox(app.config.get('NOTIFICATION_OUTBOX_BATCH_SIZE', 200))
+        deleted = purge_outbox()
+        print(f"✅ {processed} eventos processados, {deleted} eventos antigos removidos")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Retenção e compactação da tabela notifications:
+- exclusão de notificações lidas mais antigas que o limite
+- remoção de duplicatas (mesmo usuário, tipo, título e mensagem criadas em sequência, dentro
+  de uma janela curta), mantendo a mais recente
+
+Tudo é feito em blocos pequenos, cada um na sua transação, para não segurar locks longos.
+Execute diariamente (cron): python notification_retention.py
+"""
+
+import logging
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+from database import db
+from models import Notification
+from notification_counters import adjust_unread
+from sqlalchemy.orm import aliased
+
+logger = logging.getLogger(__name__)
+
+
+def purge_read_notifications(retention_days, chunk_size=1000):
+    """Excluir notificações lidas criadas antes de retention_days; retorna quantas foram excluídas"""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = [row_id for (row_id,) in db.session.query(Notification.id).filter(
+            Notification.id > last_id,
+            Notification.is_read == True,
+            Notification.created_at < cutoff
+        ).order_by(Notification.id).limit(chunk_size).all()]
+        if not ids:
+            break
+        Notification.query.filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        last_id = ids[-1]
+    return deleted
+
+
+def _plus_minutes(column, minutes):
+    if db.engine.dialect.name == 'postgresql':
+        return column + timedelta(minutes=minutes)
+    # SQLite: mesmo formato de texto gravado pelo SQLAlchemy, comparável com a coluna
+    return db.func.strftime('%Y-%m-%d %H:%M:%f000', column, f'+{int(minutes)} minutes')
+
+
+def collapse_duplicate_notifications(window_minutes=60, chunk_size=1000):
+    """
+    Excluir notificações repetidas em rajada: uma notificação é removida quando o usuário
+    recebeu outra igual (tipo, título e mensagem) até window_minutes depois. Repetições
+    legítimas mais espaçadas (ex.: alertas do mesmo aluno em dias diferentes) são mantidas.
+    A busca da cópia mais nova usa o índice (user_id, type, created_at); notificações sem
+    created_at não são compactadas. Duplicatas não lidas também descontam do contador.
+    """
+    newer = aliased(Notification)
+    has_newer_copy = db.session.query(newer.id).filter(
+        newer.user_id == Notification.user_id,
+        newer.type == Notification.type,
+        newer.created_at >= Notification.created_at,
+        newer.created_at <= _plus_minutes(Notification.created_at, window_minutes),
+        newer.id > Notification.id,
+        newer.title == Notification.title,
+        newer.message == Notification.message
+    ).exists()
+
+    deleted = 0
+    last_id = 0
+    while True:
+        # Cursor por id: cada bloco continua de onde o anterior parou
+        chunk = db.session.query(Notification.id).filter(
+            Notification.id > last_id
+        ).order_by(Notification.id).limit(chunk_size).subquery()
+        rows = db.session.query(Notification.id, Notification.user_id, Notification.is_read).filter(
+            Notification.id.in_(db.select(chunk.c.id)),
+            has_newer_copy
+        ).all()
+        last_id = db.session.query(db.func.max(chunk.c.id)).scalar()
+        if last_id is None:
+            break
+        if not rows:
+            continue
+        Notification.query.filter(
+            Notification.id.in_([row.id for row in rows])
+        ).delete(synchronize_session=False)
+        unread_deltas = Counter()
+        for row in rows:
+            if not row.is_read:
+                unread_deltas[row.user_id] -= 1
+        adjust_unread(dict(unread_deltas))
+        db.session.commit()
+        deleted += len(rows)
+    db.session.commit()
+    return deleted
+
+
+def compact_notifications(retention_days=90, duplicate_window_minutes=60, chunk_size=1000):
+    """Executar a retenção e a compactação; retorna um resumo"""
+    summary = {
+        'read_notifications_deleted': purge_read_notifications(retention_days, chunk_size),
+        'duplicates_deleted': collapse_duplicate_notifications(duplicate_window_minutes, chunk_size)
+    }
+    logger.info("Compactação de notificações: %s", summary)
+    return summary
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        print("🧹 Compactando notificações...")
+        summary = compact_notifications(
+            app.config.get('NOTIFICATION_READ_RETENTION_DAYS', 90),
+            app.config.get('NOTIFICATION_DUPLICATE_WINDOW_MINUTES', 60)
+        )
+        print(f"✅ {summary['read_notifications_deleted']} notificações lidas antigas excluídas")
+        print(f"✅ {summary['duplicates_deleted']} notificações duplicadas excluídas")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
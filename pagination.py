@@ -0,0 +1,58 @@
+"""
+Paginação por cursor (keyset).
+
+O cursor é "<created_at ISO>,<id>" da última linha da página: a próxima página começa
+estritamente depois dele na ordenação (coluna, id), usando o índice composto em vez de OFFSET.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return f'{value},{row_id}'
+
+
+def parse_cursor(cursor, cast=datetime.fromisoformat):
+    """Converter "<valor>,<id>" em (valor, id); levanta ValueError se inválido"""
+    value, _, row_id = (cursor or '').rpartition(',')
+    if not value or not row_id:
+        raise ValueError('Cursor inválido')
+    return cast(value), int(row_id)
+
+
+def page_size(limit, default=20):
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=20, descending=True, cast=datetime.fromisoformat):
+    """
+    Aplicar o cursor e a ordenação (sort_column, id_column) à consulta e buscar uma página.
+    Retorna (linhas, próximo cursor ou None).
+    """
+    if cursor:
+        position = tuple_(*parse_cursor(cursor, cast))
+        key = tuple_(sort_column, id_column)
+        query = query.filter(key < position if descending else key > position)
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
@@ -0,0 +1,103 @@
+"""
+Hash e verificação de senhas fora da thread da requisição.
+
+O KDF (scrypt/pbkdf2) é caro de propósito: executado na thread da requisição, ele limita
+quantos logins cada worker atende quando uma turma inteira entra no início da prova.
+O cálculo roda em um pool de processos limitado (PASSWORD_HASH_WORKERS), sem disputar o
+GIL com as demais requisições. Com PASSWORD_HASH_WORKERS = 0 o hash é feito na própria thread.
+
+Quando PASSWORD_HASH_METHOD muda, o hash antigo continua válido e é refeito no próximo login.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import (DEFAULT_PBKDF2_ITERATIONS, check_password_hash,
+                               generate_password_hash)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+_settings = {
+    'method': DEFAULT_METHOD,
+    'prefix': None,
+    'workers': 0,
+    'timeout': 10,
+}
+_pool = None
+_pool_pid = None
+_lock = threading.Lock()
+
+
+def init_passwords(app):
+    """Ler PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS e PASSWORD_HASH_TIMEOUT_SECONDS"""
+    method = app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+    _settings.update(
+        method=method,
+        prefix=hash_prefix(method),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 0),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT_SECONDS', 10),
+    )
+
+
+def hash_prefix(method):
+    """
+    Prefixo que o werkzeug grava no hash para o método, com os parâmetros omitidos
+    preenchidos pelos padrões ('scrypt' -> 'scrypt:32768:8:1'), sem calcular um hash.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        args = ['32768', '8', '1']
+    elif name == 'pbkdf2':
+        args = (args or ['sha256'])[:2]
+        if len(args) == 1:
+            args.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ':'.join([name] + args)
+
+
+def _get_pool():
+    """Pool criado sob demanda em cada processo (após o fork dos workers do servidor)"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _lock:
+            if _pool is None or _pool_pid != os.getpid():
+                # spawn: o processo do app tem threads (outbox, push), fork não é seguro
+                _pool = ProcessPoolExecutor(
+                    max_workers=_settings['workers'],
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _run(func, *args):
+    if not _settings['workers']:
+        return func(*args)
+    return _get_pool().submit(func, *args).result(timeout=_settings['timeout'])
+
+
+def hash_password(password):
+    """Gerar o hash com o método configurado"""
+    return _run(generate_password_hash, password, _settings['method'])
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Hash gerado com método/parâmetros diferentes dos configurados"""
+    prefix = _settings['prefix'] or hash_prefix(_settings['method'])
+    return password_hash.split('$', 1)[0] != prefix
+
+
+def shutdown_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,75 @@
+"""
+Canais LISTEN/NOTIFY do PostgreSQL para coordenar os processos da aplicação.
+
+O aviso é emitido com notify_channel() dentro da transação e só é entregue após o commit. Cada
+processo interessado mantém uma thread ouvindo o canal (start_channel_listener). Fora do
+PostgreSQL (SQLite em testes/local, processo único) não há o que coordenar e os
+chamadores tratam o próprio processo diretamente.
+"""
+
+import logging
+import threading
+import time
+
+from database import db
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+def channels_available():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def notify_channel(channel, payload):
+    """Emitir o aviso na transação atual (entregue aos ouvintes após o commit)"""
+    if channels_available():
+        db.session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                           {'channel': channel, 'payload': payload})
+
+
+def start_channel_listener(app, channel, handler, name, stop=None):
+    """
+    Iniciar a thread que entrega a handler(payloads) os avisos recebidos no canal.
+    Retorna a thread, ou None fora do PostgreSQL.
+    """
+    with app.app_context():
+        if not channels_available():
+            return None
+        url = db.engine.url
+        connect_args = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('connect_args', {})
+    thread = threading.Thread(
+        target=_listen_loop, args=(url, connect_args, channel, handler, stop or threading.Event()),
+        name=name, daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _listen_loop(url, connect_args, channel, handler, stop):
+    import select
+
+    import psycopg2
+    import psycopg2.extensions
+
+    params = url.translate_connect_args(username='user', database='dbname')
+    while not stop.is_set():
+        try:
+            conn = psycopg2.connect(**params, **connect_args)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {channel}")
+            logger.info("Ouvindo o canal '%s'", channel)
+
+            while not stop.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                payloads = []
+                while conn.notifies:
+                    payloads.append(conn.notifies.pop(0).payload)
+                if payloads:
+                    handler(payloads)
+        except Exception as e:
+            logger.warning("Conexão LISTEN do canal '%s' perdida (%s), reconectando", channel, e)
+            time.sleep(5)
@@ -0,0 +1,42 @@
+"""
+Busca textual no banco de questões (enunciado e categoria).
+
+PostgreSQL: to_tsvector('portuguese', ...) coberto pelo índice GIN idx_questions_search,
+com relevância por ts_rank_cd. SQLite (desenvolvimento/testes): tabela FTS5 questions_fts,
+com relevância por bm25. Nos dois casos a relevância é "maior é melhor", para a paginação
+por cursor (relevância, id) em ordem decrescente.
+"""
+
+import re
+
+from database import db
+from models import QUESTION_SEARCH_DOCUMENT, Question
+
+_fts = db.table('questions_fts', db.column('rowid'), db.column('rank'))
+_TERM = re.compile(r'\w+')
+
+
+def search_terms(text):
+    return _TERM.findall(text or '')
+
+
+def apply_question_search(query, text):
+    """Filtrar a consulta pelos termos buscados; retorna (consulta, expressão de relevância)"""
+    if db.engine.dialect.name == 'postgresql':
+        # Mesma expressão do índice; websearch_to_tsquery aceita qualquer texto digitado
+        document = db.literal_column(QUESTION_SEARCH_DOCUMENT)
+        tsquery = db.func.websearch_to_tsquery(db.literal_column("'portuguese'"), text)
+        query = query.filter(document.op('@@')(tsquery))
+        # float8: o valor devolvido no cursor é comparado sem perda de precisão
+        return query, db.cast(db.func.ts_rank_cd(document, tsquery), db.Float)
+
+    # FTS5: cada termo entre aspas (sem operadores vindos do usuário), todos obrigatórios
+    terms = search_terms(text)
+    if not terms:
+        return query.filter(db.false()), db.literal(0.0)
+    match = ' '.join(f'"{term}"' for term in terms)
+    query = query.join(_fts, _fts.c.rowid == Question.id).filter(
+        db.literal_column('questions_fts').op('MATCH')(match)
+    )
+    # bm25 (coluna rank) é negativo: quanto menor, mais relevante
+    return query, -_fts.c.rank
@@ -0,0 +1,437 @@
+"""
+Cache de respostas GET com invalidação por versão de entidade.
+
+A chave de uma resposta é (endpoint, escopo do usuário, query string, versões das entidades
+de que ela depende, como exam:<id> e user:<id>). Gravações não apagam entradas: quando uma
+transação que alterou provas, turmas, matrículas ou questões é confirmada, as versões
+afetadas são incrementadas e as respostas antigas deixam de ser encontradas (saem do LRU
+com o tempo).
+
+Os incrementos vêm de eventos da sessão: after_flush calcula as chaves afetadas pelos
+objetos gravados e after_commit aplica, então toda rota de escrita invalida o que alterou.
+Operações em massa (query.update()/delete()) não passam pelos eventos: a rota chama
+invalidate(...) antes delas.
+
+Resultados de alunos: uma matrícula incrementa só user:<aluno>. Os resultados vistos pelos
+professores (get_teacher_results) dependem de results:<professor>, incrementado apenas
+quando um resultado finalizado muda e agrupado por janela (ResultVersionBatcher): uma turma
+finalizando a prova junta não disputa as mesmas linhas de cache_versions a cada commit.
+
+Backends (RESPONSE_CACHE_BACKEND):
+- database: LRU no processo + versões na tabela cache_versions, compartilhadas entre
+  processos e servidores (uma consulta de versões por requisição no lugar da consulta da rota)
+- memory: LRU e versões no processo (processo único: testes e desenvolvimento local)
+- none: cache desativado
+Outro backend compartilhado (ex.: Redis) implementa get/set/get_versions/bump_versions/stats
+e é passado em init_response_cache(app, backend).
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from itertools import chain
+
+from database import db
+from decorators import current_principal
+from flask import current_app, request
+from models import (Alternative, CacheVersion, Class, ClassEnrollment, Exam,
+                    ExamEnrollment, ExamQuestion, Question)
+from sqlalchemy import event, inspect, select, union
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = 'response_cache_keys'
+_PENDING_RESULTS_KEY = 'response_cache_result_exams'
+
+
+class LRUCache:
+    """Entradas limitadas por quantidade e por tempo de vida"""
+
+    def __init__(self, max_entries=5000, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # chave -> (valor, expira_em)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class MemoryCacheBackend:
+    """Entradas e versões no processo"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=5000, ttl_seconds=300):
+        self.entries = LRUCache(max_entries, ttl_seconds)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries.set(key, value)
+
+    def get_versions(self, keys):
+        with self._lock:
+            return [self._versions.get(key, 0) for key in keys]
+
+    def bump_versions(self, keys):
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'entries': len(self.entries),
+            'max_entries': self.entries.max_entries,
+            'ttl_seconds': self.entries.ttl_seconds
+        }
+
+
+class DatabaseCacheBackend(MemoryCacheBackend):
+    """Entradas no processo, versões na tabela cache_versions"""
+
+    name = 'database'
+
+    def get_versions(self, keys):
+        versions = dict(db.session.query(CacheVersion.key, CacheVersion.version).filter(
+            CacheVersion.key.in_(keys)
+        ).all())
+        return [versions.get(key, 0) for key in keys]
+
+    def bump_versions(self, keys):
+        # Chamado após o commit: transação própria e curta, sem segurar locks da gravação
+        table = CacheVersion.__table__
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise RuntimeError(f'Backend database do cache não suporta {dialect}')
+        statement = dialect_insert(table).on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={'version': table.c.version + 1}
+        )
+        with db.engine.begin() as connection:
+            connection.execute(statement, [{'key': key, 'version': 1} for key in sorted(keys)])
+
+
+# Chaves de versão afetadas por cada modelo gravado. As consultas auxiliares usam a conexão
+# da transação (dentro do flush não é possível usar a sessão).
+
+def _class_audience(connection, class_id):
+    """Instrutor, alunos (qualquer status) e criadores de provas da turma"""
+    rows = connection.execute(union(
+        select(Class.instructor_id).where(Class.id == class_id),
+        select(ClassEnrollment.student_id).where(ClassEnrollment.class_id == class_id),
+        select(Exam.created_by).where(Exam.class_id == class_id)
+    )).scalars()
+    return {f'user:{user_id}' for user_id in rows if user_id is not None}
+
+
+def _exam_keys(connection, exam_id, created_by=None, class_id=None):
+    if created_by is None:
+        row = connection.execute(
+            select(Exam.created_by, Exam.class_id).where(Exam.id == exam_id)
+        ).first()
+        if row is None:
+            return {f'exam:{exam_id}'}
+        created_by, class_id = row
+    keys = {f'exam:{exam_id}', f'user:{created_by}'}
+    if class_id:
+        keys |= _class_audience(connection, class_id)
+    return keys
+
+
+def _question_keys(connection, question_id, exam_id=None):
+    """Provas que exibem a questão (get_exam serializa enunciado e alternativas)"""
+    exam_ids = set(connection.execute(
+        select(ExamQuestion.exam_id).where(ExamQuestion.question_id == question_id)
+    ).scalars())
+    if exam_id:
+        exam_ids.add(exam_id)
+    return {f'exam:{exam_id}' for exam_id in exam_ids}
+
+
+def _enrollment_keys(connection, student_id):
+    """Professores não: os resultados deles vêm de results:<id> (_result_exam_ids)"""
+    return {f'user:{student_id}'}
+
+
+def _result_keys(connection, exam_ids):
+    """results:<id> do criador e do instrutor da turma de cada prova"""
+    rows = connection.execute(
+        select(Exam.created_by, Class.instructor_id)
+        .outerjoin(Class, Exam.class_id == Class.id)
+        .where(Exam.id.in_(sorted(exam_ids)))
+    )
+    return {f'results:{user_id}' for row in rows for user_id in row if user_id is not None}
+
+
+def _class_enrollment_keys(connection, student_id, class_id):
+    keys = {f'user:{student_id}'}
+    instructor_id = connection.execute(
+        select(Class.instructor_id).where(Class.id == class_id)
+    ).scalar()
+    if instructor_id is not None:
+        keys.add(f'user:{instructor_id}')
+    return keys
+
+
+def _class_keys(connection, class_id, instructor_id):
+    return _class_audience(connection, class_id) | {f'user:{instructor_id}'}
+
+
+# modelo -> (argumentos que identificam o que foi afetado, função que calcula as chaves);
+# objetos com os mesmos argumentos (ex.: várias questões da mesma prova) são resolvidos uma vez
+_RESOLVERS = {
+    Exam: (lambda exam: (exam.id, exam.created_by, exam.class_id), _exam_keys),
+    ExamQuestion: (lambda exam_question: (exam_question.exam_id,), _exam_keys),
+    Question: (lambda question: (question.id, question.exam_id), _question_keys),
+    Alternative: (lambda alternative: (alternative.question_id,), _question_keys),
+    ExamEnrollment: (lambda enrollment: (enrollment.student_id,), _enrollment_keys),
+    Class: (lambda class_obj: (class_obj.id, class_obj.instructor_id), _class_keys),
+    ClassEnrollment: (lambda enrollment: (enrollment.student_id, enrollment.class_id), _class_enrollment_keys),
+}
+
+
+def _result_exam_ids(objects):
+    """Provas das matrículas que entram, saem ou alteram um resultado finalizado"""
+    return {
+        obj.exam_id for obj in objects
+        if type(obj) is ExamEnrollment and (
+            obj.status == 'completed' or 'completed' in inspect(obj).attrs.status.history.deleted
+        )
+    }
+
+
+class ResultVersionBatcher:
+    """
+    Incrementos de results:<professor> agrupados por janela: as provas finalizadas/corrigidas
+    no intervalo são resolvidas em uma consulta e cada chave é incrementada uma vez ao fim da
+    janela. O professor vê um resultado novo com até window_seconds de atraso; com 0 o
+    incremento é imediato. Pendências de um processo encerrado ficam para o TTL.
+    """
+
+    def __init__(self, app, backend, window_seconds=1):
+        self.app = app
+        self.backend = backend
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._exam_ids = set()
+        self._timer = None
+
+    def add(self, exam_ids):
+        if not self.window_seconds:
+            self._bump(exam_ids)
+            return
+        with self._lock:
+            self._exam_ids |= exam_ids
+            if self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self._flush_in_app)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Incrementar agora as chaves pendentes"""
+        with self._lock:
+            exam_ids, self._exam_ids = self._exam_ids, set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if exam_ids:
+            self._bump(exam_ids)
+
+    def _flush_in_app(self):
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Erro ao incrementar versões de resultados no cache de respostas: %s", e)
+
+    def _bump(self, exam_ids):
+        with db.engine.connect() as connection:
+            keys = _result_keys(connection, exam_ids)
+        if keys:
+            self.backend.bump_versions(keys)
+
+
+def _resolve(connection, objects):
+    targets = set()
+    for obj in objects:
+        arguments, resolver = _RESOLVERS[type(obj)]
+        targets.add((resolver, arguments(obj)))
+    keys = set()
+    for resolver, arguments in targets:
+        keys |= resolver(connection, *arguments)
+    return keys
+
+
+_backend = None
+_result_batcher = None
+_listening = False
+_stats = {}  # endpoint -> [acertos, faltas]
+_stats_lock = threading.Lock()
+
+
+def init_response_cache(app, backend=None):
+    """Criar o backend configurado em RESPONSE_CACHE_BACKEND ('database', 'memory' ou 'none')"""
+    global _backend, _result_batcher, _listening
+    if backend is None:
+        name = app.config.get('RESPONSE_CACHE_BACKEND', 'database')
+        max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 5000)
+        ttl_seconds = app.config.get('RESPONSE_CACHE_TTL_SECONDS', 300)
+        if name == 'database':
+            backend = DatabaseCacheBackend(max_entries, ttl_seconds)
+        elif name == 'memory':
+            backend = MemoryCacheBackend(max_entries, ttl_seconds)
+        elif name != 'none':
+            raise ValueError(f'RESPONSE_CACHE_BACKEND inválido: {name}')
+    _backend = backend
+    _result_batcher = ResultVersionBatcher(
+        app, backend, app.config.get('RESPONSE_CACHE_RESULTS_WINDOW_SECONDS', 1)
+    ) if backend is not None else None
+
+    if not _listening:
+        event.listen(db.session, 'after_flush', _collect_versions)
+        event.listen(db.session, 'after_commit', _bump_versions)
+        event.listen(db.session, 'after_rollback', _discard_versions)
+        _listening = True
+    return _backend
+
+
+def invalidate(*targets):
+    """Incrementar no commit as versões de objetos (ex.: antes de um delete em massa) ou chaves"""
+    if _backend is None:
+        return
+    pending = db.session.info.setdefault(_PENDING_KEY, set())
+    pending.update(target for target in targets if isinstance(target, str))
+    objects = [target for target in targets if not isinstance(target, str)]
+    if objects:
+        pending |= _resolve(db.session.connection(), objects)
+        db.session.info.setdefault(_PENDING_RESULTS_KEY, set()).update(_result_exam_ids(objects))
+
+
+def _collect_versions(session, flush_context):
+    if _backend is None:
+        return
+    changed = [
+        obj for obj in chain(session.new, session.dirty, session.deleted)
+        if type(obj) in _RESOLVERS and (obj not in session.dirty or session.is_modified(obj))
+    ]
+    if not changed:
+        return
+    session.info.setdefault(_PENDING_KEY, set()).update(_resolve(session.connection(), changed))
+    exam_ids = _result_exam_ids(changed)
+    if exam_ids:
+        session.info.setdefault(_PENDING_RESULTS_KEY, set()).update(exam_ids)
+
+
+def _bump_versions(session):
+    keys = session.info.pop(_PENDING_KEY, None)
+    exam_ids = session.info.pop(_PENDING_RESULTS_KEY, None)
+    if _backend is None:
+        return
+    try:
+        if keys:
+            _backend.bump_versions(keys)
+        if exam_ids:
+            _result_batcher.add(exam_ids)
+    except Exception as e:
+        # As respostas afetadas ficam desatualizadas até o TTL
+        logger.error("Erro ao incrementar versões do cache de respostas: %s", e)
+
+
+def _discard_versions(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_PENDING_RESULTS_KEY, None)
+
+
+def _record(endpoint, hit):
+    with _stats_lock:
+        counters = _stats.setdefault(endpoint, [0, 0])
+        counters[0 if hit else 1] += 1
+
+
+def cached_response(dependencies, shared=False):
+    """
+    Cachear as respostas JSON 200 da rota (abaixo de @jwt_required e das verificações de acesso).
+    dependencies(principal, **kwargs) retorna as chaves de versão da resposta, ou None para
+    não usar o cache nesta requisição. shared=True: resposta igual para todos os usuários.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if _backend is None:
+                return f(*args, **kwargs)
+            principal = current_principal()
+            keys = dependencies(principal, **kwargs)
+            if keys is None:
+                return f(*args, **kwargs)
+
+            try:
+                versions = _backend.get_versions(keys)
+            except Exception as e:
+                db.session.rollback()
+                logger.warning("Cache de respostas indisponível: %s", e)
+                return f(*args, **kwargs)
+
+            scope = 'shared' if shared else f'{principal.role}:{principal.id}'
+            arguments = '&'.join(sorted(f'{name}={value}' for name, value in request.args.items(multi=True)))
+            cache_key = '|'.join(
+                [request.endpoint, scope, arguments] +
+                [f'{key}@{version}' for key, version in zip(keys, versions)]
+            )
+
+            body = _backend.get(cache_key)
+            _record(request.endpoint, hit=body is not None)
+            if body is not None:
+                return current_app.response_class(body, status=200, mimetype='application/json')
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed and response.is_json:
+                _backend.set(cache_key, response.get_data())
+            return response
+        return decorated_function
+    return decorator
+
+
+def cache_stats():
+    """Acertos/faltas por endpoint neste processo e ocupação do LRU"""
+    with _stats_lock:
+        endpoints = {
+            endpoint: {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0
+            }
+            for endpoint, (hits, misses) in sorted(_stats.items())
+        }
+    summary = _backend.stats() if _backend is not None else {'backend': 'none'}
+    return dict(summary, endpoints=endpoints)
@@ -1,18 +1,72 @@
+import json
+import logging
 import secrets
+import time
 from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
 
-from database import db
-from decorators import on_exam_access, smart_update_expired_exams
-from flask import jsonify, request
+from flask import Response, current_app, jsonify, request, stream_with_context
 from flask_jwt_extended import (create_access_token, create_refresh_token,
-                                get_jwt, get_jwt_identity, jwt_required)
+                                decode_token, get_jwt, get_jwt_identity,
+                                jwt_required)
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
+
+from batch_loading import load_related
+from database import db
+from decorators import (current_principal, on_exam_access, principal_claims,
+                        role_required, smart_update_expired_exams)
 from models import (Alternative, Answer, Class, ClassEnrollment, Exam,
                     ExamEnrollment, ExamQuestion, MonitoringEvent,
-                    Notification, PlatformEvaluation, Question, User)
-from werkzeug.security import check_password_hash, generate_password_hash
+                    MonitoringEventRollup, Notification, PlatformEvaluation,
+                    Question, User)
+from monitoring import (MonitoringEventThrottle, create_rate_detector, event_weight,
+                        sanitize_event_data)
+from notification_counters import adjust_unread, get_unread_count, recount_unread
+from notification_hub import HubFull, hub
+from notification_outbox import enqueue_notification, outbox_renderer
+from pagination import keyset_page, page_size
+from passwords import hash_password, needs_rehash, verify_password
+from question_search import apply_question_search
+from response_cache import cache_stats, cached_response, invalidate
+from token_store import get_token_store
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKEN_EXPIRES = timedelta(days=7)
+
+
+def issue_refresh_token(user_id):
+    """Criar refresh token (7 dias) e registrá-lo no armazenamento de tokens válidos"""
+    refresh_token = create_refresh_token(identity=user_id, expires_delta=REFRESH_TOKEN_EXPIRES)
+    decoded = decode_token(refresh_token)
+    get_token_store().add(decoded['jti'], user_id, datetime.utcfromtimestamp(decoded['exp']))
+    return refresh_token
+
+
+def _stream_ticket_serializer():
+    return URLSafeTimedSerializer(current_app.config['JWT_SECRET_KEY'], salt='notification-stream')
+
+
+def issue_stream_ticket(user_id):
+    """
+    Ticket curto e de uso exclusivo do stream de notificações. EventSource não envia cabeçalhos,
+    então ele vai na URL no lugar do access token (que acabaria nos logs de proxies e servidores).
+    """
+    return _stream_ticket_serializer().dumps({'user_id': int(user_id)})
+
+
+def read_stream_ticket(ticket):
+    """Usuário do ticket, ou None se ele for inválido ou tiver expirado"""
+    try:
+        data = _stream_ticket_serializer().loads(
+            ticket, max_age=current_app.config.get('NOTIFICATION_STREAM_TICKET_SECONDS', 60)
+        )
+    except BadSignature:
+        return None
+    return data.get('user_id') if isinstance(data, dict) else None
 
-# Armazenar refresh tokens válidos (em produção, usar Redis)
-valid_refresh_tokens = set()
 
 def analyze_suspicious_behavior(events):
     """Analisar padrões suspeitos nos eventos de monitoramento"""
@@ -22,11 +76,14 @@ def analyze_suspicious_behavior(events):
     patterns = []
     risk_score = 0
     
-    # Contar tipos de atividades suspeitas
+    # Contar tipos de atividades suspeitas (eventos agrupados valem pelo seu 'count')
     activity_counts = {}
+    total_events = 0
     for event in events:
         activity_type = event.event_data.get('activity_type', 'unknown')
-        activity_counts[activity_type] = activity_counts.get(activity_type, 0) + 1
+        weight = event_weight(event.event_data)
+        activity_counts[activity_type] = activity_counts.get(activity_type, 0) + weight
+        total_events += weight
     
     # Analisar padrões específicos
     if activity_counts.get('excessive_tab_switching', 0) > 3:
@@ -72,7 +129,7 @@ def analyze_suspicious_behavior(events):
         'patterns': patterns,
         'recommendations': recommendations,
         'activity_counts': activity_counts,
-        'total_events': len(events)
+        'total_events': total_events
     }
 
 
@@ -86,7 +143,9 @@ def determine_severity(activity_type, event_data):
         'extended_focus_loss': 'low',
         'right_click_attempt': 'low',
         'text_selection': 'low',
-        'mouse_inactive': 'low'
+        'mouse_inactive': 'low',
+        'tab_switching_rate': 'high',
+        'focus_loss_rate': 'high'
     }
     
     base_severity = severity_map.get(activity_type, 'low')
@@ -105,9 +164,54 @@ def determine_severity(activity_type, event_data):
     return base_severity
 
 
-def create_notification(user_id, notification_type, title, message, data=None, priority='normal'):
-    """Criar notificação no banco de dados"""
+def _notification_insert():
+    """
+    INSERT em notifications que ignora conflitos no índice de deduplicação
+    (user_id, type, dedup_key). Linhas sem dedup_key nunca conflitam.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(Notification)
+    return dialect_insert(Notification).on_conflict_do_nothing(
+        index_elements=['user_id', 'type', 'dedup_key'],
+        index_where=Notification.dedup_key.isnot(None)
+    )
+
+
+def create_notification(user_id, notification_type, title, message, data=None, priority='normal', dedup_key=None):
+    """
+    Criar notificação no banco de dados.
+    Com dedup_key, a inserção é ignorada se o usuário já tem notificação do mesmo tipo
+    com a mesma chave (retorna None), inclusive sob requisições concorrentes.
+    """
     try:
+        if dedup_key:
+            notification_id = db.session.execute(
+                _notification_insert().values(
+                    user_id=user_id,
+                    type=notification_type,
+                    title=title,
+                    message=message,
+                    data=data,
+                    priority=priority,
+                    is_read=False,
+                    created_at=datetime.utcnow(),
+                    dedup_key=dedup_key
+                ).returning(Notification.id)
+            ).scalar()
+            if notification_id is not None:
+                adjust_unread([user_id])
+                hub.announce([user_id])
+            db.session.commit()
+            if notification_id is None:
+                logger.info("Notificação duplicada evitada: %s (%s) para usuário %s", notification_type, dedup_key, user_id)
+                return None
+            return db.session.get(Notification, notification_id)
+        
         notification = Notification(
             user_id=user_id,
             type=notification_type,
@@ -117,162 +221,394 @@ def create_notification(user_id, notification_type, title, message, data=None, p
             priority=priority
         )
         db.session.add(notification)
+        adjust_unread([user_id])
+        hub.announce([user_id])
         db.session.commit()
         return notification
     except Exception as e:
+        db.session.rollback()
         print(f"Erro ao criar notificação: {e}")
         return None
 
 
-def notify_exam_reminder(exam):
-    """Criar notificações de lembrete de prova"""
-    # Buscar alunos matriculados na turma da prova
-    enrollments = ClassEnrollment.query.filter_by(
-        class_id=exam.class_id,
+NOTIFICATION_PRIORITIES = ('low', 'normal', 'high', 'urgent')
+
+
+def _notification_row(item):
+    """Validar e normalizar uma notificação do lote (levanta ValueError se inválida)"""
+    user_id = int(item['user_id'])
+    notification_type = item.get('type') or item.get('notification_type')
+    title = item.get('title')
+    message = item.get('message')
+    priority = item.get('priority', 'normal')
+    
+    if not notification_type or not title or not message:
+        raise ValueError('type, title e message são obrigatórios')
+    if len(notification_type) > 50 or len(title) > 255:
+        raise ValueError('type ou title excede o tamanho máximo')
+    if priority not in NOTIFICATION_PRIORITIES:
+        raise ValueError(f'prioridade inválida: {priority}')
+    
+    return {
+        'user_id': user_id,
+        'type': notification_type,
+        'title': title,
+        'message': message,
+        'data': item.get('data'),
+        'priority': priority,
+        'is_read': False,
+        'created_at': datetime.utcnow(),
+        'dedup_key': item.get('dedup_key')
+    }
+
+
+def add_notifications_bulk(items):
+    """
+    Inserir várias notificações na transação atual (INSERT com executemany); quem chama faz o commit.
+    Linhas inválidas são descartadas; se o lote falhar no banco (ex.: usuário inexistente),
+    as linhas são reinseridas uma a uma em savepoints para isolar apenas as problemáticas.
+    Linhas com dedup_key já existente são ignoradas.
+    Retorna a quantidade de notificações inseridas.
+    """
+    rows = []
+    for item in items:
+        try:
+            rows.append(_notification_row(item))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("Notificação ignorada no lote: %s", e)
+    
+    if not rows:
+        return 0
+    
+    # RETURNING traz apenas as linhas realmente inseridas (conflitos de dedup_key ficam de fora)
+    statement = _notification_insert().returning(Notification.user_id)
+    try:
+        with db.session.begin_nested():
+            created_for = db.session.execute(statement, rows).scalars().all()
+    except Exception as e:
+        logger.warning("Falha no lote de notificações, inserindo individualmente: %s", e)
+        created_for = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    created_for.extend(db.session.execute(statement, [row]).scalars().all())
+            except Exception as row_error:
+                logger.error("Erro ao criar notificação para usuário %s: %s", row['user_id'], row_error)
+    
+    adjust_unread(created_for)
+    hub.announce(created_for)
+    return len(created_for)
+
+
+def create_notifications_bulk(items):
+    """Criar várias notificações e confirmar (ver add_notifications_bulk); retorna quantas foram criadas"""
+    try:
+        created = add_notifications_bulk(items)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Erro ao salvar lote de notificações: %s", e)
+        return 0
+    return created
+
+
+def class_search_filter(search):
+    """Busca por nome/descrição da turma (ILIKE coberto pelos índices trigram no PostgreSQL)"""
+    pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return db.or_(
+        Class.name.ilike(pattern, escape='\\'),
+        Class.description.ilike(pattern, escape='\\')
+    )
+
+
+def bank_questions_visible_to(query, role, user_id):
+    """Questões do banco visíveis ao usuário: admin vê todas, professor as suas + públicas"""
+    query = query.filter(Question.exam_id.is_(None))
+    if role == 'admin':
+        return query
+    return query.filter(db.or_(Question.created_by == user_id, Question.is_public == True))
+
+
+def load_questions_by_id(question_ids):
+    """Questões por id com as alternativas já carregadas (snapshots das provas)"""
+    questions = Question.query.filter(
+        Question.id.in_({int(question_id) for question_id in question_ids})
+    ).options(selectinload(Question.alternatives)).all()
+    return {question.id: question for question in questions}
+
+
+def serialize_exam_questions(exam_id):
+    """Questões da prova em ordem, com a pontuação da prova; alternativas em uma consulta IN"""
+    exam_questions = db.session.query(ExamQuestion, Question)\
+        .join(Question, ExamQuestion.question_id == Question.id)\
+        .filter(ExamQuestion.exam_id == exam_id)\
+        .order_by(ExamQuestion.order_number)\
+        .all()
+    load_related([question for _, question in exam_questions], Question.alternatives)
+    
+    questions_data = []
+    for exam_question, question in exam_questions:
+        question_dict = question.to_dict()
+        # Usar a pontuação específica da prova
+        question_dict['points'] = float(exam_question.points)
+        question_dict['order_number'] = exam_question.order_number
+        questions_data.append(question_dict)
+    return questions_data
+
+
+def elapsed_minutes(start, end):
+    """Minutos inteiros entre duas colunas de data/hora, calculados no banco"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.cast(db.func.floor(db.func.extract('epoch', end - start) / 60), db.Integer)
+    # SQLite: segundos arredondados ao milissegundo (julianday é ponto flutuante); CAST trunca
+    seconds = db.func.round((db.func.julianday(end) - db.func.julianday(start)) * 86400, 3)
+    return db.cast(seconds / 60, db.Integer)
+
+
+def _class_student_ids(class_id):
+    return [student_id for (student_id,) in db.session.query(ClassEnrollment.student_id).filter_by(
+        class_id=class_id,
         status='approved'
-    ).all()
+    ).all()]
+
+
+# Os notify_* apenas enfileiram o evento na transação atual (quem chama faz o commit);
+# as notificações são criadas pelo despachante do outbox com os renderizadores abaixo.
+
+def notify_exam_reminder(exam):
+    """Enfileirar lembrete de prova para os alunos da turma"""
+    enqueue_notification('exam_reminder', exam_id=exam.id)
+
+
+@outbox_renderer('exam_reminder')
+def render_exam_reminder(payload):
+    exam = Exam.query.get(payload['exam_id'])
+    if not exam:
+        return []
     
-    for enrollment in enrollments:
-        create_notification(
-            user_id=enrollment.student_id,
-            notification_type='exam_reminder',
-            title='Prova Próxima',
-            message=f'A prova "{exam.title}" começará em breve. Prepare-se!',
-            data={
+    return [
+        {
+            'user_id': student_id,
+            'type': 'exam_reminder',
+            'title': 'Prova Próxima',
+            'message': f'A prova "{exam.title}" começará em breve. Prepare-se!',
+            'data': {
                 'exam_id': exam.id,
                 'exam_title': exam.title,
                 'start_time': exam.start_time.isoformat(),
                 'duration_minutes': exam.duration_minutes
             },
-            priority='high'
-        )
+            'priority': 'high'
+        }
+        for student_id in _class_student_ids(exam.class_id)
+    ]
+
+
+def send_exam_reminders(lead_minutes=60):
+    """
+    Enfileirar o lembrete das provas publicadas que começam nos próximos lead_minutes.
+    Cada prova é marcada (reminder_sent_at) no mesmo UPDATE que a seleciona, então execuções
+    repetidas ou simultâneas do agendador não duplicam o lembrete. Retorna as provas avisadas.
+    """
+    now = datetime.utcnow()
+    exam_ids = db.session.execute(
+        db.update(Exam).where(
+            Exam.status == 'published',
+            Exam.reminder_sent_at.is_(None),
+            Exam.start_time > now,
+            Exam.start_time <= now + timedelta(minutes=lead_minutes)
+        ).values(reminder_sent_at=now).returning(Exam.id)
+    ).scalars().all()
+    exams = Exam.query.filter(Exam.id.in_(exam_ids)).all() if exam_ids else []
+    for exam in exams:
+        notify_exam_reminder(exam)
+    db.session.commit()
+    return exams
+
+
+def notify_enrollments_approved(class_obj, class_enrollments):
+    """Enfileirar aviso de aprovação para as solicitações de participação aprovadas"""
+    enqueue_notification(
+        'enrollments_approved',
+        class_id=class_obj.id,
+        enrollments=[[enrollment.id, enrollment.student_id] for enrollment in class_enrollments]
+    )
+
+
+@outbox_renderer('enrollments_approved')
+def render_enrollments_approved(payload):
+    class_obj = Class.query.get(payload['class_id'])
+    if not class_obj:
+        return []
+    
+    return [
+        {
+            'user_id': student_id,
+            'type': 'enrollment_approved',
+            'title': 'Participação Aprovada',
+            'message': f'Sua solicitação para participar da turma "{class_obj.name}" foi aprovada.',
+            'data': {
+                'class_id': class_obj.id,
+                'class_name': class_obj.name,
+                'enrollment_id': enrollment_id
+            },
+            'priority': 'normal'
+        }
+        for enrollment_id, student_id in payload['enrollments']
+    ]
 
 
 def notify_result_available(enrollment):
-    """Notificar quando resultado estiver disponível"""
+    """Enfileirar aviso de resultado disponível para o aluno"""
+    enqueue_notification('result_available', enrollment_id=enrollment.id)
+
+
+@outbox_renderer('result_available')
+def render_result_available(payload):
+    enrollment = ExamEnrollment.query.get(payload['enrollment_id'])
+    if not enrollment:
+        return []
     exam = Exam.query.get(enrollment.exam_id)
     
-    # Verificar se já existe uma notificação similar recente (últimas 2 horas)
-    recent_cutoff = datetime.utcnow() - timedelta(hours=2)
-    existing_notification = Notification.query.filter(
-        Notification.user_id == enrollment.student_id,
-        Notification.type == 'result_available',
-        Notification.data['enrollment_id'].astext == str(enrollment.id),
-        Notification.created_at >= recent_cutoff
-    ).first()
-    
-    if existing_notification:
-        print(f"⚠️ Notificação duplicada evitada: resultado já notificado para enrollment {enrollment.id}")
-        return
-    
-    create_notification(
-        user_id=enrollment.student_id,
-        notification_type='result_available',
-        title='Resultado Disponível',
-        message=f'O resultado da prova "{exam.title}" já está disponível.',
-        data={
+    # Uma notificação por matrícula, garantida pelo índice único de deduplicação
+    return [{
+        'user_id': enrollment.student_id,
+        'type': 'result_available',
+        'title': 'Resultado Disponível',
+        'message': f'O resultado da prova "{exam.title}" já está disponível.',
+        'data': {
             'exam_id': exam.id,
             'enrollment_id': enrollment.id,
             'percentage': float(enrollment.percentage) if enrollment.percentage else 0,
             'total_points': float(enrollment.total_points) if enrollment.total_points else 0
         },
-        priority='normal'
-    )
+        'priority': 'normal',
+        'dedup_key': f'enrollment:{enrollment.id}'
+    }]
 
 
 def notify_suspicious_activity(enrollment, activity_data):
-    """Notificar professor sobre atividade suspeita"""
-    exam = Exam.query.get(enrollment.exam_id)
-    student = User.query.get(enrollment.student_id)
-    
-    # Notificar o professor criador da prova
+    """Enfileirar aviso ao professor sobre atividade suspeita (apenas severidade alta/crítica)"""
     activity_type = activity_data.get('activity_type', 'unknown')
     severity = determine_severity(activity_type, activity_data)
     
     if severity in ['high', 'critical']:
-        create_notification(
-            user_id=exam.created_by,
-            notification_type='suspicious_activity',
-            title='Atividade Suspeita Detectada',
-            message=f'Comportamento suspeito detectado: {student.name} na prova "{exam.title}"',
-            data={
-                'exam_id': exam.id,
-                'student_id': student.id,
-                'student_name': student.name,
-                'activity_type': activity_type,
-                'severity': severity,
-                'enrollment_id': enrollment.id
-            },
-            priority='high' if severity == 'high' else 'urgent'
+        enqueue_notification(
+            'suspicious_activity',
+            enrollment_id=enrollment.id,
+            activity_type=activity_type,
+            severity=severity
         )
 
 
-def notify_exam_completed(enrollment):
-    """Notificar professor quando aluno terminar prova"""
+@outbox_renderer('suspicious_activity')
+def render_suspicious_activity(payload):
+    enrollment = ExamEnrollment.query.get(payload['enrollment_id'])
+    if not enrollment:
+        return []
     exam = Exam.query.get(enrollment.exam_id)
     student = User.query.get(enrollment.student_id)
+    severity = payload['severity']
     
-    # Verificar se já existe uma notificação similar recente (últimas 2 horas)
-    recent_cutoff = datetime.utcnow() - timedelta(hours=2)
-    existing_notification = Notification.query.filter(
-        Notification.user_id == exam.created_by,
-        Notification.type == 'exam_completed',
-        Notification.data['enrollment_id'].astext == str(enrollment.id),
-        Notification.created_at >= recent_cutoff
-    ).first()
-    
-    if existing_notification:
-        print(f"⚠️ Notificação duplicada evitada: conclusão já notificada para enrollment {enrollment.id}")
-        return
+    # Notificar o professor criador da prova
+    return [{
+        'user_id': exam.created_by,
+        'type': 'suspicious_activity',
+        'title': 'Atividade Suspeita Detectada',
+        'message': f'Comportamento suspeito detectado: {student.name} na prova "{exam.title}"',
+        'data': {
+            'exam_id': exam.id,
+            'student_id': student.id,
+            'student_name': student.name,
+            'activity_type': payload['activity_type'],
+            'severity': severity,
+            'enrollment_id': enrollment.id
+        },
+        'priority': 'high' if severity == 'high' else 'urgent'
+    }]
+
+
+def notify_exam_completed(enrollment):
+    """Enfileirar aviso ao professor quando o aluno terminar a prova"""
+    enqueue_notification('exam_completed', enrollment_id=enrollment.id)
+
+
+@outbox_renderer('exam_completed')
+def render_exam_completed(payload):
+    enrollment = ExamEnrollment.query.get(payload['enrollment_id'])
+    if not enrollment:
+        return []
+    exam = Exam.query.get(enrollment.exam_id)
+    student = User.query.get(enrollment.student_id)
     
-    create_notification(
-        user_id=exam.created_by,
-        notification_type='exam_completed',
-        title='Prova Finalizada',
-        message=f'{student.name} finalizou a prova "{exam.title}"',
-        data={
+    # Uma notificação por matrícula, garantida pelo índice único de deduplicação
+    return [{
+        'user_id': exam.created_by,
+        'type': 'exam_completed',
+        'title': 'Prova Finalizada',
+        'message': f'{student.name} finalizou a prova "{exam.title}"',
+        'data': {
             'exam_id': exam.id,
             'student_id': student.id,
             'student_name': student.name,
             'enrollment_id': enrollment.id,
             'completed_at': enrollment.completed_at.isoformat() if enrollment.completed_at else None
         },
-        priority='normal'
-    )
+        'priority': 'normal',
+        'dedup_key': f'enrollment:{enrollment.id}'
+    }]
 
 
 def notify_new_enrollment_request(class_enrollment):
-    """Notificar professor sobre nova solicitação de matrícula"""
+    """Enfileirar aviso ao professor sobre nova solicitação de matrícula"""
+    db.session.flush()
+    enqueue_notification('enrollment_request', class_enrollment_id=class_enrollment.id)
+
+
+@outbox_renderer('enrollment_request')
+def render_new_enrollment_request(payload):
+    class_enrollment = ClassEnrollment.query.get(payload['class_enrollment_id'])
+    if not class_enrollment:
+        return []
     class_obj = Class.query.get(class_enrollment.class_id)
     student = User.query.get(class_enrollment.student_id)
     
-    create_notification(
-        user_id=class_obj.instructor_id,
-        notification_type='enrollment_request',
-        title='Nova Solicitação de Matrícula',
-        message=f'{student.name} solicitou matrícula na turma "{class_obj.name}"',
-        data={
+    return [{
+        'user_id': class_obj.instructor_id,
+        'type': 'enrollment_request',
+        'title': 'Nova Solicitação de Matrícula',
+        'message': f'{student.name} solicitou matrícula na turma "{class_obj.name}"',
+        'data': {
             'class_id': class_obj.id,
             'class_name': class_obj.name,
             'student_id': student.id,
             'student_name': student.name,
             'enrollment_id': class_enrollment.id
         },
-        priority='normal'
-    )
+        'priority': 'normal'
+    }]
 
 
 def notify_pending_corrections(enrollment, pending_count):
-    """Notificar professor quando há questões pendentes para correção"""
+    """Enfileirar aviso ao professor sobre questões pendentes de correção"""
+    enqueue_notification('pending_corrections', enrollment_id=enrollment.id, pending_count=pending_count)
+
+
+@outbox_renderer('pending_corrections')
+def render_pending_corrections(payload):
+    enrollment = ExamEnrollment.query.get(payload['enrollment_id'])
+    if not enrollment:
+        return []
     exam = Exam.query.get(enrollment.exam_id)
     student = User.query.get(enrollment.student_id)
+    pending_count = payload['pending_count']
     
-    create_notification(
-        user_id=exam.created_by,
-        notification_type='pending_corrections',
-        title='Questões Pendentes de Correção',
-        message=f'{student.name} finalizou a prova "{exam.title}" com {pending_count} questão(ões) pendente(s) de correção',
-        data={
+    return [{
+        'user_id': exam.created_by,
+        'type': 'pending_corrections',
+        'title': 'Questões Pendentes de Correção',
+        'message': f'{student.name} finalizou a prova "{exam.title}" com {pending_count} questão(ões) pendente(s) de correção',
+        'data': {
             'exam_id': exam.id,
             'student_id': student.id,
             'student_name': student.name,
@@ -280,11 +616,17 @@ def notify_pending_corrections(enrollment, pending_count):
             'pending_count': pending_count,
             'completed_at': enrollment.completed_at.isoformat() if enrollment.completed_at else None
         },
-        priority='high'
-    )
+        'priority': 'high'
+    }]
 
 
 def register_routes(app):
+    # Agrupamento de eventos de monitoramento repetitivos (estado por processo)
+    monitoring_throttle = MonitoringEventThrottle(app.config.get('MONITORING_THROTTLE_WINDOWS'))
+    monitoring_throttle.init_app(app)
+    # Alertas de taxa avaliados durante a ingestão (buffers em MONITORING_DETECTOR_BACKEND)
+    rate_detector = create_rate_detector(app.config)
+
     # Rotas de Autenticação
     @app.route('/api/auth/login', methods=['POST'])
     def login():
@@ -292,21 +634,29 @@ def register_routes(app):
             data = request.get_json()
             user = User.query.filter_by(email=data['email']).first()
             
-            if user and check_password_hash(user.password_hash, data['password']):
+            if user:
+                # Não segurar a conexão do banco enquanto o hash é verificado no pool
+                db.session.expunge(user)
+                db.session.rollback()
+            
+            if user and verify_password(user.password_hash, data['password']):
+                # Hash gerado com parâmetros antigos: refazer com os atuais
+                if needs_rehash(user.password_hash):
+                    User.query.filter_by(id=user.id).update(
+                        {'password_hash': hash_password(data['password'])},
+                        synchronize_session=False
+                    )
+                    db.session.commit()
+                
                 # Criar access token com tempo curto (15 minutos)
                 access_token = create_access_token(
                     identity=user.id,
-                    expires_delta=timedelta(minutes=15)
-                )
-                
-                # Criar refresh token com tempo longo (7 dias)
-                refresh_token = create_refresh_token(
-                    identity=user.id,
-                    expires_delta=timedelta(days=7)
+                    expires_delta=timedelta(minutes=15),
+                    additional_claims=principal_claims(user)
                 )
                 
-                # Armazenar refresh token como válido
-                valid_refresh_tokens.add(refresh_token)
+                # Criar refresh token com tempo longo (7 dias) e armazená-lo como válido
+                refresh_token = issue_refresh_token(user.id)
                 
                 return jsonify({
                     'token': access_token,
@@ -329,42 +679,33 @@ def register_routes(app):
             if not refresh_token:
                 return jsonify({'error': 'Refresh token é obrigatório'}), 400
             
-            # Verificar se o refresh token está na lista de válidos
-            if refresh_token not in valid_refresh_tokens:
-                return jsonify({'error': 'Refresh token inválido'}), 401
-            
-            # Decodificar o refresh token para obter o user_id
-            from flask_jwt_extended import decode_token
+            # Decodificar o refresh token para obter o user_id e o jti
             try:
                 decoded_token = decode_token(refresh_token)
                 user_id = decoded_token['sub']
             except Exception:
-                # Remover token inválido
-                valid_refresh_tokens.discard(refresh_token)
                 return jsonify({'error': 'Refresh token expirado ou inválido'}), 401
             
+            if decoded_token.get('type') != 'refresh':
+                return jsonify({'error': 'Refresh token inválido'}), 401
+            
+            # Consumir o token antigo: só é aceito uma vez (rotação)
+            if not get_token_store().consume(decoded_token['jti']):
+                return jsonify({'error': 'Refresh token inválido'}), 401
+            
             # Verificar se o usuário ainda existe
             user = User.query.get(user_id)
             if not user:
-                valid_refresh_tokens.discard(refresh_token)
                 return jsonify({'error': 'Usuário não encontrado'}), 401
             
-            # Remover o refresh token antigo
-            valid_refresh_tokens.discard(refresh_token)
-            
             # Criar novos tokens
             new_access_token = create_access_token(
                 identity=user.id,
-                expires_delta=timedelta(minutes=15)
+                expires_delta=timedelta(minutes=15),
+                additional_claims=principal_claims(user)
             )
             
-            new_refresh_token = create_refresh_token(
-                identity=user.id,
-                expires_delta=timedelta(days=7)
-            )
-            
-            # Armazenar novo refresh token
-            valid_refresh_tokens.add(new_refresh_token)
+            new_refresh_token = issue_refresh_token(user.id)
             
             return jsonify({
                 'token': new_access_token,
@@ -384,9 +725,13 @@ def register_routes(app):
             data = request.get_json() or {}
             refresh_token = data.get('refresh_token')
             
-            # Remover refresh token da lista de válidos
+            # Revogar o refresh token (mesmo que já expirado)
             if refresh_token:
-                valid_refresh_tokens.discard(refresh_token)
+                try:
+                    decoded_token = decode_token(refresh_token, allow_expired=True)
+                    get_token_store().revoke(decoded_token['jti'])
+                except Exception:
+                    pass
             
             return jsonify({'message': 'Logout realizado com sucesso'}), 200
             
@@ -422,7 +767,7 @@ def register_routes(app):
             # Criar novo usuário
             new_user = User(
                 email=data['email'],
-                password_hash=generate_password_hash(data['password']),
+                password_hash=hash_password(data['password']),
                 name=data['name'],
                 role=role
             )
@@ -433,16 +778,12 @@ def register_routes(app):
             # Gerar tokens para login automático
             access_token = create_access_token(
                 identity=new_user.id,
-                expires_delta=timedelta(minutes=15)
+                expires_delta=timedelta(minutes=15),
+                additional_claims=principal_claims(new_user)
             )
             
-            refresh_token = create_refresh_token(
-                identity=new_user.id,
-                expires_delta=timedelta(days=7)
-            )
-            
-            # Armazenar refresh token
-            valid_refresh_tokens.add(refresh_token)
+            # Criar e armazenar refresh token
+            refresh_token = issue_refresh_token(new_user.id)
             
             return jsonify({
                 'message': 'Usuário registrado com sucesso',
@@ -463,7 +804,7 @@ def register_routes(app):
         data = request.get_json()
         new_user = User(
             email=data['email'],
-            password_hash=generate_password_hash(data['password']),
+            password_hash=hash_password(data['password']),
             name=data['name'],
             role=data['role']
         )
@@ -485,7 +826,7 @@ def register_routes(app):
     def list_exams():
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role == 'student':
                 student_classes = ClassEnrollment.query.filter_by(student_id=user_id).all()
@@ -540,8 +881,9 @@ def register_routes(app):
                 questions_data = data['questions']
                 question_points = data.get('question_points', {})
                 
+                questions_by_id = load_questions_by_id(questions_data)
                 for i, question_id in enumerate(questions_data):
-                    question = Question.query.get(question_id)
+                    question = questions_by_id.get(int(question_id))
                     if question:
                         # Criar snapshot da questão
                         question_snapshot = {
@@ -567,20 +909,7 @@ def register_routes(app):
             # Retornar prova criada com questões
             exam_dict = new_exam.to_dict()
             if 'questions' in data and data['questions']:
-                exam_questions = db.session.query(ExamQuestion, Question)\
-                    .join(Question, ExamQuestion.question_id == Question.id)\
-                    .filter(ExamQuestion.exam_id == new_exam.id)\
-                    .order_by(ExamQuestion.order_number)\
-                    .all()
-                
-                questions_data = []
-                for exam_question, question in exam_questions:
-                    question_dict = question.to_dict()
-                    question_dict['points'] = float(exam_question.points)
-                    question_dict['order_number'] = exam_question.order_number
-                    questions_data.append(question_dict)
-                
-                exam_dict['questions'] = questions_data
+                exam_dict['questions'] = serialize_exam_questions(new_exam.id)
             
             return jsonify(exam_dict), 201
             
@@ -590,27 +919,14 @@ def register_routes(app):
     @app.route('/api/exams/<int:exam_id>', methods=['GET'])
     @jwt_required()
     @on_exam_access  # Verificar se esta prova específica expirou
+    @cached_response(lambda principal, exam_id: [f'exam:{exam_id}'], shared=True)
     def get_exam(exam_id):
         try:
             exam = Exam.query.get_or_404(exam_id)
             exam_dict = exam.to_dict()
             
             # Carregar questões da prova através da tabela exam_questions
-            exam_questions = db.session.query(ExamQuestion, Question)\
-                .join(Question, ExamQuestion.question_id == Question.id)\
-                .filter(ExamQuestion.exam_id == exam_id)\
-                .order_by(ExamQuestion.order_number)\
-                .all()
-            
-            questions_data = []
-            for exam_question, question in exam_questions:
-                question_dict = question.to_dict()
-                # Usar a pontuação específica da prova
-                question_dict['points'] = float(exam_question.points)
-                question_dict['order_number'] = exam_question.order_number
-                questions_data.append(question_dict)
-            
-            exam_dict['questions'] = questions_data
+            exam_dict['questions'] = serialize_exam_questions(exam_id)
             
             return jsonify(exam_dict), 200
         except Exception as e:
@@ -648,6 +964,8 @@ def register_routes(app):
                     exam.start_time = datetime.fromisoformat(start_time_str)
                 else:
                     exam.start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
+                # Novo horário: o lembrete volta a ser enviado antes do início
+                exam.reminder_sent_at = None
             
             if 'end_time' in data:
                 end_time_str = data['end_time']
@@ -676,14 +994,16 @@ def register_routes(app):
             # Gerenciar questões se fornecidas
             if 'questions' in data and 'question_points' in data:
                 # Remover todas as questões antigas da prova
+                invalidate(exam)
                 ExamQuestion.query.filter_by(exam_id=exam_id).delete()
                 
                 # Adicionar novas questões com pontuação personalizada
                 questions_data = data['questions']
                 question_points = data['question_points']
                 
+                questions_by_id = load_questions_by_id(questions_data)
                 for i, question_id in enumerate(questions_data):
-                    question = Question.query.get(question_id)
+                    question = questions_by_id.get(int(question_id))
                     if question:
                         # Criar snapshot da questão
                         question_snapshot = {
@@ -708,20 +1028,7 @@ def register_routes(app):
             
             # Retornar prova atualizada com questões
             exam_dict = exam.to_dict()
-            exam_questions = db.session.query(ExamQuestion, Question)\
-                .join(Question, ExamQuestion.question_id == Question.id)\
-                .filter(ExamQuestion.exam_id == exam_id)\
-                .order_by(ExamQuestion.order_number)\
-                .all()
-            
-            questions_data = []
-            for exam_question, question in exam_questions:
-                question_dict = question.to_dict()
-                question_dict['points'] = float(exam_question.points)
-                question_dict['order_number'] = exam_question.order_number
-                questions_data.append(question_dict)
-            
-            exam_dict['questions'] = questions_data
+            exam_dict['questions'] = serialize_exam_questions(exam_id)
             
             return jsonify(exam_dict), 200
             
@@ -849,18 +1156,18 @@ def register_routes(app):
                 )
                 db.session.add(new_answer)
             
-            db.session.commit()
-            
             # Verificar se há questões pendentes para correção
             pending_answers = Answer.query.filter_by(
                 enrollment_id=enrollment_id,
                 correction_method='pending'
             ).count()
             
-            # Notificar professor apenas se há questões pendentes
+            # Notificar professor apenas se há questões pendentes (mesma transação da resposta)
             if pending_answers > 0:
                 notify_pending_corrections(enrollment, pending_answers)
             
+            db.session.commit()
+            
             # ❌ REMOVIDO: Não notificar sobre resultado aqui - só quando finalizar a prova
             
             return jsonify({'message': 'Resposta salva com sucesso'}), 200
@@ -1065,14 +1372,17 @@ def register_routes(app):
             enrollment.percentage = percentage
             enrollment.completed_at = datetime.utcnow()
             
-            db.session.commit()
+            # Gravar repetições de monitoramento ainda agrupadas em memória (em todos os processos)
+            for pending in monitoring_throttle.request_flush(enrollment_id):
+                db.session.add(MonitoringEvent(**pending))
+            rate_detector.forget(enrollment_id)
             
-            # Notificar professor sobre conclusão da prova
+            # Notificar professor sobre conclusão e aluno sobre resultado (outbox, mesma transação)
             notify_exam_completed(enrollment)
-            
-            # Notificar aluno sobre resultado disponível
             notify_result_available(enrollment)
             
+            db.session.commit()
+            
             # Retornar resultado com pontuação
             result = enrollment.to_dict()
             result['answers_count'] = len(answers)
@@ -1086,20 +1396,56 @@ def register_routes(app):
     @app.route('/api/monitoring/event', methods=['POST'])
     @jwt_required()
     def record_monitoring_event():
-        data = request.get_json()
-        new_event = MonitoringEvent(
-            enrollment_id=data['enrollment_id'],
-            event_type=data['event_type'],
-            event_data=data['event_data']
-        )
-        db.session.add(new_event)
-        db.session.commit()
+        data = request.get_json(silent=True) or {}
+        enrollment_id = data.get('enrollment_id')
+        event_type = data.get('event_type')
+        event_data = data.get('event_data', {})
+        if not isinstance(enrollment_id, int) or not isinstance(event_type, str) or not event_type \
+                or not isinstance(event_data, dict):
+            return jsonify({'error': 'enrollment_id, event_type e event_data (objeto) são obrigatórios'}), 400
+        # 'count'/'collapsed' só valem em eventos agrupados pelo próprio servidor
+        event_data = sanitize_event_data(event_data)
+        
+        enrollment = None
+        rate_tracked = event_type == 'suspicious_activity' and rate_detector.tracks(event_data)
+        if event_type == 'suspicious_activity':
+            enrollment = ExamEnrollment.query.get(enrollment_id)
+        
+        # Detector de taxa enxerga todas as ocorrências (mesma transação do evento)
+        rate_alert = None
+        if enrollment and rate_tracked:
+            rate_alert = rate_detector.observe(enrollment_id, event_data)
+        
+        # Repetições dentro da janela do tipo de atividade só são contadas em memória
+        persist, pending = monitoring_throttle.admit(enrollment_id, event_type, event_data)
+        for event in pending:
+            db.session.add(MonitoringEvent(**event))
+        
+        new_event = None
+        if persist:
+            new_event = MonitoringEvent(
+                enrollment_id=enrollment_id,
+                event_type=event_type,
+                event_data=event_data
+            )
+            db.session.add(new_event)
         
         # Se for atividade suspeita, notificar o professor
-        if data['event_type'] == 'suspicious_activity':
-            enrollment = ExamEnrollment.query.get(data['enrollment_id'])
-            if enrollment:
-                notify_suspicious_activity(enrollment, data['event_data'])
+        # (atividades com regra de taxa só notificam quando o limite é cruzado)
+        if enrollment:
+            if rate_alert:
+                notify_suspicious_activity(enrollment, rate_alert)
+            elif persist and not rate_tracked:
+                notify_suspicious_activity(enrollment, event_data)
+        
+        db.session.commit()
+        
+        if not persist:
+            return jsonify({
+                'enrollment_id': enrollment_id,
+                'event_type': event_type,
+                'collapsed': True
+            }), 202
         
         return jsonify(new_event.to_dict()), 201
 
@@ -1109,7 +1455,7 @@ def register_routes(app):
         """Obter atividades suspeitas de uma matrícula específica"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             # Verificar se o usuário tem permissão
             enrollment = ExamEnrollment.query.get_or_404(enrollment_id)
@@ -1145,7 +1491,7 @@ def register_routes(app):
         """Obter alertas para o dashboard do professor"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['admin', 'professor']:
                 return jsonify({'error': 'Acesso negado'}), 403
@@ -1206,74 +1552,108 @@ def register_routes(app):
     # Rotas de Turmas
     @app.route('/api/classes', methods=['GET'])
     @jwt_required()
+    @cached_response(lambda principal: None if principal.role == 'admin' else [f'user:{principal.id}'])
     def list_classes():
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role == 'student':
-                enrollments = ClassEnrollment.query.filter_by(student_id=user_id).all()
-                class_ids = [enrollment.class_id for enrollment in enrollments]
-                classes = Class.query.filter(Class.id.in_(class_ids)).all()
+                enrolled_class_ids = db.session.query(ClassEnrollment.class_id).filter_by(student_id=user_id)
+                query = Class.query.filter(Class.id.in_(enrolled_class_ids))
             else:
                 if user.role == 'admin':
-                    classes = Class.query.all()
+                    query = Class.query
                 else:
-                    classes = Class.query.filter_by(instructor_id=user_id).all()
+                    query = Class.query.filter_by(instructor_id=user_id)
+            
+            # Admins com muitas turmas: ?page=N&per_page=M, resposta {classes, pagination}
+            # (mesmo formato de /api/admin/platform-evaluations e das correções pendentes)
+            pagination = None
+            if user.role == 'admin' and 'page' in request.args:
+                pagination = query.order_by(Class.created_at.desc(), Class.id.desc()).paginate(
+                    page=request.args.get('page', 1, type=int),
+                    per_page=min(request.args.get('per_page', 20, type=int), 100),
+                    error_out=False
+                )
+                classes = pagination.items
+            else:
+                classes = query.all()
             
             # Para professores e admins, adicionar contadores de alunos e solicitações
+            # (uma única consulta agrupada por turma e status)
+            enrollment_counts = {}
+            if user.role in ['admin', 'professor'] and classes:
+                enrollment_counts = {
+                    (class_id, status): count
+                    for class_id, status, count in db.session.query(
+                        ClassEnrollment.class_id,
+                        ClassEnrollment.status,
+                        db.func.count(ClassEnrollment.id)
+                    ).filter(
+                        ClassEnrollment.class_id.in_([class_obj.id for class_obj in classes]),
+                        ClassEnrollment.status.in_(['approved', 'pending'])
+                    ).group_by(ClassEnrollment.class_id, ClassEnrollment.status)
+                }
+            
             classes_with_stats = []
             for class_obj in classes:
                 class_data = class_obj.to_dict()
                 
                 if user.role in ['admin', 'professor']:
-                    # Contar alunos com desempenho satisfatório
-                    student_count = ClassEnrollment.query.filter_by(
-                        class_id=class_obj.id,
-                        status='approved'
-                    ).count()
-                    
-                    # Contar solicitações pendentes
-                    pending_requests = ClassEnrollment.query.filter_by(
-                        class_id=class_obj.id,
-                        status='pending'
-                    ).count()
-                    
-                    class_data['student_count'] = student_count
-                    class_data['pending_requests'] = pending_requests
+                    # Alunos aprovados e solicitações pendentes
+                    class_data['student_count'] = enrollment_counts.get((class_obj.id, 'approved'), 0)
+                    class_data['pending_requests'] = enrollment_counts.get((class_obj.id, 'pending'), 0)
                 
                 classes_with_stats.append(class_data)
             
+            if pagination is not None:
+                return jsonify({
+                    'classes': classes_with_stats,
+                    'pagination': {
+                        'total': pagination.total,
+                        'pages': pagination.pages,
+                        'current_page': pagination.page,
+                        'per_page': pagination.per_page,
+                        'has_prev': pagination.has_prev,
+                        'has_next': pagination.has_next
+                    }
+                }), 200
+            
             return jsonify(classes_with_stats), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 422
 
     @app.route('/api/classes/available', methods=['GET'])
     @jwt_required()
+    @role_required('student', message='Apenas estudantes podem ver turmas disponíveis')
     def list_available_classes():
         """Lista turmas disponíveis para estudantes se matricularem"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
             
-            if user.role != 'student':
-                return jsonify({'error': 'Apenas estudantes podem ver turmas disponíveis'}), 403
+            # Buscar turmas onde o estudante ainda não está matriculado (anti-join com NOT EXISTS)
+            already_enrolled = db.session.query(ClassEnrollment.id).filter(
+                ClassEnrollment.class_id == Class.id,
+                ClassEnrollment.student_id == user_id
+            ).exists()
             
-            # Buscar turmas onde o estudante ainda não está matriculado
-            enrolled_classes = ClassEnrollment.query.filter_by(student_id=user_id).all()
-            enrolled_class_ids = [enrollment.class_id for enrollment in enrolled_classes]
+            query = db.session.query(Class, User.name.label('instructor_name'))\
+                .outerjoin(User, Class.instructor_id == User.id)\
+                .filter(Class.is_active == True, ~already_enrolled)
             
-            available_classes = Class.query.filter(
-                Class.is_active == True,
-                ~Class.id.in_(enrolled_class_ids)
-            ).all()
+            # Busca opcional por nome/descrição, com resposta limitada (?search=...&limit=N)
+            search = (request.args.get('search') or '').strip()
+            if search:
+                query = query.filter(class_search_filter(search))
+            if search or 'limit' in request.args:
+                query = query.order_by(Class.name, Class.id).limit(page_size(request.args.get('limit'), default=50))
             
             classes_with_instructor = []
-            for class_obj in available_classes:
+            for class_obj, instructor_name in query.all():
                 class_data = class_obj.to_dict()
-                instructor = User.query.get(class_obj.instructor_id)
-                if instructor:
-                    class_data['instructor_name'] = instructor.name
+                if instructor_name is not None:
+                    class_data['instructor_name'] = instructor_name
                 classes_with_instructor.append(class_data)
             
             return jsonify(classes_with_instructor), 200
@@ -1310,7 +1690,7 @@ def register_routes(app):
         """Atualizar dados de uma turma"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             class_obj = Class.query.get_or_404(class_id)
             
             # Verificar se é o professor da turma ou admin
@@ -1357,7 +1737,7 @@ def register_routes(app):
         """Excluir uma turma"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             class_obj = Class.query.get_or_404(class_id)
             
             # Verificar se é o professor da turma ou admin
@@ -1379,6 +1759,7 @@ def register_routes(app):
                 return jsonify({'error': 'Não é possível excluir turma com provas associadas'}), 400
             
             # Remover todas as matrículas (pendentes/rejeitadas)
+            invalidate(class_obj)
             ClassEnrollment.query.filter_by(class_id=class_id).delete()
             
             # Remover a turma
@@ -1391,14 +1772,11 @@ def register_routes(app):
 
     @app.route('/api/classes/<int:class_id>/request-enrollment', methods=['POST'])
     @jwt_required()
+    @role_required('student', message='Apenas estudantes podem solicitar participação')
     def request_enrollment(class_id):
         """Solicitar participação em uma turma"""
         try:
             student_id = get_jwt_identity()
-            user = User.query.get_or_404(student_id)
-            
-            if user.role != 'student':
-                return jsonify({'error': 'Apenas estudantes podem solicitar participação'}), 403
             
             # Verificar se já existe solicitação
             existing_enrollment = ClassEnrollment.query.filter_by(
@@ -1509,6 +1887,7 @@ def register_routes(app):
                 return jsonify({'error': 'Solicitação não pertence a esta turma'}), 400
             
             enrollment.status = 'approved'
+            notify_enrollments_approved(class_obj, [enrollment])
             db.session.commit()
             
             return jsonify({'message': 'Solicitação aprovada com sucesso'}), 200
@@ -1537,6 +1916,9 @@ def register_routes(app):
                 enrollment.status = 'approved'
                 approved_count += 1
             
+            # Um único evento no outbox para todas as aprovações
+            if pending_enrollments:
+                notify_enrollments_approved(class_obj, pending_enrollments)
             db.session.commit()
             
             return jsonify({'message': f'{approved_count} solicitações aprovadas com sucesso'}), 200
@@ -1594,35 +1976,67 @@ def register_routes(app):
         """Listar questões do banco (não associadas a provas específicas)"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role == 'student':
                 return jsonify({'error': 'Acesso negado'}), 403
             
-            # Filtrar questões do banco considerando visibilidade
-            if user.role == 'admin':
-                questions = Question.query.filter(Question.exam_id.is_(None)).all()
-            else:
-                # Professor vê suas próprias questões + questões públicas de outros
-                questions = Question.query.filter(
-                    Question.exam_id.is_(None),
-                    db.or_(
-                        Question.created_by == int(user_id),
-                        Question.is_public == True
-                    )
-                ).all()
+            questions = bank_questions_visible_to(Question.query, user.role, int(user_id))\
+                .options(selectinload(Question.alternatives)).all()
             
             return jsonify([question.to_dict() for question in questions]), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 422
 
+    @app.route('/api/questions/search', methods=['GET'])
+    @jwt_required()
+    @role_required('admin', 'professor')
+    def search_questions():
+        """Buscar no banco de questões: ?q=&question_type=&difficulty=&category=&limit=&before="""
+        try:
+            user = current_principal()
+            
+            query = bank_questions_visible_to(
+                db.session.query(Question), user.role, int(user.id)
+            ).options(selectinload(Question.alternatives))
+            for field in ('question_type', 'difficulty', 'category'):
+                value = request.args.get(field)
+                if value:
+                    query = query.filter(getattr(Question, field) == value)
+            
+            limit = page_size(request.args.get('limit'))
+            text = request.args.get('q', '').strip()
+            try:
+                if text:
+                    # Mais relevantes primeiro; cursor "<relevância>,<id>"
+                    query, score = apply_question_search(query, text)
+                    query = query.add_columns(score.label('score'), Question.id.label('question_id'))
+                    rows, next_cursor = keyset_page(
+                        query, score.label('score'), Question.id.label('question_id'),
+                        cursor=request.args.get('before'), limit=limit, cast=float
+                    )
+                    results = [dict(row.Question.to_dict(), score=row.score) for row in rows]
+                else:
+                    # Sem termos: mais recentes primeiro; cursor "<created_at>,<id>"
+                    questions, next_cursor = keyset_page(
+                        query, Question.created_at, Question.id,
+                        cursor=request.args.get('before'), limit=limit
+                    )
+                    results = [question.to_dict() for question in questions]
+            except ValueError:
+                return jsonify({'error': 'Parâmetro before inválido'}), 400
+            
+            return jsonify({'results': results, 'next_cursor': next_cursor}), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 422
+
     @app.route('/api/questions', methods=['POST'])
     @jwt_required()
     def create_question():
         """Criar questão no banco"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role == 'student':
                 return jsonify({'error': 'Apenas professores podem criar questões'}), 403
@@ -1680,7 +2094,7 @@ def register_routes(app):
         """Atualizar questão"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             question = Question.query.get_or_404(question_id)
             
             # Verificar permissão
@@ -1733,7 +2147,7 @@ def register_routes(app):
         """Excluir questão"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             question = Question.query.get_or_404(question_id)
             
             # Verificar permissão
@@ -1778,7 +2192,7 @@ def register_routes(app):
             questions = Question.query.filter(
                 Question.id.in_(question_ids),
                 Question.exam_id.is_(None)  # Apenas questões não vinculadas a provas específicas
-            ).all()
+            ).options(selectinload(Question.alternatives)).all()
             
             if len(questions) != len(question_ids):
                 return jsonify({'error': 'Algumas questões não foram encontradas ou já estão vinculadas a outras provas'}), 404
@@ -1806,13 +2220,13 @@ def register_routes(app):
                     question_snapshot=question_snapshot
                 )
                 db.session.add(exam_question)
-                added_questions.append(question)
+                added_questions.append(question.to_dict())
             
             db.session.commit()
             
             return jsonify({
                 'message': f'{len(added_questions)} questões adicionadas à prova',
-                'questions': [q.to_dict() for q in added_questions]
+                'questions': added_questions
             }), 201
         except Exception as e:
             return jsonify({'error': str(e)}), 422
@@ -1820,14 +2234,11 @@ def register_routes(app):
     # Rotas específicas para estudantes
     @app.route('/api/student/classes', methods=['GET'])
     @jwt_required()
+    @role_required('student')
     def get_student_classes():
         """Obter turmas do estudante (matriculadas e solicitações)"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
-            
-            if user.role != 'student':
-                return jsonify({'error': 'Acesso negado'}), 403
             
             # Buscar todas as interações do estudante com turmas
             enrollments = db.session.query(
@@ -1868,19 +2279,14 @@ def register_routes(app):
 
     @app.route('/api/student/available-classes', methods=['GET'])
     @jwt_required()
+    @role_required('student')
     def get_student_available_classes():
         """Obter turmas disponíveis para o estudante"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
-            
-            if user.role != 'student':
-                return jsonify({'error': 'Acesso negado'}), 403
-            
-            # Buscar turmas ativas que o estudante não está matriculado
-            # Incluir também turmas onde ele foi rejeitado ou tem solicitação pendente
-            subquery = db.session.query(ClassEnrollment.class_id).filter_by(student_id=user_id)
             
+            # Buscar todas as turmas ativas com a situação do estudante em cada uma
+            # (outer join: enrollment_status é nulo sem matrícula; aprovadas também são listadas)
             classes_query = db.session.query(
                 Class.id,
                 Class.name,
@@ -1897,6 +2303,14 @@ def register_routes(app):
              ))\
              .filter(Class.is_active == True)
             
+            # Busca opcional por nome/descrição, com resposta limitada (?search=...&limit=N)
+            search = (request.args.get('search') or '').strip()
+            if search:
+                classes_query = classes_query.filter(class_search_filter(search))
+            if search or 'limit' in request.args:
+                classes_query = classes_query.order_by(Class.name, Class.id)\
+                    .limit(page_size(request.args.get('limit'), default=50))
+            
             classes = []
             for class_data in classes_query.all():
                 classes.append({
@@ -1916,17 +2330,22 @@ def register_routes(app):
 
     @app.route('/api/student/exams', methods=['GET'])
     @jwt_required()
+    @role_required('student')
     @smart_update_expired_exams(10)  # Verificar a cada 10 minutos para estudantes
+    @cached_response(lambda principal: [f'user:{principal.id}'])
     def get_student_exams():
         """Obter provas disponíveis para o estudante"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
             
-            if user.role != 'student':
-                return jsonify({'error': 'Acesso negado'}), 403
+            # Questões e pontuação máxima por prova (agregadas à parte para o JOIN com a matrícula não duplicar)
+            question_stats = db.session.query(
+                ExamQuestion.exam_id,
+                db.func.count(ExamQuestion.id).label('questions_count'),
+                db.func.sum(ExamQuestion.points).label('max_points')
+            ).group_by(ExamQuestion.exam_id).subquery()
             
-            # Buscar provas das turmas em que o estudante está matriculado
+            # Buscar provas das turmas em que o estudante está matriculado, já com a participação dele
             # Removido filtro de status para mostrar todas as provas (inclusive perdidas)
             exams_query = db.session.query(
                 Exam.id,
@@ -1939,7 +2358,15 @@ def register_routes(app):
                 Class.id.label('class_id'),
                 Class.name.label('class_name'),
                 User.name.label('instructor_name'),
-                db.func.count(ExamQuestion.id).label('questions_count')
+                db.func.coalesce(question_stats.c.questions_count, 0).label('questions_count'),
+                question_stats.c.max_points.label('exam_max_points'),
+                ExamEnrollment.id.label('enrollment_id'),
+                ExamEnrollment.status.label('enrollment_status'),
+                ExamEnrollment.start_time.label('enrollment_start_time'),
+                ExamEnrollment.end_time.label('enrollment_end_time'),
+                ExamEnrollment.total_points,
+                ExamEnrollment.max_points,
+                ExamEnrollment.percentage
             ).join(Class, Exam.class_id == Class.id)\
              .join(User, Class.instructor_id == User.id)\
              .join(ClassEnrollment, db.and_(
@@ -1947,41 +2374,32 @@ def register_routes(app):
                  ClassEnrollment.student_id == user_id,
                  ClassEnrollment.status == 'approved'
              ))\
-             .outerjoin(ExamQuestion, Exam.id == ExamQuestion.exam_id)\
+             .outerjoin(question_stats, Exam.id == question_stats.c.exam_id)\
+             .outerjoin(ExamEnrollment, db.and_(
+                 ExamEnrollment.exam_id == Exam.id,
+                 ExamEnrollment.student_id == user_id
+             ))\
              .filter(Exam.status.in_(['published', 'finished']))\
-             .group_by(Exam.id, Class.id, User.id)\
+             .order_by(Exam.id)\
              .all()
             
             exams = []
             for exam_data in exams_query:
-                # Verificar se o estudante já fez a prova
-                exam_result = ExamEnrollment.query.filter_by(
-                    exam_id=exam_data.id,
-                    student_id=user_id
-                ).first()
-                
                 result_data = None
-                if exam_result:
-                    # Calcular pontuação total das respostas
-                    total_points = db.session.query(
-                        db.func.sum(Answer.points_earned)
-                    ).filter(Answer.enrollment_id == exam_result.id).scalar() or 0
-                    
-                    # Calcular pontuação máxima possível
-                    max_points = db.session.query(
-                        db.func.sum(ExamQuestion.points)
-                    ).filter(ExamQuestion.exam_id == exam_data.id).scalar() or 0
-                    
-                    percentage = (total_points / max_points * 100) if max_points > 0 else 0
+                if exam_data.enrollment_id:
+                    # Totais gravados na matrícula ao finalizar/corrigir a prova
+                    total_points = float(exam_data.total_points or 0)
+                    max_points = float(exam_data.max_points or 0) or float(exam_data.exam_max_points or 0)
+                    percentage = float(exam_data.percentage or 0)
                     
                     result_data = {
-                        'id': exam_result.id,
-                        'total_points': float(total_points),
-                        'max_points': float(max_points),
-                        'percentage': float(percentage),
-                        'status': exam_result.status,
-                        'started_at': exam_result.start_time.isoformat() if exam_result.start_time else None,
-                        'finished_at': exam_result.end_time.isoformat() if exam_result.end_time else None
+                        'id': exam_data.enrollment_id,
+                        'total_points': total_points,
+                        'max_points': max_points,
+                        'percentage': percentage,
+                        'status': exam_data.enrollment_status,
+                        'started_at': exam_data.enrollment_start_time.isoformat() if exam_data.enrollment_start_time else None,
+                        'finished_at': exam_data.enrollment_end_time.isoformat() if exam_data.enrollment_end_time else None
                     }
                 
                 exams.append({
@@ -2005,74 +2423,90 @@ def register_routes(app):
 
     @app.route('/api/student/results', methods=['GET'])
     @jwt_required()
+    @role_required('student')
     def get_student_results():
         """Listar todos os resultados de provas do estudante logado"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
             
-            if user.role != 'student':
-                return jsonify({'error': 'Acesso negado'}), 403
+            # Contagens por matrícula/prova como subconsultas correlacionadas (usam os índices por FK)
+            answers_count = db.session.query(db.func.count(Answer.id)).filter(
+                Answer.enrollment_id == ExamEnrollment.id
+            ).correlate(ExamEnrollment).scalar_subquery()
+            questions_count = db.session.query(db.func.count(ExamQuestion.id)).filter(
+                ExamQuestion.exam_id == Exam.id
+            ).correlate(Exam).scalar_subquery()
             
-            # Buscar todas as matrículas do estudante que foram finalizadas
-            enrollments = ExamEnrollment.query.filter_by(
-                student_id=user_id,
-                status='completed'
-            ).all()
+            # Matrículas finalizadas do estudante com prova e turma em uma única consulta
+            query = db.session.query(
+                ExamEnrollment.id,
+                ExamEnrollment.status,
+                ExamEnrollment.start_time,
+                ExamEnrollment.end_time,
+                ExamEnrollment.total_points,
+                ExamEnrollment.max_points,
+                ExamEnrollment.percentage,
+                Exam.id.label('exam_id'),
+                Exam.title,
+                Exam.description,
+                Exam.duration_minutes,
+                Exam.start_time.label('exam_start_time'),
+                Exam.end_time.label('exam_end_time'),
+                Exam.class_id,
+                Class.name.label('class_name'),
+                answers_count.label('answers_count'),
+                questions_count.label('questions_count')
+            ).join(Exam, ExamEnrollment.exam_id == Exam.id)\
+             .outerjoin(Class, Exam.class_id == Class.id)\
+             .filter(
+                 ExamEnrollment.student_id == user_id,
+                 ExamEnrollment.status == 'completed'
+             )
+            
+            # Paginação opcional (histórico longo): ?limit=N&before=<finished_at>,<id>
+            paginate = 'limit' in request.args or 'before' in request.args
+            if paginate:
+                try:
+                    rows, next_cursor = keyset_page(
+                        query, ExamEnrollment.end_time, ExamEnrollment.id,
+                        cursor=request.args.get('before'),
+                        limit=page_size(request.args.get('limit'), default=20)
+                    )
+                except ValueError:
+                    return jsonify({'error': 'Parâmetro before inválido'}), 400
+            else:
+                # Ordenar por data de finalização (mais recente primeiro)
+                rows = query.order_by(ExamEnrollment.end_time.desc(), ExamEnrollment.id.desc()).all()
             
             results = []
-            for enrollment in enrollments:
-                # Buscar dados da prova
-                exam = Exam.query.get(enrollment.exam_id)
-                if not exam:
-                    continue
-                
-                # Buscar nome da turma se existir
-                class_name = None
-                if exam.class_id:
-                    class_obj = Class.query.get(exam.class_id)
-                    if class_obj:
-                        class_name = class_obj.name
-                
-                # Buscar respostas do estudante
-                answers = Answer.query.filter_by(enrollment_id=enrollment.id).all()
-                
-                # Contar questões da prova
-                questions_count = db.session.query(ExamQuestion).filter_by(exam_id=exam.id).count()
-                
-                # Usar resultados salvos no enrollment
-                total_points = float(enrollment.total_points) if enrollment.total_points else 0.0
-                max_points = float(enrollment.max_points) if enrollment.max_points else 0.0
-                percentage = float(enrollment.percentage) if enrollment.percentage else 0.0
-                
-                result = {
-                    'id': enrollment.id,
-                    'exam_id': exam.id,
+            for row in rows:
+                results.append({
+                    'id': row.id,
+                    'exam_id': row.exam_id,
                     'student_id': user_id,
-                    'total_points': total_points,
-                    'max_points': max_points,
-                    'percentage': percentage,
-                    'status': enrollment.status,
-                    'started_at': enrollment.start_time.isoformat() if enrollment.start_time else None,
-                    'finished_at': enrollment.end_time.isoformat() if enrollment.end_time else None,
-                    'answers_count': len(answers),
-                    'questions_count': questions_count,
+                    # Usar resultados salvos no enrollment
+                    'total_points': float(row.total_points) if row.total_points else 0.0,
+                    'max_points': float(row.max_points) if row.max_points else 0.0,
+                    'percentage': float(row.percentage) if row.percentage else 0.0,
+                    'status': row.status,
+                    'started_at': row.start_time.isoformat() if row.start_time else None,
+                    'finished_at': row.end_time.isoformat() if row.end_time else None,
+                    'answers_count': row.answers_count,
+                    'questions_count': row.questions_count,
                     'exam': {
-                        'id': exam.id,
-                        'title': exam.title,
-                        'description': exam.description,
-                        'duration_minutes': exam.duration_minutes,
-                        'start_time': exam.start_time.isoformat(),
-                        'end_time': exam.end_time.isoformat(),
-                        'class_id': exam.class_id,
-                        'class_name': class_name
+                        'id': row.exam_id,
+                        'title': row.title,
+                        'description': row.description,
+                        'duration_minutes': row.duration_minutes,
+                        'start_time': row.exam_start_time.isoformat(),
+                        'end_time': row.exam_end_time.isoformat(),
+                        'class_id': row.class_id,
+                        'class_name': row.class_name
                     }
-                }
-                results.append(result)
-            
-            # Ordenar por data de finalização (mais recente primeiro)
-            results.sort(key=lambda x: x['finished_at'] or '', reverse=True)
+                })
             
+            if paginate:
+                return jsonify({'results': results, 'next_cursor': next_cursor}), 200
             return jsonify(results), 200
             
         except Exception as e:
@@ -2080,14 +2514,11 @@ def register_routes(app):
 
     @app.route('/api/student/results/<int:exam_id>', methods=['GET'])
     @jwt_required()
+    @role_required('student')
     def get_student_exam_result(exam_id):
         """Obter resultado detalhado de uma prova do estudante"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
-            
-            if user.role != 'student':
-                return jsonify({'error': 'Acesso negado'}), 403
             
             # Buscar resultado da prova
             exam_result = ExamEnrollment.query.filter_by(
@@ -2170,22 +2601,34 @@ def register_routes(app):
 
     @app.route('/api/teacher/results', methods=['GET'])
     @jwt_required()
+    @cached_response(lambda principal: [f'user:{principal.id}', f'results:{principal.id}']
+                     if principal.role == 'professor' else None)
     def get_teacher_results():
         """Buscar todos os resultados das provas do professor"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             # Verificar se o usuário é professor ou admin
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Acesso negado'}), 403
             
-            # Buscar todas as matrículas com resultados
+            # Buscar todas as matrículas com resultados (tempo gasto calculado no banco)
             query = db.session.query(
-                ExamEnrollment,
-                Exam,
-                User,
-                Class
+                ExamEnrollment.id,
+                ExamEnrollment.total_points,
+                ExamEnrollment.max_points,
+                ExamEnrollment.percentage,
+                ExamEnrollment.status,
+                ExamEnrollment.start_time,
+                ExamEnrollment.end_time,
+                elapsed_minutes(ExamEnrollment.start_time, ExamEnrollment.end_time).label('time_taken'),
+                Exam.id.label('exam_id'),
+                Exam.title.label('exam_title'),
+                Class.name.label('class_name'),
+                User.id.label('student_id'),
+                User.name.label('student_name'),
+                User.email.label('student_email')
             ).join(
                 Exam, ExamEnrollment.exam_id == Exam.id
             ).join(
@@ -2207,34 +2650,79 @@ def register_routes(app):
                     )
                 )
             
-            results = query.all()
+            # Filtros opcionais: ?exam_id=&class_id=&from=<data>&to=<data> (data de finalização)
+            exam_id = request.args.get('exam_id', type=int)
+            if exam_id:
+                query = query.filter(Exam.id == exam_id)
+            class_id = request.args.get('class_id', type=int)
+            if class_id:
+                query = query.filter(Class.id == class_id)
+            try:
+                if request.args.get('from'):
+                    query = query.filter(ExamEnrollment.end_time >= datetime.fromisoformat(request.args['from']))
+                if request.args.get('to'):
+                    query = query.filter(ExamEnrollment.end_time <= datetime.fromisoformat(request.args['to']))
+            except ValueError:
+                return jsonify({'error': 'Parâmetros from/to inválidos'}), 400
+            
+            # Ordenação: ?sort=finished_at (padrão) ou percentage, ?order=desc (padrão) ou asc
+            if request.args.get('sort') == 'percentage':
+                # percentage pode ser nulo: ordenar e paginar por coalesce(percentage, -1), selecionado
+                # junto para que o cursor da última linha nunca seja "None,<id>"
+                sort_column, cast = db.func.coalesce(ExamEnrollment.percentage, -1).label('percentage_key'), Decimal
+                query = query.add_columns(sort_column)
+            else:
+                sort_column, cast = ExamEnrollment.end_time, datetime.fromisoformat
+            descending = request.args.get('order', 'desc').lower() != 'asc'
+            
+            def serialize(row):
+                return {
+                    'id': row.id,
+                    'exam_id': row.exam_id,
+                    'exam_title': row.exam_title,
+                    'class_name': row.class_name,
+                    'student_id': row.student_id,
+                    'student_name': row.student_name,
+                    'student_email': row.student_email,
+                    'total_points': float(row.total_points) if row.total_points else 0,
+                    'max_points': float(row.max_points) if row.max_points else 0,
+                    'percentage': float(row.percentage) if row.percentage else 0,
+                    'status': row.status,
+                    'started_at': row.start_time.isoformat() if row.start_time else None,
+                    'finished_at': row.end_time.isoformat() if row.end_time else None,
+                    'time_taken': row.time_taken
+                }
+            
+            # Paginação por cursor: ?limit=N&before=<valor da ordenação>,<id>
+            if 'limit' in request.args or 'before' in request.args:
+                try:
+                    rows, next_cursor = keyset_page(
+                        query, sort_column, ExamEnrollment.id,
+                        cursor=request.args.get('before'),
+                        limit=page_size(request.args.get('limit'), default=50),
+                        descending=descending,
+                        cast=cast
+                    )
+                except (ValueError, InvalidOperation):
+                    return jsonify({'error': 'Parâmetro before inválido'}), 400
+                return jsonify({'results': [serialize(row) for row in rows], 'next_cursor': next_cursor}), 200
             
-            results_data = []
-            for enrollment, exam, student, class_obj in results:
-                # Calcular tempo gasto se disponível
-                time_taken = None
-                if enrollment.start_time and enrollment.end_time:
-                    time_diff = enrollment.end_time - enrollment.start_time
-                    time_taken = int(time_diff.total_seconds() / 60)  # em minutos
+            if descending:
+                query = query.order_by(sort_column.desc(), ExamEnrollment.id.desc())
+            else:
+                query = query.order_by(sort_column.asc(), ExamEnrollment.id.asc())
+            
+            # Exportação: ?stream=true envia o mesmo array JSON em partes, sem montar a lista em memória
+            if request.args.get('stream', 'false').lower() == 'true':
+                def generate():
+                    yield '['
+                    for index, row in enumerate(query.yield_per(500)):
+                        yield (',' if index else '') + json.dumps(serialize(row))
+                    yield ']'
                 
-                results_data.append({
-                    'id': enrollment.id,
-                    'exam_id': exam.id,
-                    'exam_title': exam.title,
-                    'class_name': class_obj.name,
-                    'student_id': student.id,
-                    'student_name': student.name,
-                    'student_email': student.email,
-                    'total_points': float(enrollment.total_points) if enrollment.total_points else 0,
-                    'max_points': float(enrollment.max_points) if enrollment.max_points else 0,
-                    'percentage': float(enrollment.percentage) if enrollment.percentage else 0,
-                    'status': enrollment.status,
-                    'started_at': enrollment.start_time.isoformat() if enrollment.start_time else None,
-                    'finished_at': enrollment.end_time.isoformat() if enrollment.end_time else None,
-                    'time_taken': time_taken
-                })
+                return Response(stream_with_context(generate()), mimetype='application/json')
             
-            return jsonify(results_data), 200
+            return jsonify([serialize(row) for row in query.all()]), 200
             
         except Exception as e:
             print(f"Erro ao buscar resultados: {str(e)}")
@@ -2246,7 +2734,7 @@ def register_routes(app):
         """Correção manual de questões dissertativas"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Apenas professores podem fazer correção manual'}), 403
@@ -2339,67 +2827,92 @@ def register_routes(app):
         """Listar respostas dissertativas pendentes de correção"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Apenas professores podem acessar correções'}), 403
             
-            # Buscar provas do professor
-            if user.role == 'admin':
-                exams = Exam.query.all()
-            else:
-                exams = Exam.query.filter_by(created_by=user_id).all()
-            
-            exam_ids = [exam.id for exam in exams]
+            # Buscar respostas dissertativas pendentes (needs_review: sem pontuação ou com
+            # correction_method = 'pending'), com a pontuação da questão na prova
+            query = db.session.query(
+                Answer.id,
+                Answer.created_at,
+                Answer.answer_text,
+                Answer.similarity_score,
+                Answer.correction_method,
+                Question.id.label('question_id'),
+                Question.question_text,
+                Question.expected_answer,
+                Question.auto_correction_enabled,
+                User.name.label('student_name'),
+                User.email.label('student_email'),
+                Exam.id.label('exam_id'),
+                Exam.title.label('exam_title'),
+                ExamQuestion.points.label('max_points')
+            ).join(Question, Answer.question_id == Question.id)\
+             .join(ExamEnrollment, Answer.enrollment_id == ExamEnrollment.id)\
+             .join(User, ExamEnrollment.student_id == User.id)\
+             .join(Exam, ExamEnrollment.exam_id == Exam.id)\
+             .outerjoin(ExamQuestion, db.and_(
+                 ExamQuestion.exam_id == Exam.id,
+                 ExamQuestion.question_id == Answer.question_id
+             ))\
+             .filter(
+                 Answer.needs_review == True,
+                 Question.question_type == 'essay'
+             )
             
-            # Buscar respostas dissertativas pendentes
-            # Incluir tanto as que não têm pontuação quanto as que têm correction_method = 'pending'
-            pending_answers = db.session.query(Answer, Question, User, Exam, ExamEnrollment)\
-                .join(Question, Answer.question_id == Question.id)\
-                .join(ExamEnrollment, Answer.enrollment_id == ExamEnrollment.id)\
-                .join(User, ExamEnrollment.student_id == User.id)\
-                .join(Exam, ExamEnrollment.exam_id == Exam.id)\
-                .filter(
-                    Question.question_type == 'essay',
-                    db.or_(
-                        Answer.correction_method == 'pending',
-                        Answer.correction_method.is_(None),
-                        Answer.points_earned.is_(None)
-                    ),
-                    Answer.answer_text.isnot(None),
-                    Answer.answer_text != '',
-                    Exam.id.in_(exam_ids)
-                ).all()
+            # Provas do professor
+            if user.role != 'admin':
+                query = query.filter(Exam.created_by == user_id)
+            
+            # Fila por ordem de envio. A paginação por cursor é opcional (?limit=N&after=<created_at>,<id>);
+            # sem esses parâmetros a fila inteira é retornada, como antes
+            paginated = 'limit' in request.args or 'after' in request.args
+            next_cursor = None
+            if paginated:
+                try:
+                    pending_answers, next_cursor = keyset_page(
+                        query, Answer.created_at, Answer.id,
+                        cursor=request.args.get('after'),
+                        limit=page_size(request.args.get('limit'), default=50),
+                        descending=False
+                    )
+                except ValueError:
+                    return jsonify({'error': 'Parâmetro after inválido'}), 400
+            else:
+                pending_answers = query.order_by(Answer.created_at.asc(), Answer.id.asc()).all()
             
             corrections_data = []
-            for answer, question, student, exam, enrollment in pending_answers:
-                # Buscar pontuação da questão na prova
-                exam_question = ExamQuestion.query.filter_by(
-                    exam_id=exam.id,
-                    question_id=question.id
-                ).first()
-                
+            for answer in pending_answers:
                 corrections_data.append({
                     'answer_id': answer.id,
-                    'question_id': question.id,
-                    'question_text': question.question_text,
-                    'expected_answer': question.expected_answer,
+                    'question_id': answer.question_id,
+                    'question_text': answer.question_text,
+                    'expected_answer': answer.expected_answer,
                     'student_answer': answer.answer_text,
-                    'student_name': student.name,
-                    'student_email': student.email,
-                    'exam_title': exam.title,
-                    'exam_id': exam.id,
-                    'max_points': float(exam_question.points) if exam_question else 0.0,
+                    'student_name': answer.student_name,
+                    'student_email': answer.student_email,
+                    'exam_title': answer.exam_title,
+                    'exam_id': answer.exam_id,
+                    'max_points': float(answer.max_points) if answer.max_points is not None else 0.0,
                     'similarity_score': float(answer.similarity_score) if answer.similarity_score else None,
                     'correction_method': answer.correction_method,
-                    'auto_correction_enabled': question.auto_correction_enabled,
+                    'auto_correction_enabled': answer.auto_correction_enabled,
                     'created_at': answer.created_at.isoformat()
                 })
             
-            return jsonify({
-                'pending_corrections': corrections_data,
-                'total_count': len(corrections_data)
-            }), 200
+            if not paginated:
+                return jsonify({
+                    'pending_corrections': corrections_data,
+                    'total_count': len(corrections_data)
+                }), 200
+            
+            response = {'pending_corrections': corrections_data, 'next_cursor': next_cursor}
+            # Contagem total só na primeira página, para não repetir o COUNT a cada página
+            if not request.args.get('after'):
+                response['total_count'] = query.order_by(None).count()
+            return jsonify(response), 200
             
         except Exception as e:
             return jsonify({'error': str(e)}), 422
@@ -2410,7 +2923,7 @@ def register_routes(app):
         """Recalcular notas de uma prova específica ou de um aluno específico"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             # Verificar se o usuário é professor ou admin
             if user.role not in ['professor', 'admin']:
@@ -2702,79 +3215,98 @@ def register_routes(app):
         """Obter dados para página de revisão de correções"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             # Verificar se o usuário é professor ou admin
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Acesso negado'}), 403
             
-            # Buscar provas do professor ou todas (se admin)
-            if user.role == 'admin':
-                exams = Exam.query.filter(Exam.status == 'published').all()
-            else:
-                # Buscar provas onde:
-                # 1. Professor é instrutor da turma OU
-                # 2. Professor é criador da prova
-                classes = Class.query.filter_by(instructor_id=user_id).all()
-                class_ids = [c.id for c in classes]
-                
-                exams = Exam.query.filter(
-                                            db.or_(
-                            Exam.class_id.in_(class_ids),
-                            Exam.created_by == int(user_id)
-                        ),
-                    Exam.status == 'published'
-                ).all()
-            
-            correction_data = []
+            is_pending = db.or_(Answer.correction_method == 'pending', Answer.correction_method.is_(None))
+            pending_count = db.func.count(Answer.id).filter(is_pending)
             
-            for exam in exams:
-                # Buscar matrículas finalizadas para esta prova
-                enrollments = ExamEnrollment.query.filter_by(
-                    exam_id=exam.id,
-                    status='completed'
-                ).all()
-                
-                for enrollment in enrollments:
-                    student = User.query.get(enrollment.student_id)
-                    
-                    # Buscar respostas dissertativas pendentes ou já corrigidas
-                    essay_answers = db.session.query(Answer).join(Question).filter(
-                        Answer.enrollment_id == enrollment.id,
-                        Question.question_type == 'essay'
-                    ).all()
-                    
-                    pending_count = sum(1 for answer in essay_answers 
-                                      if answer.correction_method in ['pending', None])
-                    
-                    auto_corrected_count = sum(1 for answer in essay_answers 
-                                             if answer.correction_method == 'auto')
-                    
-                    manual_corrected_count = sum(1 for answer in essay_answers 
-                                               if answer.correction_method == 'manual')
-                    
-                    if essay_answers:  # Só incluir se houver questões dissertativas
-                        correction_data.append({
-                            'enrollment_id': enrollment.id,
-                            'exam_id': exam.id,
-                            'exam_title': exam.title,
-                            'student_id': student.id,
-                            'student_name': student.name,
-                            'student_email': student.email,
-                            'total_points': float(enrollment.total_points) if enrollment.total_points else 0.0,
-                            'max_points': float(enrollment.max_points) if enrollment.max_points else 0.0,
-                            'percentage': float(enrollment.percentage) if enrollment.percentage else 0.0,
-                            'essay_questions_count': len(essay_answers),
-                            'pending_corrections': pending_count,
-                            'auto_corrected': auto_corrected_count,
-                            'manual_corrected': manual_corrected_count,
-                            'completed_at': enrollment.completed_at.isoformat() if enrollment.completed_at else None
-                        })
+            # Uma linha por matrícula finalizada com as contagens das respostas dissertativas
+            # (o JOIN com as respostas só mantém matrículas com questões dissertativas)
+            query = db.session.query(
+                ExamEnrollment.id.label('enrollment_id'),
+                Exam.id.label('exam_id'),
+                Exam.title.label('exam_title'),
+                User.id.label('student_id'),
+                User.name.label('student_name'),
+                User.email.label('student_email'),
+                ExamEnrollment.total_points,
+                ExamEnrollment.max_points,
+                ExamEnrollment.percentage,
+                ExamEnrollment.completed_at,
+                db.func.count(Answer.id).label('essay_questions_count'),
+                pending_count.label('pending_corrections'),
+                db.func.count(Answer.id).filter(Answer.correction_method == 'auto').label('auto_corrected'),
+                db.func.count(Answer.id).filter(Answer.correction_method == 'manual').label('manual_corrected')
+            ).join(Exam, ExamEnrollment.exam_id == Exam.id)\
+             .join(User, ExamEnrollment.student_id == User.id)\
+             .join(Answer, Answer.enrollment_id == ExamEnrollment.id)\
+             .join(Question, Answer.question_id == Question.id)\
+             .filter(
+                 ExamEnrollment.status == 'completed',
+                 Exam.status == 'published',
+                 Question.question_type == 'essay'
+             )
             
-            return jsonify({
+            # Provas do professor (instrutor da turma ou criador da prova) ou todas (se admin)
+            if user.role != 'admin':
+                instructor_class_ids = db.session.query(Class.id).filter(Class.instructor_id == user_id)
+                query = query.filter(db.or_(
+                    Exam.class_id.in_(instructor_class_ids),
+                    Exam.created_by == int(user_id)
+                ))
+            
+            # Mais correções pendentes primeiro
+            query = query.group_by(ExamEnrollment.id, Exam.id, User.id)\
+                .order_by(pending_count.desc(), ExamEnrollment.completed_at.desc(), ExamEnrollment.id.desc())
+            
+            # Paginação opcional: ?page=N&per_page=M
+            pagination = None
+            if 'page' in request.args:
+                pagination = query.paginate(
+                    page=request.args.get('page', 1, type=int),
+                    per_page=min(request.args.get('per_page', 20, type=int), 100),
+                    error_out=False
+                )
+                rows = pagination.items
+            else:
+                rows = query.all()
+            
+            correction_data = [{
+                'enrollment_id': row.enrollment_id,
+                'exam_id': row.exam_id,
+                'exam_title': row.exam_title,
+                'student_id': row.student_id,
+                'student_name': row.student_name,
+                'student_email': row.student_email,
+                'total_points': float(row.total_points) if row.total_points else 0.0,
+                'max_points': float(row.max_points) if row.max_points else 0.0,
+                'percentage': float(row.percentage) if row.percentage else 0.0,
+                'essay_questions_count': row.essay_questions_count,
+                'pending_corrections': row.pending_corrections,
+                'auto_corrected': row.auto_corrected,
+                'manual_corrected': row.manual_corrected,
+                'completed_at': row.completed_at.isoformat() if row.completed_at else None
+            } for row in rows]
+            
+            response = {
                 'corrections': correction_data,
-                'total_count': len(correction_data)
-            }), 200
+                'total_count': pagination.total if pagination else len(correction_data)
+            }
+            if pagination:
+                response['pagination'] = {
+                    'total': pagination.total,
+                    'pages': pagination.pages,
+                    'current_page': pagination.page,
+                    'per_page': pagination.per_page,
+                    'has_prev': pagination.has_prev,
+                    'has_next': pagination.has_next
+                }
+            
+            return jsonify(response), 200
             
         except Exception as e:
             return jsonify({'error': str(e)}), 422
@@ -2785,23 +3317,25 @@ def register_routes(app):
         """Obter detalhes da prova de um aluno específico"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             # Verificar se o usuário é professor ou admin
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Acesso negado'}), 403
             
-            # Buscar matrícula
-            enrollment = ExamEnrollment.query.get_or_404(enrollment_id)
-            exam = Exam.query.get_or_404(enrollment.exam_id)
-            student = User.query.get_or_404(enrollment.student_id)
+            # Buscar matrícula com prova, aluno e turma
+            enrollment, exam, student, class_obj = db.session.query(ExamEnrollment, Exam, User, Class)\
+                .join(Exam, ExamEnrollment.exam_id == Exam.id)\
+                .join(User, ExamEnrollment.student_id == User.id)\
+                .outerjoin(Class, Exam.class_id == Class.id)\
+                .filter(ExamEnrollment.id == enrollment_id)\
+                .first_or_404()
             
             # Verificar se o professor tem acesso a esta prova
             if user.role == 'professor':
                 # Professor tem acesso se:
                 # 1. É o instrutor da turma da prova OU
                 # 2. É o criador da prova
-                class_obj = Class.query.get(exam.class_id)
                 has_access = False
                 
                 if class_obj and class_obj.instructor_id == int(user_id):
@@ -2812,29 +3346,36 @@ def register_routes(app):
                 if not has_access:
                     return jsonify({'error': 'Acesso negado a esta prova'}), 403
             
-            # Buscar todas as respostas do aluno
-            answers = Answer.query.filter_by(enrollment_id=enrollment_id).all()
+            # Buscar todas as respostas do aluno com a questão e a pontuação dela na prova
+            answers = db.session.query(Answer, Question, ExamQuestion.points)\
+                .join(Question, Answer.question_id == Question.id)\
+                .outerjoin(ExamQuestion, db.and_(
+                    ExamQuestion.exam_id == exam.id,
+                    ExamQuestion.question_id == Answer.question_id
+                ))\
+                .filter(Answer.enrollment_id == enrollment_id)\
+                .order_by(Answer.id)\
+                .all()
+            
+            # Alternativas de todas as questões objetivas respondidas em uma única consulta
+            objective_question_ids = {question.id for _, question, _ in answers if question.question_type != 'essay'}
+            alternatives_by_question = {}
+            if objective_question_ids:
+                for alt in Alternative.query.filter(
+                    Alternative.question_id.in_(objective_question_ids)
+                ).order_by(Alternative.question_id, Alternative.order_number):
+                    alternatives_by_question.setdefault(alt.question_id, []).append(alt)
             
             # Organizar respostas por questão
             answers_data = []
-            for answer in answers:
-                question = Question.query.get(answer.question_id)
-                if not question:
-                    continue
-                
-                # Buscar pontuação da questão no exame
-                exam_question = ExamQuestion.query.filter_by(
-                    exam_id=exam.id,
-                    question_id=question.id
-                ).first()
-                
+            for answer, question, question_points in answers:
                 answer_data = {
                     'id': answer.id,
                     'question_id': question.id,
                     'question_text': question.question_text,
                     'question_type': question.question_type,
                     'expected_answer': question.expected_answer,
-                    'max_points': float(exam_question.points) if exam_question else 0.0,
+                    'max_points': float(question_points) if question_points is not None else 0.0,
                     'points_earned': float(answer.points_earned) if answer.points_earned else 0.0,
                     'correction_method': answer.correction_method or 'pending',
                     'similarity_score': float(answer.similarity_score) if answer.similarity_score else None,
@@ -2844,9 +3385,8 @@ def register_routes(app):
                     'selected_alternatives': answer.selected_alternatives or []
                 }
                 
-                # Para questões objetivas, buscar alternativas
+                # Para questões objetivas, incluir alternativas
                 if question.question_type != 'essay':
-                    alternatives = Alternative.query.filter_by(question_id=question.id).order_by(Alternative.order_number).all()
                     answer_data['alternatives'] = [
                         {
                             'id': alt.id,
@@ -2854,14 +3394,11 @@ def register_routes(app):
                             'is_correct': alt.is_correct,
                             'selected': alt.id in (answer.selected_alternatives or [])
                         }
-                        for alt in alternatives
+                        for alt in alternatives_by_question.get(question.id, [])
                     ]
                 
                 answers_data.append(answer_data)
             
-            # Buscar informações da turma
-            class_obj = Class.query.get(exam.class_id)
-            
             # Calcular tempo gasto (se disponível)
             time_taken = None
             if enrollment.completed_at and enrollment.start_time:
@@ -2894,7 +3431,7 @@ def register_routes(app):
         """Atualizar correção manual de uma questão dissertativa"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             # Verificar se o usuário é professor ou admin
             if user.role not in ['professor', 'admin']:
@@ -2988,16 +3525,10 @@ def register_routes(app):
     # Rota administrativa para atualizar provas expiradas
     @app.route('/api/admin/update-expired-exams', methods=['POST'])
     @jwt_required()
+    @role_required('admin', 'professor')
     def manual_update_expired_exams():
         """Rota administrativa para atualizar manualmente provas expiradas"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
-            
-            # Apenas administradores e professores podem executar
-            if user.role not in ['admin', 'teacher']:
-                return jsonify({'error': 'Acesso negado'}), 403
-            
             updated_count = update_expired_exams()
             
             return jsonify({
@@ -3009,13 +3540,73 @@ def register_routes(app):
         except Exception as e:
             return jsonify({'error': str(e)}), 422 
 
+    @app.route('/api/admin/monitoring/maintenance', methods=['POST'])
+    @jwt_required()
+    @role_required('admin')
+    def manual_monitoring_maintenance():
+        """Rota administrativa para executar a consolidação e a retenção do monitoramento"""
+        try:
+            from monitoring import run_monitoring_maintenance
+            summary = run_monitoring_maintenance(app.config)
+            
+            return jsonify({
+                'message': 'Manutenção do monitoramento concluída',
+                **summary,
+                'timestamp': datetime.utcnow().isoformat()
+            }), 200
+            
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 422
+
+    @app.route('/api/admin/monitoring/detector-stats', methods=['GET'])
+    @jwt_required()
+    @role_required('admin')
+    def get_monitoring_detector_stats():
+        """Tamanho dos buffers do detector de taxa"""
+        try:
+            return jsonify(rate_detector.stats()), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 422
+
+    @app.route('/api/admin/response-cache/stats', methods=['GET'])
+    @jwt_required()
+    @role_required('admin')
+    def get_response_cache_stats():
+        """Taxa de acerto do cache de respostas por endpoint (deste processo)"""
+        try:
+            return jsonify(cache_stats()), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 422
+
+    @app.route('/api/admin/notifications/compact', methods=['POST'])
+    @jwt_required()
+    @role_required('admin')
+    def manual_notification_compaction():
+        """Rota administrativa para executar a retenção e compactação de notificações"""
+        try:
+            from notification_retention import compact_notifications
+            summary = compact_notifications(app.config.get('NOTIFICATION_READ_RETENTION_DAYS', 90))
+            
+            return jsonify({
+                'message': 'Compactação de notificações concluída',
+                **summary,
+                'timestamp': datetime.utcnow().isoformat()
+            }), 200
+            
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 422
+
     @app.route('/api/monitoring/exam-stats/<int:exam_id>', methods=['GET'])
     @jwt_required()
     def get_exam_monitoring_stats(exam_id):
         """Obter estatísticas de monitoramento de uma prova específica"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             # Verificar se o usuário tem permissão
             exam = Exam.query.get_or_404(exam_id)
@@ -3049,7 +3640,7 @@ def register_routes(app):
                     'student_id': enrollment.student_id,
                     'student_name': student.name,
                     'enrollment_id': enrollment.id,
-                    'total_events': len(student_events),
+                    'total_events': analysis.get('total_events', 0),
                     'risk_level': analysis['risk_level'],
                     'risk_score': analysis['risk_score'],
                     'patterns': analysis['patterns'],
@@ -3057,7 +3648,7 @@ def register_routes(app):
                 }
             
             # Estatísticas gerais da prova
-            total_suspicious = len(suspicious_events)
+            total_suspicious = sum(event_weight(e.event_data) for e in suspicious_events)
             high_risk_students = len([s for s in student_stats.values() if s['risk_level'] == 'high'])
             medium_risk_students = len([s for s in student_stats.values() if s['risk_level'] == 'medium'])
             
@@ -3084,40 +3675,166 @@ def register_routes(app):
             user_id = get_jwt_identity()
             
             # Filtros opcionais
-            limit = request.args.get('limit', 20, type=int)
+            limit = page_size(request.args.get('limit'), default=20)
             unread_only = request.args.get('unread_only', 'false').lower() == 'true'
+            # Cursor da página anterior: before=<created_at>,<id>
+            before = request.args.get('before')
             
             query = Notification.query.filter_by(user_id=user_id)
             
             if unread_only:
                 query = query.filter_by(is_read=False)
             
-            notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
+            try:
+                notifications, next_cursor = keyset_page(
+                    query, Notification.created_at, Notification.id, cursor=before, limit=limit
+                )
+            except ValueError:
+                return jsonify({'error': 'Parâmetro before inválido'}), 400
             
-            # Contar não lidas
-            unread_count = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+            # Contador mantido em users.unread_notifications (sem COUNT na tabela de notificações)
+            unread_count = get_unread_count(user_id)
             
             return jsonify({
                 'notifications': [n.to_dict() for n in notifications],
                 'unread_count': unread_count,
-                'total_count': len(notifications)
+                'total_count': len(notifications),
+                'next_cursor': next_cursor
             }), 200
             
         except Exception as e:
             return jsonify({'error': str(e)}), 422
 
-    @app.route('/api/notifications', methods=['POST'])
+    @app.route('/api/notifications/unread-count', methods=['GET'])
     @jwt_required()
-    def create_notification():
-        """Criar nova notificação"""
+    def get_notifications_unread_count():
+        """Obter apenas o contador de notificações não lidas (para polling)"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
             
-            # Apenas admins e professores podem criar notificações para outros usuários
-            if user.role not in ['admin', 'professor']:
-                return jsonify({'error': 'Sem permissão para criar notificações'}), 403
+            # ?refresh=true recalcula a partir da tabela de notificações
+            if request.args.get('refresh', 'false').lower() == 'true':
+                unread_count = recount_unread(user_id)
+                db.session.commit()
+            else:
+                unread_count = get_unread_count(user_id)
+            
+            return jsonify({'unread_count': unread_count}), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 422
+
+    def _notifications_since(user_id, since_id, limit=50):
+        return Notification.query.filter(
+            Notification.user_id == user_id,
+            Notification.id > since_id
+        ).order_by(Notification.id).limit(limit).all()
+
+    @app.route('/api/notifications/stream-ticket', methods=['POST'])
+    @jwt_required()
+    def create_notification_stream_ticket():
+        """Ticket para abrir /api/notifications/stream?ticket=... (um por conexão/reconexão)"""
+        try:
+            return jsonify({
+                'ticket': issue_stream_ticket(get_jwt_identity()),
+                'expires_in': app.config.get('NOTIFICATION_STREAM_TICKET_SECONDS', 60)
+            }), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 422
+
+    @app.route('/api/notifications/stream', methods=['GET'])
+    def stream_notifications():
+        """
+        Server-Sent Events: envia o contador de não lidas e as notificações novas assim que
+        são criadas. EventSource não envia cabeçalhos: a autenticação é o ?ticket= obtido em
+        POST /api/notifications/stream-ticket (o access token não é aceito na URL).
+        """
+        user_id = read_stream_ticket(request.args.get('ticket', ''))
+        if user_id is None:
+            return jsonify({'message': 'Ticket do stream inválido ou expirado'}), 401
+        since_id = request.args.get('since_id', 0, type=int)
+        try:
+            subscription = hub.subscribe(user_id)
+        except HubFull:
+            return jsonify({'error': 'Limite de conexões atingido, use o polling'}), 503, {'Retry-After': '30'}
+        
+        max_seconds = app.config.get('NOTIFICATION_STREAM_MAX_SECONDS', 300)
+        
+        def events():
+            last_id = since_id
+            deadline = time.monotonic() + max_seconds
+            try:
+                yield 'retry: 5000\n\n'
+                if not last_id:
+                    # Sem since_id: só o que for criado a partir de agora
+                    last_id = db.session.query(db.func.max(Notification.id)).filter(
+                        Notification.user_id == user_id
+                    ).scalar() or 0
+                while True:
+                    new_notifications = _notifications_since(user_id, last_id)
+                    payload = {
+                        'unread_count': get_unread_count(user_id, use_cache=False),
+                        'notifications': [n.to_dict() for n in new_notifications]
+                    }
+                    if new_notifications:
+                        last_id = new_notifications[-1].id
+                    # Não segurar conexão do pool enquanto espera
+                    db.session.close()
+                    
+                    yield f'id: {last_id}\nevent: notifications\ndata: {json.dumps(payload)}\n\n'
+                    
+                    while not subscription.wait(timeout=25):
+                        if time.monotonic() >= deadline:
+                            return
+                        yield ': keep-alive\n\n'
+                    if time.monotonic() >= deadline:
+                        return
+            finally:
+                subscription.close()
+        
+        return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
+    @app.route('/api/notifications/poll', methods=['GET'])
+    @jwt_required()
+    def long_poll_notifications():
+        """Long-poll: responde quando há notificações com id > since_id ou ao fim do timeout"""
+        try:
+            user_id = int(get_jwt_identity())
+            since_id = request.args.get('since_id', 0, type=int)
+            timeout = min(request.args.get('timeout', app.config.get('NOTIFICATION_LONG_POLL_SECONDS', 25), type=int),
+                          app.config.get('NOTIFICATION_LONG_POLL_SECONDS', 25))
+            
+            try:
+                subscription = hub.subscribe(user_id)
+            except HubFull:
+                return jsonify({'error': 'Limite de conexões atingido, tente novamente'}), 503, {'Retry-After': '30'}
+            
+            with subscription:
+                new_notifications = _notifications_since(user_id, since_id)
+                if not new_notifications:
+                    db.session.close()
+                    if subscription.wait(timeout=max(timeout, 0)):
+                        new_notifications = _notifications_since(user_id, since_id)
             
+            return jsonify({
+                'notifications': [n.to_dict() for n in new_notifications],
+                'unread_count': get_unread_count(user_id, use_cache=False),
+                'last_id': new_notifications[-1].id if new_notifications else since_id
+            }), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 422
+
+    @app.route('/api/notifications', methods=['POST'])
+    @jwt_required()
+    @role_required('admin', 'professor', message='Sem permissão para criar notificações')
+    def create_notification():
+        """Criar nova notificação"""
+        try:
             data = request.get_json()
             
             notification = Notification(
@@ -3130,6 +3847,8 @@ def register_routes(app):
             )
             
             db.session.add(notification)
+            adjust_unread([data['user_id']])
+            hub.announce([data['user_id']])
             db.session.commit()
             
             return jsonify(notification.to_dict()), 201
@@ -3149,6 +3868,8 @@ def register_routes(app):
                 user_id=user_id
             ).first_or_404()
             
+            if not notification.is_read:
+                adjust_unread({user_id: -1})
             notification.is_read = True
             notification.read_at = datetime.utcnow()
             
@@ -3166,19 +3887,55 @@ def register_routes(app):
         try:
             user_id = get_jwt_identity()
             
-            notifications = Notification.query.filter_by(
+            # Um único UPDATE, sem carregar as notificações na sessão
+            updated = Notification.query.filter_by(
                 user_id=user_id,
                 is_read=False
-            ).all()
+            ).update({'is_read': True, 'read_at': datetime.utcnow()}, synchronize_session=False)
+            
+            # Subtrair só as que foram marcadas: notificações criadas por outra transação
+            # depois do UPDATE continuam contadas
+            adjust_unread({user_id: -updated})
+            db.session.commit()
+            
+            return jsonify({
+                'message': f'{updated} notificações marcadas como lidas',
+                'updated': updated
+            }), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 422
+
+    @app.route('/api/notifications/mark-read', methods=['PATCH'])
+    @jwt_required()
+    def mark_notifications_read():
+        """Marcar como lidas as notificações informadas em {'ids': [...]}"""
+        try:
+            user_id = get_jwt_identity()
+            data = request.get_json() or {}
+            ids = data.get('ids')
+            
+            if not isinstance(ids, list) or not ids:
+                return jsonify({'error': 'Informe uma lista de ids'}), 400
+            if len(ids) > 1000:
+                return jsonify({'error': 'Máximo de 1000 notificações por requisição'}), 400
+            try:
+                ids = {int(notification_id) for notification_id in ids}
+            except (TypeError, ValueError):
+                return jsonify({'error': 'ids devem ser inteiros'}), 400
             
-            for notification in notifications:
-                notification.is_read = True
-                notification.read_at = datetime.utcnow()
+            updated = Notification.query.filter(
+                Notification.user_id == user_id,
+                Notification.id.in_(ids),
+                Notification.is_read == False
+            ).update({'is_read': True, 'read_at': datetime.utcnow()}, synchronize_session=False)
             
+            adjust_unread({user_id: -updated})
             db.session.commit()
             
             return jsonify({
-                'message': f'{len(notifications)} notificações marcadas como lidas'
+                'message': f'{updated} notificações marcadas como lidas',
+                'updated': updated
             }), 200
             
         except Exception as e:
@@ -3196,6 +3953,8 @@ def register_routes(app):
                 user_id=user_id
             ).first_or_404()
             
+            if not notification.is_read:
+                adjust_unread({user_id: -1})
             db.session.delete(notification)
             db.session.commit()
             
@@ -3211,17 +3970,24 @@ def register_routes(app):
         try:
             user_id = get_jwt_identity()
             
-            # Buscar todas as notificações do usuário
-            notifications = Notification.query.filter_by(user_id=user_id).all()
-            
-            # Excluir todas
-            for notification in notifications:
-                db.session.delete(notification)
+            # DELETEs sem carregar as notificações na sessão, separados por is_read para subtrair
+            # do contador exatamente as não lidas excluídas (as criadas por outra transação
+            # durante a exclusão continuam, e contadas)
+            unread_deleted = Notification.query.filter_by(
+                user_id=user_id,
+                is_read=False
+            ).delete(synchronize_session=False)
+            deleted = unread_deleted + Notification.query.filter_by(
+                user_id=user_id,
+                is_read=True
+            ).delete(synchronize_session=False)
             
+            adjust_unread({user_id: -unread_deleted})
             db.session.commit()
             
             return jsonify({
-                'message': f'{len(notifications)} notificações excluídas com sucesso'
+                'message': f'{deleted} notificações excluídas com sucesso',
+                'deleted': deleted
             }), 200
             
         except Exception as e:
@@ -3233,7 +3999,7 @@ def register_routes(app):
         """Corrigir uma única resposta dissertativa automaticamente"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Apenas professores podem fazer correção automática'}), 403
@@ -3344,7 +4110,7 @@ def register_routes(app):
         """Recorrigir completamente uma prova do zero"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Apenas professores podem fazer recorreção completa'}), 403
@@ -3518,7 +4284,7 @@ def register_routes(app):
         """Recalcular uma prova específica usando similaridade quando correção automática não disponível"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Apenas professores podem recalcular'}), 403
@@ -3644,7 +4410,7 @@ def register_routes(app):
         """Recorrigir uma prova específica de um aluno (enrollment)"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Apenas professores podem fazer recorreção'}), 403
@@ -3818,58 +4584,52 @@ def register_routes(app):
         """Obter resumo de provas com correções pendentes"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Apenas professores podem acessar correções'}), 403
             
-            # Buscar provas do professor
-            if user.role == 'admin':
-                exams = Exam.query.all()
-            else:
-                exams = Exam.query.filter_by(created_by=user_id).all()
+            # Respostas dissertativas aguardando correção (índice parcial idx_answers_needs_review)
+            pending_answers = db.session.query(
+                Answer.id,
+                Answer.enrollment_id
+            ).join(Question, Answer.question_id == Question.id).filter(
+                Answer.needs_review == True,
+                Question.question_type == 'essay'
+            ).subquery()
             
-            pending_exams = []
+            pending_count = db.func.count(pending_answers.c.id)
             
-            for exam in exams:
-                # Contar correções pendentes desta prova
-                pending_count = db.session.query(Answer).join(Question).join(ExamEnrollment).filter(
-                    Question.question_type == 'essay',
-                    db.or_(
-                        Answer.correction_method == 'pending',
-                        Answer.correction_method.is_(None),
-                        Answer.points_earned.is_(None)
-                    ),
-                    Answer.answer_text.isnot(None),
-                    Answer.answer_text != '',
-                    ExamEnrollment.exam_id == exam.id,
-                    ExamEnrollment.status == 'completed'
-                ).count()
-                
-                if pending_count > 0:
-                    # Contar total de alunos que fizeram a prova
-                    total_students = ExamEnrollment.query.filter_by(
-                        exam_id=exam.id,
-                        status='completed'
-                    ).count()
-                    
-                    # Buscar nome da turma
-                    class_name = None
-                    if exam.class_id:
-                        class_obj = Class.query.get(exam.class_id)
-                        if class_obj:
-                            class_name = class_obj.name
-                    
-                    pending_exams.append({
-                        'exam_id': exam.id,
-                        'exam_title': exam.title,
-                        'class_name': class_name,
-                        'pending_count': pending_count,
-                        'total_students': total_students
-                    })
+            # Pendências e alunos que finalizaram, agrupados por prova em uma única consulta
+            query = db.session.query(
+                Exam.id.label('exam_id'),
+                Exam.title.label('exam_title'),
+                Class.name.label('class_name'),
+                pending_count.label('pending_count'),
+                db.func.count(db.distinct(ExamEnrollment.id)).label('total_students')
+            ).join(ExamEnrollment, db.and_(
+                ExamEnrollment.exam_id == Exam.id,
+                ExamEnrollment.status == 'completed'
+            )).outerjoin(Class, Exam.class_id == Class.id)\
+             .outerjoin(pending_answers, pending_answers.c.enrollment_id == ExamEnrollment.id)
+            
+            # Provas do professor
+            if user.role != 'admin':
+                query = query.filter(Exam.created_by == user_id)
             
             # Ordenar por maior número de pendências
-            pending_exams.sort(key=lambda x: x['pending_count'], reverse=True)
+            rows = query.group_by(Exam.id, Class.id)\
+                .having(pending_count > 0)\
+                .order_by(pending_count.desc(), Exam.id)\
+                .all()
+            
+            pending_exams = [{
+                'exam_id': row.exam_id,
+                'exam_title': row.exam_title,
+                'class_name': row.class_name,
+                'pending_count': row.pending_count,
+                'total_students': row.total_students
+            } for row in rows]
             
             return jsonify(pending_exams), 200
             
@@ -3882,7 +4642,7 @@ def register_routes(app):
         """Obter correções pendentes de uma prova específica"""
         try:
             user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
+            user = current_principal()
             
             if user.role not in ['professor', 'admin']:
                 return jsonify({'error': 'Apenas professores podem acessar correções'}), 403
@@ -3916,14 +4676,8 @@ def register_routes(app):
              .join(User, ExamEnrollment.student_id == User.id)\
              .join(Exam, ExamEnrollment.exam_id == Exam.id)\
              .filter(
+                 Answer.needs_review == True,
                  Question.question_type == 'essay',
-                 db.or_(
-                     Answer.correction_method == 'pending',
-                     Answer.correction_method.is_(None),
-                     Answer.points_earned.is_(None)
-                 ),
-                 Answer.answer_text.isnot(None),
-                 Answer.answer_text != '',
                  ExamEnrollment.exam_id == exam_id,
                  ExamEnrollment.status == 'completed'
              ).order_by(User.name, Question.id).all()
@@ -4091,15 +4845,10 @@ def register_routes(app):
 
     @app.route('/api/admin/platform-evaluations', methods=['GET'])
     @jwt_required()
+    @role_required('admin', message='Apenas administradores podem acessar este recurso')
     def list_platform_evaluations():
         """Listar todas as avaliações da plataforma (admin)"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
-            
-            if user.role != 'admin':
-                return jsonify({'error': 'Apenas administradores podem acessar este recurso'}), 403
-            
             # Parâmetros de paginação
             page = request.args.get('page', 1, type=int)
             per_page = request.args.get('per_page', 10, type=int)
@@ -4130,15 +4879,10 @@ def register_routes(app):
 
     @app.route('/api/admin/platform-evaluations/stats', methods=['GET'])
     @jwt_required()
+    @role_required('admin', message='Apenas administradores podem acessar este recurso')
     def get_platform_evaluation_stats():
         """Obter estatísticas das avaliações da plataforma (admin)"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
-            
-            if user.role != 'admin':
-                return jsonify({'error': 'Apenas administradores podem acessar este recurso'}), 403
-            
             # Contar total de avaliações
             total_evaluations = PlatformEvaluation.query.count()
             
@@ -4229,15 +4973,10 @@ def register_routes(app):
 
     @app.route('/api/admin/platform-evaluations/export', methods=['GET'])
     @jwt_required()
+    @role_required('admin', message='Apenas administradores podem acessar este recurso')
     def export_platform_evaluations():
         """Exportar todas as avaliações da plataforma (admin)"""
         try:
-            user_id = get_jwt_identity()
-            user = User.query.get_or_404(user_id)
-            
-            if user.role != 'admin':
-                return jsonify({'error': 'Apenas administradores podem acessar este recurso'}), 403
-            
             # Buscar todas as avaliações
             evaluations = PlatformEvaluation.query.order_by(PlatformEvaluation.created_at.desc()).all()
             
@@ -4252,15 +4991,10 @@ def register_routes(app):
 
     @app.route('/api/admin/analytics/dashboard', methods=['GET'])
     @jwt_required()
+    @role_required('admin')
     def get_admin_analytics():
         """Obter estatísticas avançadas para o dashboard administrativo"""
         try:
-            user_id = get_jwt_identity()
-            current_user = User.query.get_or_404(user_id)
-            
-            if current_user.role != 'admin':
-                return jsonify({'error': 'Acesso negado'}), 403
-            
             # Estatísticas gerais
             total_exams = Exam.query.count()
             total_students = User.query.filter_by(role='student').count()
@@ -4340,11 +5074,11 @@ def register_routes(app):
                 ExamEnrollment.created_at >= thirty_days_ago
             ).group_by(db.func.date(ExamEnrollment.created_at)).all()
             
-            # Eventos de monitoramento
+            # Eventos de monitoramento (lidos da consolidação noturna, não da tabela bruta)
             monitoring_events = db.session.query(
-                MonitoringEvent.event_type,
-                db.func.count(MonitoringEvent.id).label('count')
-            ).group_by(MonitoringEvent.event_type).all()
+                MonitoringEventRollup.event_type,
+                db.func.sum(MonitoringEventRollup.event_count).label('count')
+            ).group_by(MonitoringEventRollup.event_type).all()
             
             # Avaliações da plataforma (removendo responsividade)
             platform_evaluations = PlatformEvaluation.query.all()
@@ -4433,7 +5167,7 @@ def register_routes(app):
                 'question_types': [{'type': qt.question_type, 'count': qt.count} for qt in question_types],
                 'correction_stats': correction_stats,
                 'daily_usage': [{'date': str(du.date), 'enrollments': du.enrollments} for du in daily_usage],
-                'monitoring_events': [{'type': me.event_type, 'count': me.count} for me in monitoring_events],
+                'monitoring_events': [{'type': me.event_type, 'count': int(me.count or 0)} for me in monitoring_events],
                 'platform_evaluations': evaluation_averages,
                 'user_difficulty_stats': difficulty_stats if platform_evaluations else {},
                 'problem_stats': problem_stats if platform_evaluations else {},
@@ -0,0 +1,142 @@
+"""
+Fixtures dos testes: aplicação com a configuração 'testing' (SQLite em memória),
+usuários com tokens de acesso e contagem dos comandos SQL enviados ao banco.
+
+Execute na raiz do projeto: python -m pytest
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from database import db
+from decorators import principal_claims
+from flask_jwt_extended import create_access_token
+from models import (Alternative, Answer, Class, ClassEnrollment, Exam,
+                    ExamEnrollment, ExamQuestion, Question, User)
+from sqlalchemy import event
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Criar um usuário; retorna (usuário, cabeçalhos com o access token)"""
+    created = []
+
+    def make(role='student', name=None):
+        index = len(created) + 1
+        user = User(email=f'{role}{index}@teste.com', password_hash='-',
+                    name=name or f'{role.capitalize()} {index}', role=role)
+        db.session.add(user)
+        db.session.commit()
+        created.append(user)
+        token = create_access_token(identity=user.id, additional_claims=principal_claims(user))
+        return user, {'Authorization': f'Bearer {token}'}
+    return make
+
+
+@pytest.fixture
+def make_class(make_user):
+    """Criar uma turma com `students` alunos aprovados; retorna (turma, professor, alunos)"""
+    def make(students=0, professor=None):
+        professor = professor or make_user('professor')
+        class_obj = Class(name='Turma de testes', instructor_id=professor[0].id)
+        db.session.add(class_obj)
+        db.session.commit()
+        members = [make_user('student') for _ in range(students)]
+        db.session.add_all(
+            ClassEnrollment(class_id=class_obj.id, student_id=user.id, status='approved')
+            for user, _ in members
+        )
+        db.session.commit()
+        return class_obj, professor, members
+    return make
+
+
+@pytest.fixture
+def make_exam():
+    """Criar uma prova com `questions` questões de escolha única (2 alternativas) e 1 dissertativa"""
+    def make(class_obj, professor, questions=3, status='published'):
+        now = datetime.utcnow()
+        exam = Exam(title=f'Prova {now:%H%M%S%f}', duration_minutes=60, start_time=now - timedelta(hours=1),
+                    end_time=now + timedelta(hours=2), created_by=professor.id, class_id=class_obj.id,
+                    status=status)
+        db.session.add(exam)
+        db.session.flush()
+        for number in range(1, questions + 2):
+            question = Question(created_by=professor.id, question_text=f'Questão {number}',
+                                question_type='essay' if number > questions else 'single_choice', points=1)
+            db.session.add(question)
+            db.session.flush()
+            if question.question_type != 'essay':
+                db.session.add_all([
+                    Alternative(question_id=question.id, alternative_text='Certa', is_correct=True, order_number=1),
+                    Alternative(question_id=question.id, alternative_text='Errada', is_correct=False, order_number=2),
+                ])
+            db.session.add(ExamQuestion(exam_id=exam.id, question_id=question.id, points=2, order_number=number))
+        db.session.commit()
+        return exam
+    return make
+
+
+@pytest.fixture
+def make_enrollment():
+    """Matrícula finalizada do aluno na prova, com uma resposta por questão"""
+    def make(exam, student):
+        now = datetime.utcnow()
+        enrollment = ExamEnrollment(exam_id=exam.id, student_id=student.id, status='completed',
+                                    start_time=now - timedelta(minutes=30), end_time=now, completed_at=now,
+                                    total_points=1, max_points=2, percentage=50)
+        db.session.add(enrollment)
+        db.session.flush()
+        for exam_question in ExamQuestion.query.filter_by(exam_id=exam.id):
+            question = db.session.get(Question, exam_question.question_id)
+            if question.question_type == 'essay':
+                db.session.add(Answer(enrollment_id=enrollment.id, question_id=question.id,
+                                      answer_text='Resposta', correction_method='pending'))
+            else:
+                chosen = question.alternatives[0]
+                db.session.add(Answer(enrollment_id=enrollment.id, question_id=question.id,
+                                      selected_alternatives=[chosen.id], points_earned=2,
+                                      correction_method='auto'))
+        db.session.commit()
+        return enrollment
+    return make
+
+
+@pytest.fixture
+def count_queries(app):
+    """Contexto que registra os comandos SQL executados: `with count_queries() as statements:`"""
+    @contextmanager
+    def counting():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return counting
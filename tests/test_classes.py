@@ -0,0 +1,16 @@
+def test_admin_class_listing_pagination_shape(client, make_user, make_class):
+    _, admin_headers = make_user('admin')
+    for _ in range(3):
+        make_class(students=2)
+
+    response = client.get('/api/classes?page=1&per_page=2', headers=admin_headers)
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert set(body) == {'classes', 'pagination'}
+    assert len(body['classes']) == 2
+    assert all(class_data['student_count'] == 2 for class_data in body['classes'])
+    assert body['pagination'] == {'total': 3, 'pages': 2, 'current_page': 1, 'per_page': 2,
+                                  'has_prev': False, 'has_next': True}
+
+    # Sem ?page a listagem continua sendo a lista simples
+    assert len(client.get('/api/classes', headers=admin_headers).get_json()) == 3
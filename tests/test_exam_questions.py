@@ -0,0 +1,49 @@
+import pytest
+
+from batch_loading import load_related
+from database import db
+from models import Alternative, ExamQuestion, Question
+from routes import serialize_exam_questions
+
+
+def serialized_statements(count_queries, exam):
+    # Sessão limpa: nenhuma questão ou alternativa carregada antes da medição
+    exam_id = exam.id
+    db.session.expire_all()
+    with count_queries() as statements:
+        questions = serialize_exam_questions(exam_id)
+    return questions, statements
+
+
+def test_serialize_exam_questions_query_count_does_not_grow_with_questions(
+        make_class, make_exam, count_queries):
+    class_obj, (professor, _), _ = make_class()
+
+    questions, few = serialized_statements(count_queries, make_exam(class_obj, professor, questions=2))
+    assert len(questions) == 3
+    questions, many = serialized_statements(count_queries, make_exam(class_obj, professor, questions=30))
+    assert [question['order_number'] for question in questions] == list(range(1, 32))
+    assert all(question['points'] == 2.0 for question in questions)
+    assert all([alt['alternative_text'] for alt in question['alternatives']] == ['Certa', 'Errada']
+               for question in questions if question['question_type'] != 'essay')
+
+    assert len(many) == len(few) == 2
+
+
+def test_load_related_runs_one_query_per_chunk(make_class, make_exam, count_queries):
+    class_obj, (professor, _), _ = make_class()
+    exam = make_exam(class_obj, professor, questions=5)
+    db.session.expire_all()
+    questions = Question.query.join(ExamQuestion).filter(ExamQuestion.exam_id == exam.id).all()
+
+    with count_queries() as statements:
+        load_related(questions, Question.alternatives, chunk_size=2)
+        # Já carregado: nenhuma consulta nova, nem no acesso ao relacionamento
+        load_related(questions, Question.alternatives)
+        sizes = [len(question.alternatives) for question in questions]
+    assert len(statements) == 3
+    assert sorted(sizes) == [0, 2, 2, 2, 2, 2]
+
+    # Muitos-para-um não é suportado
+    with pytest.raises(ValueError):
+        load_related(db.session.query(Alternative).all(), Alternative.question)
@@ -0,0 +1,7 @@
+def test_professor_can_update_expired_exams(client, make_user):
+    _, professor_headers = make_user('professor')
+    _, student_headers = make_user('student')
+
+    response = client.post('/api/admin/update-expired-exams', headers=professor_headers)
+    assert response.status_code == 200, response.get_json()
+    assert client.post('/api/admin/update-expired-exams', headers=student_headers).status_code == 403
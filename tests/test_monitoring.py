@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+
+from database import db
+from models import MonitoringEvent, MonitoringEventRollup
+from monitoring import (MonitoringEventThrottle, event_weight, purge_monitoring_events,
+                        rollup_monitoring_events)
+
+
+def add_event(enrollment, created_at, activity_type='tab_switch', event_id=None, **extra):
+    db.session.add(MonitoringEvent(id=event_id, enrollment_id=enrollment.id, event_type='suspicious_activity',
+                                   event_data=dict(extra, activity_type=activity_type), created_at=created_at))
+    db.session.commit()
+
+
+def rollup_counts(enrollment):
+    return {rollup.activity_type: rollup.event_count
+            for rollup in MonitoringEventRollup.query.filter_by(enrollment_id=enrollment.id)}
+
+
+def finished_enrollment(make_class, make_exam, make_enrollment, days_ago):
+    class_obj, (professor, _), [(student, _)] = make_class(students=1)
+    exam = make_exam(class_obj, professor, questions=1, status='finished')
+    exam.end_time = datetime.utcnow() - timedelta(days=days_ago)
+    db.session.commit()
+    return make_enrollment(exam, student)
+
+
+def test_rollup_counts_late_commits_and_backdated_events_once(make_class, make_exam, make_enrollment):
+    enrollment = finished_enrollment(make_class, make_exam, make_enrollment, days_ago=1)
+    now = datetime.utcnow()
+    add_event(enrollment, now, event_id=10)
+    add_event(enrollment, now, event_id=20, activity_type='copy_paste')
+    assert rollup_monitoring_events(chunk_size=1) == 2
+
+    # Id alocado antes da consolidação, gravado depois, com created_at antigo (repetições agrupadas)
+    add_event(enrollment, now - timedelta(hours=2), event_id=5, count=4, collapsed=True)
+    # 'count' sem a marca do servidor vale uma ocorrência
+    add_event(enrollment, now, event_id=30, count=50)
+    assert rollup_monitoring_events() == 5
+    assert rollup_monitoring_events() == 0
+
+    assert rollup_counts(enrollment) == {'tab_switch': 6, 'copy_paste': 1}
+    rollup = MonitoringEventRollup.query.filter_by(enrollment_id=enrollment.id, activity_type='tab_switch').one()
+    assert rollup.first_event_at == now - timedelta(hours=2)
+    assert MonitoringEvent.query.filter(MonitoringEvent.rolled_up_at.is_(None)).count() == 0
+
+
+def test_purge_removes_only_consolidated_events_of_old_finished_exams(make_class, make_exam, make_enrollment):
+    old = finished_enrollment(make_class, make_exam, make_enrollment, days_ago=120)
+    recent = finished_enrollment(make_class, make_exam, make_enrollment, days_ago=10)
+    for enrollment in (old, recent):
+        add_event(enrollment, datetime.utcnow() - timedelta(days=121))
+    rollup_monitoring_events()
+    # Gravado depois da consolidação: fica até a próxima
+    add_event(old, datetime.utcnow() - timedelta(days=121))
+
+    assert purge_monitoring_events(retention_days=90, chunk_size=1) == (1, [])
+    remaining = MonitoringEvent.query.order_by(MonitoringEvent.id).all()
+    assert [(event.enrollment_id, event.rolled_up_at is None) for event in remaining] == [
+        (recent.id, False), (old.id, True)
+    ]
+
+    rollup_monitoring_events()
+    assert purge_monitoring_events(retention_days=90) == (1, [])
+    assert rollup_counts(old) == {'tab_switch': 2}
+
+
+def test_throttle_collapses_repeats_into_one_counted_event():
+    throttle = MonitoringEventThrottle({'mouse_inactive': 60}, sweep_interval=5)
+    data = {'activity_type': 'mouse_inactive'}
+
+    assert [throttle.admit(1, 'suspicious_activity', data, now=1000 + offset)
+            for offset in (0, 10, 20, 30)] == [(True, []), (False, []), (False, []), (False, [])]
+    # Tipos sem janela passam direto
+    assert throttle.admit(1, 'suspicious_activity', {'activity_type': 'tab_switch'}, now=1031) == (True, [])
+
+    persist, pending = throttle.admit(1, 'suspicious_activity', data, now=1061)
+    assert persist
+    [collapsed] = pending
+    assert collapsed['event_data']['count'] == 3 and collapsed['event_data']['collapsed'] is True
+    assert collapsed['created_at'] == datetime.utcfromtimestamp(1030)
+    assert event_weight(collapsed['event_data']) == 3
+
+
+def test_throttle_closes_idle_windows_without_new_events(app):
+    throttle = MonitoringEventThrottle({'text_selection': 30})
+    throttle.init_app(app)
+    data = {'activity_type': 'text_selection'}
+    for offset in (0, 1, 2):
+        throttle.admit(7, 'suspicious_activity', data, now=2000 + offset)
+    throttle.admit(8, 'suspicious_activity', data, now=2010)
+    throttle.admit(8, 'suspicious_activity', data, now=2011)
+
+    # Varredura periódica: só a janela vencida é encerrada
+    assert [event['enrollment_id'] for event in throttle.flush_expired(now=2035)] == [7]
+    assert throttle.flush_expired(now=2036) == []
+
+    # Encerramento do processo grava as janelas ainda abertas
+    throttle.shutdown()
+    [event] = MonitoringEvent.query.all()
+    assert (event.enrollment_id, event.event_data['count']) == (8, 1)
+
+
+def test_client_count_does_not_weigh_and_finish_writes_repeats(
+        client, make_class, make_exam, make_enrollment):
+    class_obj, (professor, _), [(_, headers)] = make_class(students=1)
+    exam = make_exam(class_obj, professor, questions=1)
+    enrollment = client.post(f'/api/exams/{exam.id}/start', headers=headers).get_json()
+
+    def post(activity_type, **extra):
+        return client.post('/api/monitoring/event', headers=headers, json={
+            'enrollment_id': enrollment['id'], 'event_type': 'suspicious_activity',
+            'event_data': dict(extra, activity_type=activity_type)
+        })
+
+    response = post('copy_paste', count=500, collapsed=True)
+    assert response.status_code == 201
+    assert 'count' not in response.get_json()['event_data']
+    assert [post('mouse_inactive').status_code for _ in range(3)] == [201, 202, 202]
+
+    assert client.post(f'/api/enrollments/{enrollment["id"]}/finish', headers=headers).status_code == 200
+    rollup_monitoring_events()
+    counts = {rollup.activity_type: rollup.event_count
+              for rollup in MonitoringEventRollup.query.filter_by(enrollment_id=enrollment['id'])}
+    assert counts == {'copy_paste': 1, 'mouse_inactive': 3}
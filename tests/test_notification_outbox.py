@@ -0,0 +1,44 @@
+import routes
+from database import db
+from models import Notification, NotificationOutbox
+from notification_outbox import MAX_ATTEMPTS, drain_outbox, enqueue_notification
+
+
+def enqueue_approvals(class_obj, members, events):
+    for _ in range(events):
+        enqueue_notification(
+            'enrollments_approved',
+            class_id=class_obj.id,
+            enrollments=[[0, user.id] for user, _ in members]
+        )
+    db.session.commit()
+
+
+def test_drain_returns_processed_events(make_class):
+    class_obj, _, members = make_class(students=3)
+    enqueue_approvals(class_obj, members, events=2)
+
+    assert drain_outbox(batch_size=1) == 2
+    assert NotificationOutbox.query.filter(NotificationOutbox.processed_at.is_(None)).count() == 0
+    assert Notification.query.count() == 6
+
+
+def test_failed_insert_records_attempt_and_stops(make_class, monkeypatch):
+    class_obj, _, members = make_class(students=2)
+    enqueue_approvals(class_obj, members, events=3)
+
+    def failing_insert(items):
+        raise RuntimeError('banco indisponível')
+    monkeypatch.setattr(routes, 'add_notifications_bulk', failing_insert)
+
+    # Sem o registro da tentativa o lote voltaria para a fila e drain_outbox não terminaria
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        assert drain_outbox(batch_size=3) == 0
+        entries = NotificationOutbox.query.all()
+        assert all(entry.processed_at is None for entry in entries)
+        assert all(entry.attempts == attempt for entry in entries)
+        assert all('banco indisponível' in entry.last_error for entry in entries)
+
+    assert drain_outbox(batch_size=3) == 0
+    assert NotificationOutbox.query.filter(NotificationOutbox.attempts > MAX_ATTEMPTS).count() == 0
+    assert Notification.query.count() == 0
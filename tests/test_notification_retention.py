@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from database import db
+from models import Notification, User
+from notification_counters import recount_unread
+from notification_retention import collapse_duplicate_notifications
+
+
+def add_notification(user, created_at, notification_type='suspicious_activity', message='Aluno A na prova P1'):
+    db.session.add(Notification(user_id=user.id, type=notification_type, title='Atividade Suspeita Detectada',
+                                message=message, created_at=created_at))
+
+
+def test_collapses_bursts_and_keeps_spaced_repeats(make_user):
+    professor, _ = make_user('professor')
+    other, _ = make_user('professor')
+    start = datetime.utcnow() - timedelta(days=3)
+
+    # Rajada: 4 cópias em poucos minutos (só a última fica)
+    for minutes in (0, 1, 2, 3):
+        add_notification(professor, start + timedelta(minutes=minutes))
+    # Mesmo alerta em outros dias: repetições legítimas
+    add_notification(professor, start + timedelta(days=1))
+    add_notification(professor, start + timedelta(days=2))
+    # Mensagem diferente e outro usuário não são duplicatas
+    add_notification(professor, start, message='Aluno B na prova P1')
+    add_notification(other, start + timedelta(minutes=1))
+    db.session.commit()
+    recount_unread(professor.id)
+    db.session.commit()
+
+    assert collapse_duplicate_notifications(window_minutes=60, chunk_size=2) == 3
+
+    remaining = Notification.query.filter_by(user_id=professor.id).order_by(Notification.created_at).all()
+    assert [(n.message, n.created_at) for n in remaining] == [
+        ('Aluno B na prova P1', start),
+        ('Aluno A na prova P1', start + timedelta(minutes=3)),
+        ('Aluno A na prova P1', start + timedelta(days=1)),
+        ('Aluno A na prova P1', start + timedelta(days=2)),
+    ]
+    assert Notification.query.filter_by(user_id=other.id).count() == 1
+    assert db.session.get(User, professor.id).unread_notifications == 4
+    assert collapse_duplicate_notifications(window_minutes=60, chunk_size=2) == 0
@@ -0,0 +1,69 @@
+import json
+import time
+
+from database import db
+from models import Notification
+from notification_counters import adjust_unread
+
+
+def add_notification(user):
+    notification = Notification(user_id=user.id, type='system', title='Aviso', message='Mensagem')
+    db.session.add(notification)
+    adjust_unread([user.id])
+    db.session.commit()
+    return notification.id
+
+
+def first_payload(response):
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+    event = next(chunks).decode()
+    response.close()
+    return json.loads(event.split('data: ', 1)[1])
+
+
+def test_stream_requires_a_stream_ticket(client, make_user):
+    user, headers = make_user('student')
+    seen_id = add_notification(user)
+    notification_id = add_notification(user)
+    access_token = headers['Authorization'].split()[1]
+
+    # Access token na URL não é aceito (acabaria nos logs de acesso)
+    assert client.get(f'/api/notifications/stream?jwt={access_token}').status_code == 401
+    assert client.get(f'/api/notifications/stream?ticket={access_token}').status_code == 401
+
+    ticket = client.post('/api/notifications/stream-ticket', headers=headers).get_json()['ticket']
+    # O ticket só serve para o stream
+    assert client.get('/api/notifications/poll?timeout=0',
+                      headers={'Authorization': f'Bearer {ticket}'}).status_code == 401
+
+    response = client.get(f'/api/notifications/stream?ticket={ticket}&since_id={seen_id}', buffered=False)
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    payload = first_payload(response)
+    assert payload['unread_count'] == 2
+    assert [n['id'] for n in payload['notifications']] == [notification_id]
+
+
+def test_expired_stream_ticket_is_rejected(app, client, make_user):
+    _, headers = make_user('student')
+    ticket = client.post('/api/notifications/stream-ticket', headers=headers).get_json()['ticket']
+    app.config['NOTIFICATION_STREAM_TICKET_SECONDS'] = 0
+    time.sleep(1.1)
+    assert client.get(f'/api/notifications/stream?ticket={ticket}').status_code == 401
+
+
+def test_poll_and_unread_count(client, make_user):
+    user, headers = make_user('student')
+    access_token = headers['Authorization'].split()[1]
+    first_id = add_notification(user)
+    second_id = add_notification(user)
+
+    assert client.get(f'/api/notifications/poll?timeout=0&jwt={access_token}').status_code == 401
+    body = client.get(f'/api/notifications/poll?timeout=0&since_id={first_id}', headers=headers).get_json()
+    assert ([n['id'] for n in body['notifications']], body['last_id'], body['unread_count']) == \
+        ([second_id], second_id, 2)
+    # Sem novidades: responde ao fim do timeout com o mesmo since_id
+    body = client.get(f'/api/notifications/poll?timeout=0&since_id={second_id}', headers=headers).get_json()
+    assert (body['notifications'], body['last_id']) == ([], second_id)
+
+    assert client.get('/api/notifications/unread-count', headers=headers).get_json() == {'unread_count': 2}
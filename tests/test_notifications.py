@@ -0,0 +1,113 @@
+from database import db
+from models import Notification, User
+from notification_counters import recount_unread
+from routes import create_notifications_bulk
+from sqlalchemy import event
+
+
+def add_notifications(user, total):
+    db.session.add_all(
+        Notification(user_id=user.id, type='system', title=f'Aviso {index}', message='Mensagem')
+        for index in range(total)
+    )
+    recount_unread(user.id)
+    db.session.commit()
+    return [notification.id for notification in Notification.query.filter_by(user_id=user.id)]
+
+
+def statements_for(count_queries, make_user, total, request):
+    """Comandos SQL de uma requisição feita por um aluno com `total` notificações não lidas"""
+    user, headers = make_user('student')
+    ids = add_notifications(user, total)
+    with count_queries() as statements:
+        response = request(headers, ids)
+    assert response.status_code == 200, response.get_json()
+    return user, response.get_json(), statements
+
+
+def test_mark_all_read_runs_constant_statements(client, make_user, count_queries):
+    def request(headers, ids):
+        return client.patch('/api/notifications/mark-all-read', headers=headers)
+
+    user, body, few = statements_for(count_queries, make_user, 3, request)
+    assert body['updated'] == 3
+    user, body, many = statements_for(count_queries, make_user, 60, request)
+    assert body['updated'] == 60
+    assert len(many) == len(few) <= 3
+    assert Notification.query.filter_by(user_id=user.id, is_read=False).count() == 0
+    assert db.session.get(type(user), user.id).unread_notifications == 0
+
+
+def test_mark_read_runs_constant_statements(client, make_user, count_queries):
+    def request(headers, ids):
+        return client.patch('/api/notifications/mark-read', headers=headers, json={'ids': ids[:-1]})
+
+    _, body, few = statements_for(count_queries, make_user, 3, request)
+    assert body['updated'] == 2
+    user, body, many = statements_for(count_queries, make_user, 60, request)
+    assert body['updated'] == 59
+    assert len(many) == len(few) <= 3
+    assert db.session.get(type(user), user.id).unread_notifications == 1
+
+
+def test_delete_all_runs_constant_statements(client, make_user, count_queries):
+    def request(headers, ids):
+        return client.delete('/api/notifications/delete-all', headers=headers)
+
+    _, body, few = statements_for(count_queries, make_user, 3, request)
+    assert body['deleted'] == 3
+    user, body, many = statements_for(count_queries, make_user, 60, request)
+    assert body['deleted'] == 60
+    assert len(many) == len(few) <= 3
+    assert Notification.query.filter_by(user_id=user.id).count() == 0
+
+
+def test_bulk_fan_out_statements_do_not_grow_with_recipients(make_user, count_queries):
+    def fan_out(recipients):
+        users = [make_user('student')[0] for _ in range(recipients)]
+        items = [{'user_id': user.id, 'type': 'system', 'title': 'Aviso', 'message': 'Mensagem'}
+                 for user in users]
+        with count_queries() as statements:
+            assert create_notifications_bulk(items) == recipients
+        assert all(user.unread_notifications == 1 for user in users)
+        return statements
+
+    few = fan_out(2)
+    many = fan_out(40)
+    # executemany conta como um comando por lote (INSERT e ajuste dos contadores)
+    assert len(many) == len(few)
+
+
+def test_bulk_read_and_delete_keep_notifications_created_concurrently(client, make_user):
+    user, headers = make_user('student')
+    add_notifications(user, 3)
+    db.session.add(Notification(user_id=user.id, type='system', title='Lida', message='Mensagem', is_read=True))
+    db.session.commit()
+
+    def concurrent_insert_after(matches):
+        """Outra transação grava uma notificação (e o +1) logo depois do comando em massa"""
+        done = []
+
+        def insert(conn, cursor, statement, parameters, context, executemany):
+            if not done and matches(statement):
+                done.append(statement)
+                conn.execute(Notification.__table__.insert().values(
+                    user_id=user.id, type='system', title='Nova', message='Mensagem'))
+                conn.execute(User.__table__.update().where(User.id == user.id).values(
+                    unread_notifications=User.unread_notifications + 1))
+        event.listen(db.engine, 'after_cursor_execute', insert)
+        return lambda: event.remove(db.engine, 'after_cursor_execute', insert)
+
+    stop = concurrent_insert_after(lambda statement: statement.startswith('UPDATE notifications'))
+    assert client.patch('/api/notifications/mark-all-read', headers=headers).get_json()['updated'] == 3
+    stop()
+    db.session.expire_all()
+    assert db.session.get(User, user.id).unread_notifications == 1
+
+    # Entre a exclusão das não lidas e a das lidas: a nova não é excluída e continua contada
+    stop = concurrent_insert_after(lambda statement: statement.startswith('DELETE FROM notifications'))
+    assert client.delete('/api/notifications/delete-all', headers=headers).get_json()['deleted'] == 1 + 4
+    stop()
+    db.session.expire_all()
+    assert db.session.get(User, user.id).unread_notifications == 1
+    assert Notification.query.filter_by(user_id=user.id, is_read=False).count() == 1
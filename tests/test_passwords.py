@@ -0,0 +1,10 @@
+import pytest
+from passwords import hash_prefix
+from werkzeug.security import generate_password_hash
+
+
+@pytest.mark.parametrize('method', [
+    'scrypt', 'scrypt:16384:8:1', 'pbkdf2', 'pbkdf2:sha256', 'pbkdf2:sha256:1000', 'pbkdf2:sha512:2000'
+])
+def test_hash_prefix_matches_werkzeug(method):
+    assert hash_prefix(method) == generate_password_hash('x', method).split('$', 1)[0]
@@ -0,0 +1,70 @@
+"""
+Fila de correções pendentes: needs_review acompanha a correção e o cursor é opcional.
+"""
+
+from database import db
+from models import Answer, Question
+
+
+def _pending_essays():
+    return Answer.query.join(Question, Answer.question_id == Question.id)\
+        .filter(Question.question_type == 'essay').all()
+
+
+def test_manual_correction_clears_needs_review(client, make_class, make_exam, make_enrollment):
+    class_obj, (professor, headers), members = make_class(students=1)
+    exam = make_exam(class_obj, professor, questions=1)
+    make_enrollment(exam, members[0][0])
+    answer = _pending_essays()[0]
+    assert answer.needs_review
+
+    response = client.get('/api/teacher/results/pending-corrections', headers=headers)
+    assert [item['answer_id'] for item in response.get_json()['pending_corrections']] == [answer.id]
+
+    response = client.post('/api/teacher/results/manual-correction', headers=headers,
+                           json={'answer_id': answer.id, 'points_earned': 1.5})
+    assert response.status_code == 200
+
+    db.session.expire_all()
+    assert db.session.get(Answer, answer.id).needs_review is False
+    body = client.get('/api/teacher/results/pending-corrections', headers=headers).get_json()
+    assert body == {'pending_corrections': [], 'total_count': 0}
+
+
+def test_without_cursor_returns_whole_queue(client, make_class, make_exam, make_enrollment):
+    class_obj, (professor, headers), members = make_class(students=3)
+    exam = make_exam(class_obj, professor, questions=1)
+    for student, _ in members:
+        make_enrollment(exam, student)
+
+    body = client.get('/api/teacher/results/pending-corrections', headers=headers).get_json()
+    assert 'next_cursor' not in body
+    assert body['total_count'] == len(body['pending_corrections']) == 3
+
+
+def test_cursor_walk_returns_each_answer_once(client, make_class, make_exam, make_enrollment):
+    class_obj, (professor, headers), members = make_class(students=5)
+    exam = make_exam(class_obj, professor, questions=1)
+    for student, _ in members:
+        make_enrollment(exam, student)
+    expected = sorted(answer.id for answer in _pending_essays())
+
+    seen = []
+    body = client.get('/api/teacher/results/pending-corrections?limit=2', headers=headers).get_json()
+    assert body['total_count'] == 5
+    while True:
+        seen.extend(item['answer_id'] for item in body['pending_corrections'])
+        if not body['next_cursor']:
+            break
+        body = client.get('/api/teacher/results/pending-corrections', headers=headers,
+                          query_string={'limit': 2, 'after': body['next_cursor']}).get_json()
+        assert 'total_count' not in body
+
+    assert len(seen) == len(set(seen))
+    assert sorted(seen) == expected
+
+
+def test_invalid_cursor_is_rejected(client, make_class):
+    class_obj, (professor, headers), _ = make_class()
+    response = client.get('/api/teacher/results/pending-corrections?after=lixo', headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,87 @@
+import pytest
+
+from database import db
+from models import MonitoringRateWindow, NotificationOutbox
+from monitoring import DatabaseRateStore, MemoryRateStore, SuspiciousRateDetector
+
+RULES = {'excessive_tab_switching': {'alert': 'tab_switching_rate', 'threshold': 3, 'window_seconds': 60}}
+TAB_SWITCH = {'activity_type': 'excessive_tab_switching'}
+
+
+@pytest.fixture(params=['memory', 'database'])
+def detector(request, app):
+    return SuspiciousRateDetector(RULES, MemoryRateStore() if request.param == 'memory' else DatabaseRateStore())
+
+
+def alerts(detector, times, enrollment_id=1):
+    return [detector.observe(enrollment_id, TAB_SWITCH, now=now) is not None for now in times]
+
+
+def test_alerts_only_when_threshold_is_crossed(detector):
+    assert alerts(detector, [0, 10, 20, 25, 30]) == [False, False, True, False, False]
+    assert detector.observe(1, {'activity_type': 'mouse_inactive'}, now=31) is None
+    # Outra matrícula tem o próprio buffer
+    assert alerts(detector, [30], enrollment_id=2) == [False]
+
+
+def test_rearms_after_rate_drops_below_threshold(detector):
+    assert alerts(detector, [0, 10, 20]) == [False, False, True]
+    # Ocorrências espaçadas: a taxa volta ao normal e a regra é rearmada
+    assert alerts(detector, [200, 205]) == [False, False]
+    assert alerts(detector, [210, 215]) == [True, False]
+
+    detector.forget(1)
+    assert alerts(detector, [216, 217, 218]) == [False, False, True]
+
+
+def test_memory_store_is_bounded_and_measured():
+    store = MemoryRateStore(max_enrollments=2)
+    detector = SuspiciousRateDetector(RULES, store)
+    for enrollment_id in (1, 2, 3):
+        for now in range(5):
+            detector.observe(enrollment_id, TAB_SWITCH, now=now)
+
+    stats = detector.stats()
+    assert (stats['active_enrollments'], stats['evicted_enrollments']) == (2, 1)
+    # Buffer circular: só os últimos `threshold` instantes de cada matrícula
+    assert stats['buffered_timestamps'] == 2 * 3
+    assert stats['approx_bytes'] > 0
+
+    assert detector.purge_idle(now=64) == 0
+    assert detector.purge_idle(now=65) == 2
+    assert detector.stats()['active_enrollments'] == 0
+
+
+def test_database_store_keeps_compact_rows_and_purges_idle(app):
+    detector = SuspiciousRateDetector(RULES, DatabaseRateStore())
+    for now in range(5):
+        detector.observe(1, TAB_SWITCH, now=now)
+    db.session.commit()
+
+    [row] = MonitoringRateWindow.query.all()
+    assert (row.timestamps, row.alerting) == ([2, 3, 4], True)
+    assert detector.stats()['tracked_windows'] == 1
+    assert detector.purge_idle() == 0
+    assert detector.purge_idle(now=row.updated_at.timestamp() + 10 ** 6) == 1
+
+
+def test_route_notifies_once_per_crossing(client, make_user, make_class, make_exam):
+    class_obj, (professor, _), [(_, headers)] = make_class(students=1)
+    _, admin_headers = make_user('admin')
+    exam = make_exam(class_obj, professor, questions=1)
+    enrollment = client.post(f'/api/exams/{exam.id}/start', headers=headers).get_json()
+
+    for _ in range(7):
+        response = client.post('/api/monitoring/event', headers=headers, json={
+            'enrollment_id': enrollment['id'], 'event_type': 'suspicious_activity',
+            'event_data': {'activity_type': 'excessive_tab_switching', 'details': {'switch_count': 20}}
+        })
+        assert response.status_code == 201
+
+    # Nenhum aviso por evento: só o alerta de taxa, uma vez
+    assert [entry.payload['activity_type'] for entry in NotificationOutbox.query.all()] == ['tab_switching_rate']
+    stats = client.get('/api/admin/monitoring/detector-stats', headers=admin_headers).get_json()
+    assert (stats['backend'], stats['active_enrollments']) == ('database', 1)
+
+    client.post(f'/api/enrollments/{enrollment["id"]}/finish', headers=headers)
+    assert client.get('/api/admin/monitoring/detector-stats', headers=admin_headers).get_json()['active_enrollments'] == 0
@@ -0,0 +1,76 @@
+import response_cache
+from response_cache import MemoryCacheBackend, ResultVersionBatcher
+
+
+def versions(*keys):
+    return dict(zip(keys, response_cache._backend.get_versions(keys)))
+
+
+def bumped(before):
+    after = versions(*before)
+    return {key for key in before if after[key] != before[key]}
+
+
+def test_enrollment_writes_bump_student_and_result_keys(client, make_user, make_class, make_exam):
+    class_obj, (instructor, _), [(student, student_headers)] = make_class(students=1)
+    creator, _ = make_user('professor')
+    exam = make_exam(class_obj, creator)
+    keys = [f'user:{student.id}', f'user:{instructor.id}', f'user:{creator.id}',
+            f'results:{instructor.id}', f'results:{creator.id}']
+
+    # Iniciar a prova não altera resultados: nenhuma linha dos professores é incrementada
+    before = versions(*keys)
+    response = client.post(f'/api/exams/{exam.id}/start', headers=student_headers)
+    assert response.status_code == 200, response.get_json()
+    assert bumped(before) == {f'user:{student.id}'}
+
+    before = versions(*keys)
+    response = client.post(f'/api/enrollments/{response.get_json()["id"]}/finish', headers=student_headers)
+    assert response.status_code == 200, response.get_json()
+    assert bumped(before) == {f'user:{student.id}', f'results:{instructor.id}', f'results:{creator.id}'}
+
+
+def test_student_exams_not_served_stale_after_exam_status_change(
+        client, make_class, make_exam, count_queries):
+    class_obj, (professor, professor_headers), [(_, headers)] = make_class(students=1)
+    exam = make_exam(class_obj, professor)
+
+    assert [item['status'] for item in client.get('/api/student/exams', headers=headers).get_json()] == ['published']
+    with count_queries() as statements:
+        client.get('/api/student/exams', headers=headers)
+    assert statements == []  # Resposta servida do cache
+
+    response = client.put(f'/api/exams/{exam.id}', headers=professor_headers, json={'status': 'finished'})
+    assert response.status_code == 200, response.get_json()
+    assert [item['status'] for item in client.get('/api/student/exams', headers=headers).get_json()] == ['finished']
+
+
+def test_teacher_results_refresh_when_a_student_finishes(client, make_class, make_exam):
+    class_obj, (professor, professor_headers), [(_, headers)] = make_class(students=1)
+    exam = make_exam(class_obj, professor)
+    assert client.get('/api/teacher/results', headers=professor_headers).get_json() == []
+
+    enrollment = client.post(f'/api/exams/{exam.id}/start', headers=headers).get_json()
+    client.post(f'/api/enrollments/{enrollment["id"]}/finish', headers=headers)
+    assert [item['id'] for item in client.get('/api/teacher/results', headers=professor_headers).get_json()] \
+        == [enrollment['id']]
+
+
+def test_result_batcher_bumps_each_key_once_per_window(app, make_user, make_class, make_exam, count_queries):
+    class_obj, (instructor, _), _ = make_class()
+    creator, _ = make_user('professor')
+    exams = [make_exam(class_obj, creator), make_exam(class_obj, instructor)]
+    backend = MemoryCacheBackend()
+    batcher = ResultVersionBatcher(app, backend, window_seconds=60)
+    keys = [f'results:{instructor.id}', f'results:{creator.id}']
+
+    for exam in exams * 3:
+        batcher.add({exam.id})
+    assert backend.get_versions(keys) == [0, 0]
+
+    with count_queries() as statements:
+        batcher.flush()
+    assert len(statements) == 1
+    assert backend.get_versions(keys) == [1, 1]
+    batcher.flush()
+    assert backend.get_versions(keys) == [1, 1]
@@ -0,0 +1,28 @@
+def student_exams_statements(client, count_queries, headers):
+    with count_queries() as statements:
+        response = client.get('/api/student/exams', headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json(), statements
+
+
+def test_student_exams_query_count_does_not_grow_with_exams(
+        client, make_user, make_class, make_exam, make_enrollment, count_queries):
+    class_obj, (professor, _), members = make_class(students=3)
+    (warm_up, warm_up_headers), (first, first_headers), (second, second_headers) = members
+
+    exams = [make_exam(class_obj, professor) for _ in range(2)]
+    make_enrollment(exams[0], first)
+    # Primeira chamada do processo também atualiza provas expiradas
+    client.get('/api/student/exams', headers=warm_up_headers)
+
+    body, few = student_exams_statements(client, count_queries, first_headers)
+    assert [exam['result'] is not None for exam in body] == [True, False]
+
+    exams += [make_exam(class_obj, professor) for _ in range(10)]
+    for exam in exams[1:]:
+        make_enrollment(exam, second)
+    body, many = student_exams_statements(client, count_queries, second_headers)
+    assert len(body) == 12
+    assert all(exam['result']['percentage'] == 50.0 for exam in body[1:])
+
+    assert len(many) == len(few) <= 3
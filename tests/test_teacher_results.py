@@ -0,0 +1,31 @@
+"""
+Resultados do professor: paginação por cursor ordenada por percentual, com percentuais nulos.
+"""
+
+from database import db
+
+
+def test_percentage_cursor_walk_includes_null_percentages(client, make_class, make_exam, make_enrollment):
+    class_obj, (professor, headers), members = make_class(students=5)
+    exam = make_exam(class_obj, professor, questions=1)
+    enrollments = [make_enrollment(exam, student) for student, _ in members]
+    for enrollment, percentage in zip(enrollments, [80, None, 50, None, 80]):
+        enrollment.percentage = percentage
+    db.session.commit()
+    expected = sorted(enrollment.id for enrollment in enrollments)
+
+    for order in ('desc', 'asc'):
+        seen, params = [], {'sort': 'percentage', 'order': order, 'limit': 1}
+        while True:
+            response = client.get('/api/teacher/results', headers=headers, query_string=params)
+            assert response.status_code == 200, response.get_json()
+            body = response.get_json()
+            seen.extend(result['id'] for result in body['results'])
+            if not body['next_cursor']:
+                break
+            params['before'] = body['next_cursor']
+
+        assert sorted(seen) == expected
+        by_id = {enrollment.id: enrollment.percentage for enrollment in enrollments}
+        keys = [by_id[result_id] if by_id[result_id] is not None else -1 for result_id in seen]
+        assert keys == sorted(keys, reverse=order == 'desc')
@@ -0,0 +1,19 @@
+def test_student_exam_details_query_count_does_not_grow_with_questions(
+        client, make_class, make_exam, make_enrollment, count_queries):
+    class_obj, (professor, headers), members = make_class(students=2)
+    (first, _), (second, _) = members
+
+    def details(enrollment):
+        with count_queries() as statements:
+            response = client.get(f'/api/teacher/student-exam/{enrollment.id}', headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json(), statements
+
+    body, few = details(make_enrollment(make_exam(class_obj, professor, questions=2), first))
+    assert len(body['answers']) == 3
+    body, many = details(make_enrollment(make_exam(class_obj, professor, questions=20), second))
+    assert len(body['answers']) == 21
+    assert all(len(answer['alternatives']) == 2 for answer in body['answers']
+               if answer['question_type'] != 'essay')
+
+    assert len(many) == len(few) <= 5
@@ -0,0 +1,16 @@
+from datetime import datetime, timedelta
+
+import token_store
+from token_store import MemoryRefreshTokenStore
+
+
+def test_memory_store_purges_expired_tokens_on_insert(monkeypatch):
+    monkeypatch.setattr(token_store, 'PURGE_INTERVAL_SECONDS', 0)
+    store = MemoryRefreshTokenStore()
+    past = datetime.utcnow() - timedelta(minutes=1)
+    for index in range(100):
+        store.add(f'expirado-{index}', 1, past)
+    store.add('valido', 1, datetime.utcnow() + timedelta(days=7))
+
+    assert list(store._tokens) == ['valido']
+    assert store.consume('valido')
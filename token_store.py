@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Armazenamento de refresh tokens válidos, indexado pelo jti do JWT.
+
+O backend padrão é a tabela refresh_tokens (compartilhada entre processos e servidores,
+sobrevive a reinícios). Na frente dela fica um LRU em memória apenas de jtis já
+revogados/expirados: revogação é definitiva, então esse cache nunca fica incorreto e
+tentativas repetidas com um token antigo não chegam ao banco.
+
+A validação do refresh é um DELETE pela chave primária: só uma requisição consegue
+consumir o mesmo token, mesmo com requisições simultâneas em processos diferentes.
+
+Limpeza de expirados (cron): python token_store.py
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from database import db
+from models import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+# Intervalo mínimo entre limpezas automáticas de tokens expirados (por processo)
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class RevokedTokenCache:
+    """LRU limitado de jtis que com certeza não são mais válidos"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def add(self, jti):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._items[jti] = True
+            self._items.move_to_end(jti)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __contains__(self, jti):
+        with self._lock:
+            if jti in self._items:
+                self._items.move_to_end(jti)
+                return True
+            return False
+
+
+class MemoryRefreshTokenStore:
+    """
+    Backend em memória (processo único: testes e desenvolvimento local).
+    Os expirados são removidos nas inserções (no máximo uma varredura por PURGE_INTERVAL_SECONDS),
+    então o dicionário fica limitado aos tokens emitidos durante a validade do refresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}  # jti -> (user_id, expires_at)
+        self._last_purge = 0.0
+
+    def add(self, jti, user_id, expires_at):
+        with self._lock:
+            self._tokens[jti] = (user_id, expires_at)
+        now = time.monotonic()
+        if now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            self.purge_expired()
+
+    def consume(self, jti):
+        with self._lock:
+            entry = self._tokens.pop(jti, None)
+        return entry is not None and entry[1] > datetime.utcnow()
+
+    def revoke(self, jti):
+        with self._lock:
+            self._tokens.pop(jti, None)
+
+    def purge_expired(self):
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [jti for jti, entry in self._tokens.items() if entry[1] <= now]
+            for jti in expired:
+                del self._tokens[jti]
+        return len(expired)
+
+
+class DatabaseRefreshTokenStore:
+    """Backend na tabela refresh_tokens com LRU de revogados na frente"""
+
+    def __init__(self, revoked_cache_size=10000):
+        self.revoked = RevokedTokenCache(revoked_cache_size)
+        self._last_purge = 0.0
+
+    def add(self, jti, user_id, expires_at):
+        db.session.add(RefreshToken(jti=jti, user_id=user_id, expires_at=expires_at))
+        db.session.commit()
+        self._maybe_purge()
+
+    def consume(self, jti):
+        """Invalidar o token e informar se ele era válido (rotação do refresh)"""
+        if jti in self.revoked:
+            return False
+        deleted = RefreshToken.query.filter(
+            RefreshToken.jti == jti,
+            RefreshToken.expires_at > datetime.utcnow()
+        ).delete(synchronize_session=False)
+        if not deleted:
+            # Expirado (ainda na tabela) ou inexistente
+            RefreshToken.query.filter_by(jti=jti).delete(synchronize_session=False)
+        db.session.commit()
+        self.revoked.add(jti)
+        return bool(deleted)
+
+    def revoke(self, jti):
+        RefreshToken.query.filter_by(jti=jti).delete(synchronize_session=False)
+        db.session.commit()
+        self.revoked.add(jti)
+
+    def purge_expired(self):
+        deleted = RefreshToken.query.filter(
+            RefreshToken.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        try:
+            deleted = self.purge_expired()
+            if deleted:
+                logger.info("Refresh tokens expirados removidos: %s", deleted)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("Erro ao remover refresh tokens expirados: %s", e)
+
+
+_store = None
+
+
+def init_token_store(app):
+    """Criar o backend configurado em REFRESH_TOKEN_STORE ('database' ou 'memory')"""
+    global _store
+    backend = app.config.get('REFRESH_TOKEN_STORE', 'database')
+    if backend == 'database':
+        _store = DatabaseRefreshTokenStore(app.config.get('REFRESH_TOKEN_REVOKED_CACHE_SIZE', 10000))
+    elif backend == 'memory':
+        _store = MemoryRefreshTokenStore()
+    else:
+        raise ValueError(f'REFRESH_TOKEN_STORE inválido: {backend}')
+    return _store
+
+
+def get_token_store():
+    global _store
+    if _store is None:
+        _store = DatabaseRefreshTokenStore()
+    return _store
+
+
+def main():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        deleted = get_token_store().purge_expired()
+        print(f"✅ {deleted} refresh tokens expirados removidos")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
 Script para atualizar o status das provas expiradas no banco de dados
+e enviar o lembrete das provas que começam em breve (execute periodicamente via cron)
 """
 
 import os
@@ -10,19 +11,17 @@ from datetime import datetime
 # Adicionar o diretório atual ao path para importar os módulos
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from config import Config
-from database import db, init_db
-from flask import Flask
+from database import db
 from models import Exam
 
 
 def create_app():
-    """Criar aplicação Flask para o script"""
-    app = Flask(__name__)
-    app.config.from_object(Config)
+    """Criar aplicação Flask para o script (mesma configuração da API)"""
+    from app import create_app as create_api_app
     
-    # Inicializar banco de dados
-    init_db(app)
+    app = create_api_app()
+    # O outbox é despachado pelo próprio script (remind_upcoming_exams)
+    app.config['NOTIFICATION_OUTBOX_DISPATCHER'] = False
     
     return app
 
@@ -58,6 +57,28 @@ def update_expired_exams():
         db.session.rollback()
         return 0
 
+def remind_upcoming_exams(lead_minutes):
+    """Enfileirar lembretes das provas que começam em breve e despachar as notificações"""
+    from notification_outbox import drain_outbox
+    from routes import send_exam_reminders
+
+    try:
+        exams = send_exam_reminders(lead_minutes)
+        if not exams:
+            print("✅ Nenhuma prova começando em breve.")
+            return 0
+        
+        for exam in exams:
+            print(f"   - ID {exam.id}: {exam.title} (começa em {exam.start_time})")
+        drain_outbox()
+        print(f"✅ Lembretes enviados para {len(exams)} provas")
+        
+        return len(exams)
+    except Exception as e:
+        print(f"❌ Erro ao enviar lembretes de provas: {e}")
+        db.session.rollback()
+        return 0
+
 def main():
     """Função principal"""
     print("🔧 Iniciando atualização de provas expiradas...")
@@ -66,6 +87,7 @@ def main():
     
     with app.app_context():
         update_expired_exams()
+        remind_upcoming_exams(app.config.get('EXAM_REMINDER_LEAD_MINUTES', 60))
     
     print("🎉 Processo concluído!")
 